@@ -2,6 +2,9 @@
 from __future__ import absolute_import, print_function
 
 import sys
+import threading
+from collections import OrderedDict
+
 import numpy as np
 import math
 from .. import datamodels
@@ -9,10 +12,160 @@ from ..assign_wcs import nirspec
 from ..datamodels import dqflags
 from . import cube
 from . import coord
+
+# The number of (point cloud member, spaxel) pairs FindROI weights at once
+ROI_BATCH_SIZE = 1000000
+
+# The detector coordinate maps of the most recently used detector configurations,
+# at most _MAPS_CACHE_BYTES of them.  See GetCoordMaps.
+_MAPS_CACHE_BYTES = 512 * 2 ** 20
+_maps_cache = OrderedDict()
+_maps_lock = threading.Lock()
+
+# The reference files the pointing independent part of the wcs depends on
+MIRI_WCS_REFTYPES = ('distortion', 'specwcs', 'regions', 'wavelengthrange', 'v2v3')
+NIRSPEC_WCS_REFTYPES = ('camera', 'collimator', 'disperser', 'fore', 'fpa', 'ifufore',
+                        'ifupost', 'ifuslicer', 'msa', 'ote', 'wavelengthrange')
+#________________________________________________________________________________
+
+def GetCoordMaps(key, make_maps):
+    """
+    Short Summary
+    -------------
+    Get coordinate maps of detector pixels from the cache, or make them.
+
+    The transform from the detector to the telescope (v2,v3) frame only depends on
+    the detector configuration and the wcs reference files, not on the pointing, so
+    the maps are the same for all of the dithers of a band and are reused across
+    exposures and runs. Only the v2,v3 -> world transform is applied per exposure.
+
+    Parameters
+    ----------
+    key: identifies the detector configuration and region, None if it can not
+         be identified (the maps are then not cached)
+    make_maps: called with no arguments to make the maps, returns a tuple of arrays
+
+    Returns
+    -------
+    tuple of read only arrays
+    """
+    if key is None:
+        return make_maps()
+
+    with _maps_lock:
+        maps = _maps_cache.pop(key, None)
+        if maps is not None:
+            # Move it to the end, as the most recently used
+            _maps_cache[key] = maps
+            return maps
+
+    maps = tuple(make_maps())
+    for array in maps:
+        array.flags.writeable = False
+
+    with _maps_lock:
+        _maps_cache[key] = maps
+        nbytes = sum(array.nbytes for entry in _maps_cache.values() for array in entry)
+        while nbytes > _MAPS_CACHE_BYTES and len(_maps_cache) > 1:
+            _, entry = _maps_cache.popitem(last=False)
+            nbytes -= sum(array.nbytes for array in entry)
+
+    return maps
+#________________________________________________________________________________
+
+def WCSRefFileNames(input_model, reftypes):
+    """
+    Short Summary
+    -------------
+    Names of the reference files used to create the wcs of the input model
+
+    Returns
+    -------
+    tuple of the names, None if any of them is not recorded
+    """
+    names = []
+    for reftype in reftypes:
+        name = getattr(input_model.meta.ref_file, reftype).name
+        if name is None or name == 'N/A':
+            return None
+        names.append(name)
+    return tuple(names)
+#________________________________________________________________________________
+
+def MIRICoordMaps(input_model, xstart, xend):
+    """
+    Short Summary
+    -------------
+    Map the detector pixels of a MIRI channel to alpha, beta, lambda and v2, v3,
+    through the cache of GetCoordMaps
+
+    Parameters
+    ----------
+    input_model: slope image
+    xstart, xend: the detector columns of the channel
+
+    Returns
+    -------
+    x, y, alpha, beta, wave, v2, v3, lam of the pixels (flattened arrays)
+    """
+    names = WCSRefFileNames(input_model, MIRI_WCS_REFTYPES)
+    key = None
+    if names is not None:
+        instrument = input_model.meta.instrument
+        key = ('MIRI', instrument.detector, instrument.channel, instrument.band,
+               xstart, xend) + names
+
+    def make_maps():
+        y, x = np.mgrid[:1024, xstart:xend]
+        y = np.reshape(y, y.size)
+        x = np.reshape(x, x.size)
+        det2ab_transform = input_model.meta.wcs.get_transform('detector','alpha_beta')
+        detector2v23 = input_model.meta.wcs.get_transform('detector', 'v2v3')
+        alpha, beta, wave = det2ab_transform(x, y)
+        v2, v3, lam = detector2v23(x, y)
+        return x, y, alpha, beta, wave, v2, v3, lam
+
+    return GetCoordMaps(key, make_maps)
+#________________________________________________________________________________
+
+def NIRSPECCoordMaps(input_model, islice):
+    """
+    Short Summary
+    -------------
+    Map the detector pixels of a NIRSPEC IFU slice to v2, v3, lambda, through the
+    cache of GetCoordMaps
+
+    Parameters
+    ----------
+    input_model: slope image
+    islice: slice number
+
+    Returns
+    -------
+    x, y, v2, v3, lam of the pixels of the slice domain (2D arrays)
+    """
+    names = WCSRefFileNames(input_model, NIRSPEC_WCS_REFTYPES)
+    key = None
+    if names is not None:
+        instrument = input_model.meta.instrument
+        # the disperser model is corrected with the measured grating wheel tilts
+        key = ('NIRSPEC', instrument.detector, instrument.grating, instrument.filter,
+               instrument.gwa_xtilt, instrument.gwa_ytilt, islice) + names
+
+    def make_maps():
+        slice_wcs = nirspec.nrs_wcs_set_input(input_model, islice)
+        yrange = slice_wcs.domain[1]['lower'],slice_wcs.domain[1]['upper']
+        xrange = slice_wcs.domain[0]['lower'],slice_wcs.domain[0]['upper']
+        y, x = np.mgrid[yrange[0]:yrange[1], xrange[0]:xrange[1]]
+        detector2v23 = slice_wcs.get_transform('detector', 'v2v3')
+        v2, v3, lam = detector2v23(x, y)
+        return x, y, v2, v3, lam
+
+    return GetCoordMaps(key, make_maps)
 #________________________________________________________________________________
 
 def MakePointCloudMIRI(self, input_model,
-                       x, y, file_no, 
+                       xstart, xend, file_no, 
                        Cube,
                        c1_offset, c2_offset):
     """
@@ -23,8 +176,8 @@ def MakePointCloudMIRI(self, input_model,
 
     Parameters
     ----------
-    x,y list of x and y values to map
     input_model: slope image
+    xstart, xend: the detector columns of the channel to map
     file_no: the index on the files that are used to construct the Cube
     Cube: holds the basic information on the Cube (including wcs of Cube)
     v2v32radec: temporary (until information is contained in assign_wcs) 
@@ -42,13 +195,10 @@ def MakePointCloudMIRI(self, input_model,
 
     """
 #________________________________________________________________________________
-    det2ab_transform = input_model.meta.wcs.get_transform('detector','alpha_beta')
-    detector2v23 = input_model.meta.wcs.get_transform('detector', 'v2v3')
     v23toworld = input_model.meta.wcs.get_transform("v2v3","world")
-    worldtov23 = input_model.meta.wcs.get_transform("world","v2v3")
 
-    alpha, beta, wave = det2ab_transform(x, y)
-    v2, v3, lam = detector2v23(x, y)
+    # detector -> alpha,beta and v2,v3 do not depend on the pointing
+    x, y, alpha, beta, wave, v2, v3, lam = MIRICoordMaps(input_model, xstart, xend)
     flux_all = input_model.data[y, x]
     error_all = input_model.err[y, x]
     dq_all = input_model.dq[y,x]
@@ -91,6 +241,7 @@ def MakePointCloudMIRI(self, input_model,
     if(self.coord_system == 'alpha-beta'):
         coord1 = alpha
         coord2 = beta
+        wave = wave[good_data]
     else:
         v2_use = v2[good_data] #arc mins
         v3_use = v3[good_data] #arc mins
@@ -145,11 +296,10 @@ def MakePointCloudNIRSPEC(self, input_model,
     """
 #________________________________________________________________________________
 
-    slice_wcs = nirspec.nrs_wcs_set_input(input_model, islice)
-    yrange = slice_wcs.domain[1]['lower'],slice_wcs.domain[1]['upper']
-    xrange = slice_wcs.domain[0]['lower'],slice_wcs.domain[0]['upper']
-    y, x = np.mgrid[yrange[0]:yrange[1], xrange[0]:xrange[1]]
-    ra, dec, lam = slice_wcs(x, y) # return v2,v3 are in degrees
+    # detector -> v2,v3 does not depend on the pointing, only v2,v3 -> world does
+    x, y, v2, v3, lam = NIRSPECCoordMaps(input_model, islice)
+    v23toworld = input_model.meta.wcs.get_transform('v2v3', 'world')
+    ra, dec, lam = v23toworld(v2, v3, lam)
 
     #print('yrange for slice',yrange,islice)
     #print('xrange for slice',xrange,islice)
@@ -214,9 +364,13 @@ def FindROI(self, Cube, spaxel, PointCloud):
     """
     Short Summary
     -------------
-    using the point cloud loop over the Spaxel and find the point cloud members that
-    fall withing the ROI of the spaxel center. 
+    using the point cloud find the spaxels whose centers fall within the ROI of each
+    point cloud member and the weight of the point cloud member for those spaxels.
 
+    The cube spaxel centers are regularly spaced, so the spaxels within the ROI of
+    a point cloud member are a box of indices on each axis of the cube. The boxes of
+    a batch of point cloud members are expanded to (point, spaxel) pairs and the
+    weights of all of the pairs are found at once.
 
     For MIRI the weighting of the Cloud points is based on the distance in the local
     MRS alpha-beta plane. Each cloud point as an associated alpha-beta coordinate
@@ -226,159 +380,163 @@ def FindROI(self, Cube, spaxel, PointCloud):
     Parameters
     ----------
     Cube: holds basic Cube information
-    spaxel: a class that holds information on each spaxel in the cube. 
+    spaxel: SpaxelStore holding the point cloud members contributing to each spaxel
     PointCloud: array of point cloud members
 
     Returns
     -------
-    location of x,y in Point Cloud as well as mapping of spaxel to each overlapping 
-    PointCloud member
+    spaxel filled in with the mapping of each spaxel to the PointCloud members
+    in its ROI and their weights
 
 
     """
 #________________________________________________________________________________
-    nxc = len(Cube.xcoord)
-    nzc = len(Cube.zcoord)
-    nyc = len(Cube.ycoord)
-
     nplane = Cube.naxis1 * Cube.naxis2
     lower_limit = 0.01
 
-    iprint = 0
     nn = len(PointCloud[0])
 
     self.log.info('number of elements in PT %i',nn)
 
-
-    weight_power = 2
-    
-# loop over each point cloud member - might want to change this to looping
-# over spaxels but for now just keep it point cloud elements because it
-# is easy to find ROI members because the cube spaxel values are regularily spaced
-# and we can search over the vector of each axis of the cube rather than entire 
-# point could
-
-    iprint = 0 
+    coord1 = PointCloud[0]  # Point cloud xi 
+    coord2 = PointCloud[1]  # Point cloud eta
+    wave = PointCloud[2]    # Point cloud wavelength 
+
+    miripsf = (Cube.instrument == 'MIRI' and self.weighting == 'miripsf')
+    if(Cube.instrument == 'MIRI'):
+        alpha = PointCloud[3]
+        beta = PointCloud[4]
+        ifile = PointCloud[7].astype(int)
+        if(self.coord_system == 'alpha-beta'):
+            coord1 = alpha
+            coord2 = beta
 #________________________________________________________________________________
-    for ipt in range(0, nn - 1):
-
-        coord1 = PointCloud[0, ipt]  # Point cloud xi 
-        coord2 = PointCloud[1, ipt]  # Point cloud eta
-        wave = PointCloud[2,ipt]     # Point cloud wavelength 
-
-        if(Cube.instrument == 'MIRI'):
-            if(self.weighting == 'miripsf'):
-                alpha = PointCloud[3, ipt]   
-                beta = PointCloud[4, ipt]    
-
-                ifile = int(PointCloud[7, ipt])
-                a = Cube.a_wave[ifile]
-                c = Cube.c_wave[ifile]
-                wa = Cube.a_weight[ifile]
-                wc = Cube.c_weight[ifile]
-                weights = FindNormalizationWeights(wave, a, c, wa, wc)
-                weight_alpha = weights[0]
-                weight_beta = weights[1]
-                weight_wave = weights[2]
+    # Coord1 and Coord2 are in the coordinate system of the cube.
+    # using the Cube regularily spaced arrays - Cube.zcoord, xcoord,ycoord
+    # find the range of spaxels on each axis that fall withing ROI of point cloud:
+    # abs(Cube.xcoord - coord1) <= self.roi1 ...
+
+    x1, x2 = FindROIRange(Cube.xcoord, coord1, self.roi1)
+    y1, y2 = FindROIRange(Cube.ycoord, coord2, self.roi2)
+    z1, z2 = FindROIRange(Cube.zcoord, wave, self.roiw)
+
+    nx = x2 - x1
+    ny = y2 - y1
+    nz = z2 - z1
+    npairs = nx * ny * nz
+
+    if(nn == 0):
+        return
+
+    # process the point cloud in batches of about ROI_BATCH_SIZE (point, spaxel) pairs
+    pair_end = np.cumsum(npairs)
+    nbatch = pair_end[-1] // ROI_BATCH_SIZE + 1
+    batch_ends = np.searchsorted(pair_end, np.arange(1, nbatch) * ROI_BATCH_SIZE,
+                                 side='right')
+    batch_ends = np.unique(np.append(batch_ends, nn))
+
+    istart = 0
+    for iend in batch_ends:
+        ipt = np.arange(istart, iend)
+        istart = iend
+        count = npairs[ipt]
+        if count.sum() == 0:
+            continue
+#________________________________________________________________________________
+# expand the ROI of each point to its (point, spaxel) pairs:
+# spaxels ordered by z, then y, then x within the ROI of a point
+        ipt = np.repeat(ipt, count)
+        first = np.cumsum(count) - count
+        local = np.arange(ipt.size) - np.repeat(first, count)
+        xx = x1[ipt] + local % nx[ipt]
+        local = local // nx[ipt]
+        yy = y1[ipt] + local % ny[ipt]
+        zz = z1[ipt] + local // ny[ipt]
+
+        xi = Cube.xcoord[xx]   # Cube values for xi vector axis 
+        eta = Cube.ycoord[yy]  # Cube values for eta vector axis
+        zlam = Cube.zcoord[zz]
+        wave_pt = wave[ipt]
+#________________________________________________________________________________
+# NIRSPEC instrument or MIRI standard weighting - distance between PT and Spaxel
+# Center in the xi,eta coordinate system
+        if(not miripsf):
+            d1 = (xi - coord1[ipt])/Cube.Cdelt1
+            d2 = (eta - coord2[ipt])/Cube.Cdelt2
+            d3 = (zlam - wave_pt)/Cube.Cdelt3
+            weight_distance = np.sqrt(d1*d1 + d2*d2 + d3*d3)
+            weight_distance = np.power(weight_distance,self.weight_power)
+#________________________________________________________________________________
+# MIRI instrument, miripsf weighting - distance between PT and Spaxel Center is
+# in the alpha - beta cooridate system of the file of the point cloud member
+        else:
+            weight_distance = np.zeros(ipt.size)
+            ifile_pt = ifile[ipt]
+            for file_no in np.unique(ifile_pt):
+                use = np.where(ifile_pt == file_no)[0]
+                a = Cube.a_wave[file_no]
+                c = Cube.c_wave[file_no]
+                wa = Cube.a_weight[file_no]
+                wc = Cube.c_weight[file_no]
+                weight_alpha, weight_beta, weight_wave = \
+                    FindNormalizationWeights(a, c, wa, wc, wave_pt[use])
 
         # transform Cube Spaxel centers to alpha,beta system
-        # of point cloud member (only do this transformation for MIRI) 
-        # for MIRI weighting parameters are based on distance in alpha-beta coord system
-        # transform the cube coordinate values to alpha and beta values 
+        # of point cloud member
         # xi,eta -> ra,dec
         # ra-dec -> v2,v3 
         # v2,v3 -> local alph,beta
-
-                v2ab_transform = Cube.transform_v23toab[ifile]
-                worldtov23 = Cube.transform_worldtov23[ifile]
-
-#________________________________________________________________________________
-
-            if(self.coord_system == 'alpha-beta'):
-                coord1 = alpha
-                coord2 = beta
-#________________________________________________________________________________        
-        # Coord1 and Coord2 are in the coordinate system of the cube.
-        # using the Cube regularily spaced arrays - Cube.zcoord, xcoord,ycoord
-        # find the spaxels that fall withing ROI of point cloud
-
-        # find values within the ROI
-
-        indexz = np.where(abs(Cube.zcoord - wave) <= self.roiw)
-        indexx = np.where(abs(Cube.xcoord - coord1) <= self.roi1)
-        indexy = np.where(abs(Cube.ycoord - coord2) <= self.roi2)
-
-        zlam = Cube.zcoord[indexz]
-        xi = Cube.xcoord[indexx]   # Cube values for xi vector axis 
-        eta = Cube.ycoord[indexy]  # Cube values for eta vector axis
-
-#________________________________________________________________________________
-# loop over the points in the ROI
-        for iz, zz in enumerate(indexz[0]):
-            istart = zz * nplane
-            for iy, yy in enumerate(indexy[0]):
-                for ix, xx in enumerate(indexx[0]):
-#________________________________________________________________________________
-# NIRSPEC instrument
-                    # for NIRSPEC find distance between PT and Spaxel Center 
-                    # in xi,eta coordinate system
-                    if(Cube.instrument == 'NIRSPEC'):
-                        d1 = (xi[ix] - coord1)/Cube.Cdelt1
-                        d2 = (eta[iy] - coord2)/Cube.Cdelt2
-                        d3 = (zlam[iz] - wave)/Cube.Cdelt3
-                        weight_distance = math.sqrt(d1*d1 + d2*d2 + d3*d3)  
-                        weight_distance = math.pow(weight_distance,self.weight_power)
-#________________________________________________________________________________
-# MIRI instrument
-                    elif(Cube.instrument == 'MIRI'):
-                        
-                        # weighting - standard - distance based on xi,eta distance
-                        if(self.weighting =='standard'):
-                            d1 = (xi[ix] - coord1)/Cube.Cdelt1
-                            d2 = (eta[iy] - coord2)/Cube.Cdelt2
-                            d3 = (zlam[iz] - wave)/Cube.Cdelt3
-                            weight_distance_abs = math.sqrt(d1*d1 + d2*d2 + d3*d3)
-                            weight_distance = math.pow(weight_distance_abs,self.weight_power)
-
-                        # For MIRI the distance between PT and Spaxel Center is
-                        # in the alpha - beta cooridate system
-                        elif(self.weighting =='miripsf'):
-
-                            ra_spaxel,dec_spaxel=coord.std2radec(Cube.Crval1,
-                                                             Cube.Crval2,
-                                                             xi[ix],eta[iy])
-
- 
-                            v2_spaxel,v3_spaxel,zl = worldtov23(ra_spaxel,dec_spaxel,zlam[iz])
-
-                            alpha_spaxel,beta_spaxel,wave_spaxel = v2ab_transform(v2_spaxel,
-                                                                              v3_spaxel,
-                                                                              zlam[iz])                    
-                            alpha_distance =alpha-alpha_spaxel
-                            beta_distance = beta-beta_spaxel
-                            wave_distance  = abs(wave-wave_spaxel)
-
-                            xn = alpha_distance/weight_alpha
-                            yn = beta_distance/weight_beta
-                            wn = wave_distance/weight_wave
-                                                         
-                        # only included the spatial dimensions
-                            weight_distance = math.sqrt(xn*xn + yn*yn + wn*wn)  
-                            weight_distance = math.pow(weight_distance,self.weight_power)
+                v2ab_transform = Cube.transform_v23toab[file_no]
+                worldtov23 = Cube.transform_worldtov23[file_no]
+
+                ra_spaxel,dec_spaxel = coord.std2radec(Cube.Crval1,
+                                                       Cube.Crval2,
+                                                       xi[use],eta[use])
+                v2_spaxel,v3_spaxel,zl = worldtov23(ra_spaxel.ravel(),
+                                                    dec_spaxel.ravel(),
+                                                    zlam[use])
+                alpha_spaxel,beta_spaxel,wave_spaxel = v2ab_transform(v2_spaxel,
+                                                                      v3_spaxel,
+                                                                      zlam[use])
+                alpha_distance = alpha[ipt[use]] - alpha_spaxel
+                beta_distance = beta[ipt[use]] - beta_spaxel
+                wave_distance = abs(wave_pt[use] - wave_spaxel)
+
+                xn = alpha_distance/weight_alpha
+                yn = beta_distance/weight_beta
+                wn = wave_distance/weight_wave
+
+                distance = np.sqrt(xn*xn + yn*yn + wn*wn)
+                weight_distance[use] = np.power(distance,self.weight_power)
 #________________________________________________________________________________
 # We have found the weight_distance based on instrument type
 
-                    if(weight_distance < lower_limit): weight_distance = lower_limit
-                    weight_distance = 1.0 / weight_distance
+        weight_distance = 1.0 / np.maximum(weight_distance, lower_limit)
 
-                    cube_index = istart + yy * Cube.naxis1 + xx
-                    spaxel[cube_index].ipointcloud.append(ipt)
-                    spaxel[cube_index].pointcloud_weight.append(weight_distance)
+        cube_index = zz * nplane + yy * Cube.naxis1 + xx
+        spaxel.add(cube_index, ipt, weight_distance)
 
+#_______________________________________________________________________
+def FindROIRange(axis, values, roi):
+    """
+    Short Summary
+    -------------
+    For each value find the range of the (increasing) cube axis values within the ROI
+    abs(axis - value) <= roi
 
-#                    iprint = iprint + 1
-#                    if(iprint < 500):
-#                        print(ipt,ix,iy,iz,weight_distance)
+    Parameters
+    ----------
+    axis: spaxel center coordinates along one axis of the cube
+    values: coordinates of the point cloud members along that axis
+    roi: region of interest along that axis
+
+    Returns
+    -------
+    start, end: the indices axis[start:end] of each point cloud member within the ROI
+    """
+    start = np.searchsorted(axis, values - roi, side='left')
+    end = np.searchsorted(axis, values + roi, side='right')
+    return start, end
 
 #_______________________________________________________________________
 def FindWaveWeights(channel, subchannel):
@@ -481,38 +639,23 @@ gs     weighting is determined from width of PSF as well as wavelength resolutio
 
     Parameters
     ----------
-    channel- channel for point
-    subchannel- subchannel for point
-    wavelength of point
+    a, c, wa, wc - wavelength normalization parameters of the channel and
+                   subchannel of the points (see FindWaveWeights)
+    wavelength of the points - a value or an array
 
     Returns
     -------
     normalized weighting for 3 dimension
 
     """
-    alpha_weight = 1.0
-    beta_weight = 1.0
-    lambda_weight = 1.0
+    wavelength = np.asarray(wavelength)
 
     beta_weight = 0.31 * (wavelength / 8.0)
 
+    alpha_weight = np.where(wavelength < 8.0, 0.31, beta_weight)
 
-    if(wavelength < 8.0):
-        alpha_weight = 0.31
-    else:
-        alpha_weight = beta_weight
-
-
-        # linear interpolation
-
-    if (wavelength >= wa and wavelength <= wc):
-        b = a + (c - a) * (wavelength - wa) / (wc - wa)
-
-    elif (wavelength < wa):
-        b = a
-    else:
-        b = c
-
+        # linear interpolation, b = a below wa and c above wc
+    b = a + (c - a) * (np.clip(wavelength, wa, wc) - wa) / (wc - wa)
 
     lambda_weight = wavelength / b
 
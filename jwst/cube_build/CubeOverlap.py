@@ -6,6 +6,9 @@ import numpy as np
 import math
 from . import cube
 from .. import datamodels
+
+# Smallest fraction of a detector pixel area counted as overlapping a spaxel
+MIN_AREA_RATIO = 1.0e-10
 #________________________________________________________________________________
 def FindAreaPoly(nVertices, xpixel, ypixel):
     """
@@ -346,9 +349,143 @@ def SH_FindOverlap(xcenter, ycenter, xlength, ylength, xp_corner, yp_corner):
     return areaClipped;
 
 #________________________________________________________________________________
+def FindAreaPolyBatch(nVertices, xpixel, ypixel):
+    """
+    Short Summary
+    -------------
+    Find the areas of a set of polygons
 
+    Parameters
+    ----------
+    nVertices: number of Vertices of each polygon
+    xpixel, ypixel - x,y location of vertices, arrays of shape (number of polygons,
+                     maximum number of vertices). The vertices of polygon i are the
+                     first nVertices[i] values of row i (the polygon is not closed)
+
+    Returns
+    -------
+    area of each polygon
 
-def SpaxelOverlap(self, x, y, sliceno, start_slice, input_model, transform, beta_width, Cube, spaxel):
+
+    """
+    nVertices = np.asarray(nVertices)
+    nmax = xpixel.shape[1]
+    j = np.arange(nmax)
+    # index of the next vertex, wrapping around to close each polygon
+    jnext = np.where(j + 1 < nVertices[:, np.newaxis], j + 1, 0)
+    rows = np.arange(xpixel.shape[0])[:, np.newaxis]
+    # zero the padding past the last vertex, which may hold any value, so
+    # that it adds nothing to the sum
+    valid = j < nVertices[:, np.newaxis]
+    xpixel = np.where(valid, xpixel, 0.0)
+    ypixel = np.where(valid, ypixel, 0.0)
+    xnext = xpixel[rows, jnext]
+    ynext = ypixel[rows, jnext]
+    area = xpixel * ynext - xnext * ypixel
+    return abs(0.5 * area.sum(axis=1))
+
+
+#________________________________________________________________________________
+def SH_FindOverlapBatch(xcenter, ycenter, xlength, ylength, xp_corner, yp_corner):
+    """
+    Summary
+    -------
+    Batched version of SH_FindOverlap: find the overlap areas of a set of detector
+    pixels with a set of spaxels at once.
+
+    The Sutherland_hedgeman Polygon Clipping Algorithm clips each pixel by the four
+    sides of its spaxel, all of the pixels are clipped by a side together. Each side
+    of a clipped polygon gives at most two vertices, the intersection with the side
+    of the spaxel and its end point; the vertices are kept in arrays of the maximum
+    number of vertices, with the number of vertices of each polygon.
+
+    Parameters
+    ---------
+    xcenter: center grid points in x dimension for cube (along slice- alpha)
+    ycenter: center grid points in y dimension for cube (lambda)
+    xlength : width of spaxel in x dimesion (along slice- alpha)
+    ylength : width of spaxel in y dimesion (lambda)
+    xp_corner: alpha pixel corner values, array of shape (number of pixels, 4)
+    yp_corner: lambda pixel corner values, array of shape (number of pixels, 4)
+
+    Returns
+    -------
+    AreaOverlap of each pixel with its spaxel
+    """
+    # work relative to the spaxel centers, which keeps the precision of the small
+    # pixel areas at large alpha, lambda values
+    xPixel = np.asarray(xp_corner, dtype=np.float64) - np.reshape(xcenter, (-1, 1))
+    yPixel = np.asarray(yp_corner, dtype=np.float64) - np.reshape(ycenter, (-1, 1))
+    nVertices = np.zeros(xPixel.shape[0], dtype=int) + 4
+    rows = np.arange(xPixel.shape[0])[:, np.newaxis]
+
+    left = -0.5 * xlength
+    right = 0.5 * xlength
+    bottom = -0.5 * ylength
+    top = 0.5 * ylength
+
+    for edge in range(0, 4):     # 0:left, 1: right, 2: bottom, 3: top
+        nmax = xPixel.shape[1]
+        j = np.arange(nmax)
+        valid_side = j < nVertices[:, np.newaxis]
+        jnext = np.where(j + 1 < nVertices[:, np.newaxis], j + 1, 0)
+        x1 = xPixel
+        y1 = yPixel
+        x2 = xPixel[rows, jnext]
+        y2 = yPixel[rows, jnext]
+
+        if(edge == 0):
+            inside1 = x1 > left
+            inside2 = x2 > left
+        elif(edge == 1):
+            inside1 = x1 < right
+            inside2 = x2 < right
+        elif(edge == 2):
+            inside1 = y1 > bottom
+            inside2 = y2 > bottom
+        else:
+            inside1 = y1 < top
+            inside2 = y2 < top
+
+        # intersection of the pixel side with the side of the spaxel, only used
+        # where the pixel side crosses it
+        cross = valid_side & (inside1 != inside2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if(edge < 2):
+                xedge = left if edge == 0 else right
+                xint = np.zeros_like(x1) + xedge
+                yint = y1 + (y2 - y1) * (xedge - x1) / (x2 - x1)
+            else:
+                yedge = bottom if edge == 2 else top
+                yint = np.zeros_like(y1) + yedge
+                xint = x1 + (x2 - x1) * (yedge - y1) / (y2 - y1)
+
+        # the vertices from each pixel side: intersection then end point
+        xnew = np.stack([xint, x2], axis=2).reshape(x1.shape[0], 2 * nmax)
+        ynew = np.stack([yint, y2], axis=2).reshape(y1.shape[0], 2 * nmax)
+        keep = np.stack([cross, valid_side & inside2], axis=2).reshape(x1.shape[0], 2 * nmax)
+
+        # move the kept vertices to the front of each row, in order
+        order = np.argsort(~keep, axis=1, kind='mergesort')
+        nVertices = keep.sum(axis=1)
+        nkeep = max(int(nVertices.max()) if nVertices.size else 0, 1)
+        order = order[:, :nkeep]
+        # the rows with fewer vertices are padded with the dropped values, which
+        # include the intersections of sides that do not cross (inf or NaN); zero
+        # them so the next side and the area only see finite values
+        padding = np.arange(nkeep) >= nVertices[:, np.newaxis]
+        xPixel = np.where(padding, 0.0, xnew[rows, order])
+        yPixel = np.where(padding, 0.0, ynew[rows, order])
+
+    areaClipped = FindAreaPolyBatch(nVertices, xPixel, yPixel)
+    areaClipped[nVertices < 3] = 0.0
+    return areaClipped
+
+#________________________________________________________________________________
+
+
+def SpaxelOverlap(self, x, y, sliceno, start_slice, input_model, transform, beta_width,
+                  Cube, spaxel, file_no, cloud_start):
     """
     Short Summary
     -------------
@@ -357,8 +494,8 @@ def SpaxelOverlap(self, x, y, sliceno, start_slice, input_model, transform, beta
     The user can not change scaling in beta
     Map the corners of the x,y detector values to a cube defined by alpha,beta, lambda
     In the alpha,lambda plane find the % area of the detector pixel which it overlaps with
-    in the cube.  For each spaxel record the detector pixels that overlap with it - store flux,
-    flux error, % overlap, beta_distance.
+    in the cube.  For each spaxel record the detector pixels that overlap with it and
+    the % overlap.
 
     Parameters
     ----------
@@ -368,11 +505,14 @@ def SpaxelOverlap(self, x, y, sliceno, start_slice, input_model, transform, beta
     transform: wcs transform to transform x,y to alpha,beta, lambda
     beta_width: width of slice
     Cube: class holding basic information on cube
-    spaxel: list of spaxels holding information on each cube pixel.
+    spaxel: SpaxelStore holding the detector pixels overlapping each cube pixel.
+    file_no: the index on the files that are used to construct the Cube
+    cloud_start: number of detector pixels already in the point cloud
 
     Returns
     -------
-    spaxel filled in with needed information on overlapping detector pixels
+    spaxel filled in with the overlapping detector pixels, indexed from cloud_start,
+    and the detector pixels of the slice in the point cloud format
 
 
     """
@@ -402,135 +542,72 @@ def SpaxelOverlap(self, x, y, sliceno, start_slice, input_model, transform, beta
     alpha4, beta4, lam4 = transform(xx_left, yy_top)
 
 
-    # Loop over all pixels in slice
-    for ipixel in range(0, nn - 1):
-        valid_pixel = True
-        debug = 0
-
-#        if(x[ipixel] == 67 and y[ipixel] ==41) :
-#            print('Found pixel',alpha[ipixel],beta[ipixel],lam[ipixel])
-#            sys.exit('STOP')
+    # detector pixel -> 4 corners
+    # In alpha,wave space
+    # in beta space: beta center + width
+    alpha_corner = np.stack([alpha1, alpha2, alpha3, alpha4], axis=1)
+    wave_corner = np.stack([lam1, lam2, lam3, lam4], axis=1)
 
-        # detector pixel -> 4 corners
-        # In alpha,wave space
-        # in beta space: beta center + width
+    # pixels with corners off the slice can not be mapped
+    valid_pixel = np.where(np.all(np.isfinite(alpha_corner) & np.isfinite(wave_corner),
+                                  axis=1))[0]
+    alpha_corner = alpha_corner[valid_pixel]
+    wave_corner = wave_corner[valid_pixel]
 
-        alpha_corner = list()
-        wave_corner = list()
-
-        alpha_corner.append(alpha1[ipixel])
-        alpha_corner.append(alpha2[ipixel])
-        alpha_corner.append(alpha3[ipixel])
-        alpha_corner.append(alpha4[ipixel])
-
-        wave_corner.append(lam1[ipixel])
-        wave_corner.append(lam2[ipixel])
-        wave_corner.append(lam3[ipixel])
-        wave_corner.append(lam4[ipixel])
+    alpha_min = alpha_corner.min(axis=1)
+    alpha_max = alpha_corner.max(axis=1)
+    wave_min = wave_corner.min(axis=1)
+    wave_max = wave_corner.max(axis=1)
 
 #________________________________________________________________________________
-# Now it does not matter the WCS method used
-
-        if(valid_pixel):
-            alpha_min = min(alpha_corner)
-            alpha_max = max(alpha_corner)
-            wave_min = min(wave_corner)
-            wave_max = max(wave_corner)
-
-        # estimate the where the pixel overlaps in the cube
-        # find the min and max values in the cube xcoord,ycoord and zcoord
+# estimate the where the pixels overlap in the cube: the spaxels are a regular
+# grid, so the range of possibly overlapping spaxels follows from the min and max
+# corner values
 
-            MinA = (alpha_min - Cube.Crval1) / Cube.Cdelt1
-            MaxA = (alpha_max - Cube.Crval1) / Cube.Cdelt1
-            ix1 = max(0, int(math.trunc(MinA)))
-            ix2 = int(math.ceil(MaxA))
-            if(ix2 >= nxc):
-                ix2 = nxc - 1
-
-
-            MinW = (wave_min - Cube.Crval3) / Cube.Cdelt3
-            MaxW = (wave_max - Cube.Crval3) / Cube.Cdelt3
-            iz1 = int(math.trunc(MinW))
-            iz2 = int(math.ceil(MaxW))
-            if(iz2 >= nzc):
-                iz2 = nzc - 1
+    MinA = (alpha_min - Cube.Crval1) / Cube.Cdelt1
+    MaxA = (alpha_max - Cube.Crval1) / Cube.Cdelt1
+    ix1 = np.maximum(0, np.trunc(MinA).astype(int))
+    ix2 = np.minimum(np.ceil(MaxA).astype(int), nxc - 1)
 
+    MinW = (wave_min - Cube.Crval3) / Cube.Cdelt3
+    MaxW = (wave_max - Cube.Crval3) / Cube.Cdelt3
+    iz1 = np.maximum(0, np.trunc(MinW).astype(int))
+    iz2 = np.minimum(np.ceil(MaxW).astype(int), nzc - 1)
 
 # 1-1 mapping in beta
-            iy2 = sliceno_use - 1
-
-
-        #_______________________________________________________________________
-
-            Area = FindAreaQuad(alpha_min, wave_min, alpha_corner, wave_corner)
-
-        #_______________________________________________________________________
-        # loop over possible overlapping cube pixels
-
-            noverlap = 0
-            nplane = Cube.naxis1 * Cube.naxis2
-
-            for zz in range(iz1, iz2 + 1):
-                zcenter = Cube.zcoord[zz]
-                istart = zz * nplane
-                yy = iy2 # one to one mapping
-
-
-                for xx in range(ix1, ix2 + 1):
-                    cube_index = istart + yy * Cube.naxis1 + xx
-                    xcenter = Cube.xcoord[xx]
-                    AreaOverlap = SH_FindOverlap(xcenter, zcenter, Cube.Cdelt1, Cube.Cdelt3, alpha_corner, wave_corner)
-
-                    if(AreaOverlap > 0.0):
-
-                        AreaRatio = AreaOverlap / Area
-                        spaxel[cube_index].pixel_overlap.append(AreaRatio)
-                        spaxel[cube_index].pixel_flux.append(pixel_flux[ipixel])
-                        spaxel[cube_index].pixel_error.append(pixel_error[ipixel])
-
-
-#                        if(xx== 7 and yy == 10 and zz == 100):
-#                            print('For pixel ',x[ipixel]+1,y[ipixel]+1)
-#                            print('Alpha-beta-lambda',alpha[ipixel],beta[ipixel],lam[ipixel])
-#                            print('flux',pixel_flux[ipixel])
-#                            print('zcenter xcenter',zcenter,xcenter)
-#                            print(' Overlaping Spaxel',cube_index,xx,yy,zz)
-#                            print('Spaxel Area', AreaOverlap,AreaRatio*100.0)
-#________________________________________________________________________________
-def SpaxelFlux(radius_y, i, Cube, spaxel):
-
-    """
-    Short Summary
-    -------------
-    based on the overlapping detector pixels and area of overlap find the flux of the spaxel
-
-    Parameters
-    ----------
-    radius_y: radius of interest in beta dimension
-    i: index of spaxel
-    Cube: class holding basic information of Cube
-    spaxel: cube pixel
-
-    Returns
-    -------
-    weighted flux of spaxel
-
-    """
-    debug = 0
-    num = len(spaxel[i].pixel_overlap)
-
-    #print(' For spaxel i # overlaps',num)
-    flux = 0
-    FinalWeight = 0.0
-    FinalFlux = 0.0
-
-    for j in range(num):
-        FinalFlux = FinalFlux + spaxel[i].pixel_flux[j] * spaxel[i].pixel_overlap[j]
-        FinalWeight = FinalWeight + spaxel[i].pixel_overlap[j]
-    if(num > 0):
-        FinalFlux = FinalFlux / FinalWeight
-        spaxel[i].flux = FinalFlux
-        if(i == -debug):
-            print('Flux', FinalFlux, i)
-    else:
-        spaxel[i].flux = 0.0
+    yy = sliceno_use - 1
+
+    #_______________________________________________________________________
+    Area = FindAreaPolyBatch(np.zeros(len(valid_pixel), dtype=int) + 4,
+                             alpha_corner - alpha_min[:, np.newaxis],
+                             wave_corner - wave_min[:, np.newaxis])
+
+    #_______________________________________________________________________
+    # expand the pixels to all (pixel, spaxel) pairs that may overlap:
+    # spaxels ordered by z then x for each pixel
+    nx = np.maximum(ix2 - ix1 + 1, 0)
+    nz = np.maximum(iz2 - iz1 + 1, 0)
+    count = nx * nz
+    ipixel = np.repeat(np.arange(len(valid_pixel)), count)
+    first = np.cumsum(count) - count
+    local = np.arange(ipixel.size) - np.repeat(first, count)
+    xx = ix1[ipixel] + local % nx[ipixel]
+    zz = iz1[ipixel] + local // nx[ipixel]
+
+    AreaOverlap = SH_FindOverlapBatch(Cube.xcoord[xx], Cube.zcoord[zz],
+                                      Cube.Cdelt1, Cube.Cdelt3,
+                                      alpha_corner[ipixel], wave_corner[ipixel])
+
+    # pixels that only touch a spaxel side leave slivers of rounding size
+    AreaRatio = AreaOverlap / Area[ipixel]
+    overlap = AreaRatio > MIN_AREA_RATIO
+    nplane = Cube.naxis1 * Cube.naxis2
+    overlap_spaxel = zz[overlap] * nplane + yy * Cube.naxis1 + xx[overlap]
+    overlap_pixel = cloud_start + valid_pixel[ipixel[overlap]]
+    overlap_ratio = AreaRatio[overlap]
+
+    spaxel.add(overlap_spaxel, overlap_pixel, overlap_ratio)
+
+    ifile = np.zeros(pixel_flux.shape, dtype='int') + int(file_no)
+    cloud = np.asarray([alpha, beta, lam, alpha, beta, pixel_flux, pixel_error, ifile, x, y])
+    return cloud
@@ -1,5 +1,5 @@
 # Cube Class
-# Spaxel Class
+# SpaxelStore Class
 
 import sys
 import numpy as np
@@ -22,14 +22,16 @@ class CubeInfo(object):
         self.channel = list()
         self.subchannel = list()
 
-        self.file = list()
-        self.a_wave = list()
-        self.c_wave = list()
+        # information on each input file, keyed by the file number of the
+        # point cloud members (set by each process mapping a file to the cube)
+        self.file = dict()
+        self.a_wave = dict()
+        self.c_wave = dict()
 
-        self.a_weight = list()
-        self.c_weight = list()
-        self.transform_v23toab = list()
-        self.transform_worldtov23 = list()
+        self.a_weight = dict()
+        self.c_weight = dict()
+        self.transform_v23toab = dict()
+        self.transform_worldtov23 = dict()
 
         self.filter = list()
         self.grating = list()
@@ -244,28 +246,135 @@ class CubeInfo(object):
 
 
 ##################################################################################
-class Spaxel(object):
-
-    __slots__ = ['xcenter', 'ycenter', 'zcenter', 'v2center','v3center',
-                 'flux', 'error', 'pixel_flux', 'pixel_error', 'pixel_overlap',
-                 'pixel_beta', 'ipointcloud', 'pointcloud_weight']
-
-    def __init__(self, xcenter, ycenter, zcenter):
-        self.xcenter = xcenter    # set in cube_build_step, default xi
-        self.ycenter = ycenter    # set in cube_build_step, default eta
-        self.zcenter = zcenter    # set in cube build step, defailt lambda
-        self.v2center  = 0
-        self.v3center = 0
-        self.flux = 0
-        self.error = 0
-
-        self.ipointcloud = list()         # appended to in CubeCloud.MakePointCloud
-        self.pointcloud_weight = list()   # appended to in CubeCloud.MakePointCloud
-
-        self.pixel_flux = list()
-        self.pixel_error = list()
-        self.pixel_overlap = list()
-        self.pixel_beta = list()
-
-
-
+class SpaxelStore(object):
+# The detector pixels (point cloud members) that contribute to the spaxels of
+# the cube and their weights, held as arrays rather than as one object per spaxel.
+# Contributions are added in batches with add. finalize sorts them by spaxel
+# into compressed sparse row form: the contributions to spaxel i are
+# index[indptr[i]:indptr[i+1]] with weights weight[indptr[i]:indptr[i+1]].
+# The spaxels are numbered as the flattened (naxis3, naxis2, naxis1) cube.
+
+    def __init__(self, nspaxel):
+        self.nspaxel = nspaxel
+        self.spaxel = np.zeros(0, dtype=np.intp)
+        self.index = np.zeros(0, dtype=np.intp)
+        self.weight = np.zeros(0, dtype=np.float64)
+        self.indptr = np.zeros(nspaxel + 1, dtype=np.intp)
+        self._batches = list()
+#_______________________________________________________________________
+    def add(self, spaxel, index, weight):
+        """
+        Short Summary
+        -------------
+        Add a batch of contributions to the spaxels
+
+        Parameters
+        ----------
+        spaxel: spaxel index (in the flattened cube) of each contribution
+        index: index of the contributing member of the point cloud
+        weight: weight of each contribution
+
+        Returns
+        -------
+        no return
+        """
+        spaxel = np.asarray(spaxel, dtype=np.intp).ravel()
+        if spaxel.size == 0:
+            return
+        index = np.broadcast_to(np.asarray(index, dtype=np.intp),
+                                spaxel.shape).ravel()
+        weight = np.broadcast_to(np.asarray(weight, dtype=np.float64),
+                                 spaxel.shape).ravel()
+        self._batches.append((spaxel, index, weight))
+#_______________________________________________________________________
+    def finalize(self):
+        """
+        Short Summary
+        -------------
+        Sort the contributions added so far by spaxel (compressed sparse row form)
+
+        Returns
+        -------
+        no return, sets spaxel, index, weight and indptr
+        """
+        if not self._batches:
+            return
+        batches = [(self.spaxel, self.index, self.weight)] + self._batches
+        self._batches = list()
+        spaxel = np.concatenate([b[0] for b in batches])
+        index = np.concatenate([b[1] for b in batches])
+        weight = np.concatenate([b[2] for b in batches])
+
+        # a stable sort keeps the contributions to a spaxel in the order added
+        order = np.argsort(spaxel, kind='mergesort')
+        self.spaxel = spaxel[order]
+        self.index = index[order]
+        self.weight = weight[order]
+        counts = np.bincount(self.spaxel, minlength=self.nspaxel)
+        self.indptr = np.zeros(self.nspaxel + 1, dtype=np.intp)
+        np.cumsum(counts, out=self.indptr[1:])
+#_______________________________________________________________________
+    def counts(self):
+        """
+        Short Summary
+        -------------
+        Number of contributions to each spaxel
+        """
+        self.finalize()
+        return np.diff(self.indptr)
+#_______________________________________________________________________
+    def sums(self, values):
+        """
+        Short Summary
+        -------------
+        Sums of the weights and of the weighted contributing values of each spaxel.
+        The sums found for different sets of contributions (input files) add up.
+
+        Parameters
+        ----------
+        values: array of the values of the point cloud members, indexed by index
+
+        Returns
+        -------
+        weight_sum, value_sum for each spaxel
+        """
+        self.finalize()
+        weight_sum = np.bincount(self.spaxel, weights=self.weight,
+                                 minlength=self.nspaxel)
+        value_sum = np.bincount(self.spaxel,
+                                weights=self.weight * values[self.index],
+                                minlength=self.nspaxel)
+        return weight_sum, value_sum
+#_______________________________________________________________________
+    def weighted_mean(self, values):
+        """
+        Short Summary
+        -------------
+        Weighted mean of the contributing values of each spaxel
+
+        Parameters
+        ----------
+        values: array of the values of the point cloud members, indexed by index
+
+        Returns
+        -------
+        mean value for each spaxel, 0 for spaxels without contributions
+        """
+        weight_sum, value_sum = self.sums(values)
+        return WeightedMean(weight_sum, value_sum)
+
+
+def WeightedMean(weight_sum, value_sum):
+    """
+    Short Summary
+    -------------
+    Weighted mean of each spaxel from the sums of SpaxelStore.sums
+
+    Returns
+    -------
+    mean value for each spaxel, 0 for spaxels without contributions
+    """
+    mean = np.zeros(weight_sum.shape, dtype=np.float64)
+    good = weight_sum != 0
+    mean[good] = value_sum[good] / weight_sum[good]
+    return mean
@@ -13,6 +13,7 @@ from gwcs.utils import _domain_to_bounds
 from ..associations import Association
 from .. import datamodels
 from ..assign_wcs import nirspec
+from ..lib.processes import fork_context, get_max_processes
 from . import cube
 from . import CubeOverlap
 from . import CubeCloud
@@ -114,22 +115,16 @@ def FindFootPrintMIRI(self, input, this_channel, InstrumentInfo):
     # return the min & max of spatial coords and wavelength  - these are of the pixel centers
 
     xstart, xend = InstrumentInfo.GetMIRISliceEndPts(this_channel)
-    y, x = np.mgrid[:1024, xstart:xend]
-
-    coord1 = np.zeros(y.shape)
-    coord2 = np.zeros(y.shape)
-    lam = np.zeros(y.shape)
 
+    # the detector -> alpha,beta and v2,v3 maps are shared with the point cloud
+    x, y, alpha, beta, wave, v2, v3, lam = CubeCloud.MIRICoordMaps(input, xstart, xend)
 
     if (self.coord_system == 'alpha-beta'):
-        detector2alpha_beta = input.meta.wcs.get_transform('detector', 'alpha_beta')
-        coord1, coord2, lam = detector2alpha_beta(x, y)
+        coord1, coord2, lam = alpha, beta, wave
 
     elif (self.coord_system == 'ra-dec'):
-        detector2v23 = input.meta.wcs.get_transform('detector', 'v2v3')
         v23toworld = input.meta.wcs.get_transform("v2v3","world")
 
-        v2, v3, lam = detector2v23(x, y) 
         coord1,coord2,lam = v23toworld(v2,v3,lam)
 
     else:
@@ -189,19 +184,15 @@ def FindFootPrintNIRSPEC(self, input,flag_data):
     k = 0
 
     self.log.info('Looping over slices to determine cube size .. this takes a while')
+    v23toworld = input.meta.wcs.get_transform('v2v3', 'world')
     # for NIRSPEC there are 30 regions
     for i in regions:
 #        print('on slice',i)
-        slice_wcs = nirspec.nrs_wcs_set_input(input,  i)
-        yrange_slice = slice_wcs.domain[1]['lower'],slice_wcs.domain[1]['upper']
-        xrange_slice = slice_wcs.domain[0]['lower'],slice_wcs.domain[0]['upper']
-#        print ('yrange 0,1 xrange 0,1',yrange[0],yrange[1],xrange[0],xrange[1])
-        if(xrange_slice[0] >= 0 and xrange_slice[1] > 0): 
-
-            x,y = wcstools.grid_from_domain(slice_wcs.domain)
+        # the detector -> v2,v3 maps of the slices are shared with the point cloud
+        x, y, v2, v3, lam = CubeCloud.NIRSPECCoordMaps(input, i)
+        if(x.size > 0 and x.min() >= 0): 
 
-#            y, x = np.mgrid[yrange[0]:yrange[1], xrange[0]:xrange[1]]
-            ra,dec,lam = slice_wcs(x,y)
+            ra,dec,lam = v23toworld(v2,v3,lam)
 
             #        print('ra',ra.shape,ra[20,0:20])
             #        print('dec',dec.shape,dec[20,0:20])
@@ -239,31 +230,24 @@ def FindFootPrintNIRSPEC(self, input,flag_data):
     return a_min, a_max, b_min, b_max, lambda_min, lambda_max
 #_______________________________________________________________________
 #********************************************************************************
-def DetermineCubeSize(self, Cube, MasterTable, InstrumentInfo):
+def BandFileTasks(self, Cube, MasterTable):
 #********************************************************************************
     """
     Short Summary
     -------------
-    Function to determine the min and max coordinates of the spectral cube,given channel & subchannel
+    List the input files of each band (channel/subchannel or grating/filter) of
+    the cube. Each band and file is mapped to the cube independently of the others.
 
     Parameter
     ----------
     Cube: class the holds the basic paramters of the IFU cube to be created
     MasterTable:  A table that contains the channel/subchannel or filter/grating for each input file
-    InstrumentInfo: Default information on the MIRI and NIRSPEC instruments. This information might
-                    contained in a different file in the future. Probably a reference file
 
     Returns
     -------
-    Cube Dimension Information:
-
-    Footprint of cube: min and max of coordinates of cube. If an offset list is provided then these values are applied.
-    if the coordinate system is alpha-beta (MIRI) then min and max coordinates of alpha (arc sec),
-    beta (arc sec) and lambda (microns) 
-    if the coordinate system is ra-dec then the min and max of ra(degress), dec (degrees) and lambda (microns)
-    is returned. 
-
-
+    list of (band parameter1, band parameter2, file number, file name, c1_offset, c2_offset)
+    The file number counts the files of all of the bands, c1_offset and c2_offset are
+    the dither offsets of the file (in arc seconds)
     """
     instrument = Cube.instrument
 
@@ -274,72 +258,133 @@ def DetermineCubeSize(self, Cube, MasterTable, InstrumentInfo):
         parameter1 = self.metadata['band_grating']
         parameter2 = self.metadata['band_filter']
 
-
-    a_min = []
-    a_max = []
-    b_min = []
-    b_max = []
-    lambda_min = []
-    lambda_max = []
-
-    self.log.info('Number of bands in cube  %i', 
-                              self.metadata['num_bands'])
-
+    tasks = []
     for i in range(self.metadata['num_bands']):
- 
-        this_a = parameter1[i]
-        this_b = parameter2[i]
-        self.log.info('Working on data  from %s,%s',this_a,this_b)
-
-        n = len(MasterTable.FileMap[instrument][this_a][this_b])
-        log.debug('number of files %d ', n)
-
-    # each file find the min and max a and lambda (OFFSETS NEED TO BE APPLIED TO THESE VALUES)
-        for k in range(n):
-            amin = 0.0
-            amax = 0.0
-            bmin = 0.0
-            bmax = 0.0
-            lmin = 0.0
-            lmax = 0.0
+        this_par1 = parameter1[i]
+        this_par2 = parameter2[i]
+
+        nfiles = len(MasterTable.FileMap[instrument][this_par1][this_par2])
+        ioffset = len(MasterTable.FileOffset[this_par1][this_par2]['C1'])
+        for k in range(nfiles):
+            ifile = MasterTable.FileMap[instrument][this_par1][this_par2][k]
             c1_offset = 0.0
             c2_offset = 0.0
-            ifile = MasterTable.FileMap[instrument][this_a][this_b][k]
-            ioffset = len(MasterTable.FileOffset[this_a][this_b]['C1'])
-            if(ioffset == n):
-                c1_offset = MasterTable.FileOffset[this_a][this_b]['C1'][k]
-                c2_offset = MasterTable.FileOffset[this_a][this_b]['C2'][k]
-#                print('offset to apply in arcseonds (ra,dec) ', c1_offset, c2_offset)
+        # c1_offset and c2_offset are the dither offset sets (in arc seconds)
+        # by default these are zer0. The user has to supply these 
+            if(ioffset == nfiles):
+                c1_offset = MasterTable.FileOffset[this_par1][this_par2]['C1'][k]
+                c2_offset = MasterTable.FileOffset[this_par1][this_par2]['C2'][k]
+            tasks.append((this_par1, this_par2, len(tasks), ifile, c1_offset, c2_offset))
+
+    return tasks
 #________________________________________________________________________________
-# Open the input data model
-            with datamodels.ImageModel(ifile) as input_model:
-                t0 = time.time()
-                if(instrument == 'NIRSPEC'):
-                    flag_data = 0 
-                    ChannelFootPrint = FindFootPrintNIRSPEC(self, input_model,flag_data)
-                    amin, amax, bmin, bmax, lmin, lmax = ChannelFootPrint
-                    t1 = time.time()
+
+# Inputs shared by all of the tasks run in a worker process; these are
+#   set by InitTaskWorker when the process pool starts up.
+_worker_inputs = {}
+
+
+def InitTaskWorker(step, func, args):
+    """
+    Short Summary
+    -------------
+    Save the step, the function run for each task and its other arguments in a
+    worker process.
+    """
+    _worker_inputs['step'] = step
+    _worker_inputs['func'] = func
+    _worker_inputs['args'] = args
+
+
+def RunTaskWorker(task):
+    """
+    Short Summary
+    -------------
+    Run one task in a worker process.
+    """
+    return _worker_inputs['func'](_worker_inputs['step'], task,
+                                  *_worker_inputs['args'])
+
+
+def RunTasks(self, func, tasks, args):
+    """
+    Short Summary
+    -------------
+    Run func(self, task, *args) for each task. The tasks are independent: they
+    run in a pool of worker processes if maximum_cores allows more than one.
+    The step cannot be pickled, so the workers are forked from this process;
+    where processes cannot be forked, the tasks run here one after the other.
+
+    Parameter
+    ----------
+    func: module level function run for each task
+    tasks: list of tasks, see BandFileTasks
+    args: tuple of the other arguments of func
+
+    Returns
+    -------
+    generator of the results of func for each task, in the order of tasks
+    """
+    nproc = min(get_max_processes(self.maximum_cores), len(tasks))
+    context = fork_context()
+    if nproc <= 1 or context is None:
+        for task in tasks:
+            yield func(self, task, *args)
+        return
+
+    log.info('Running %d tasks using %d processes', len(tasks), nproc)
+    pool = context.Pool(nproc, initializer=InitTaskWorker,
+                        initargs=(self, func, args))
+    try:
+        for result in pool.imap(RunTaskWorker, tasks):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
 #________________________________________________________________________________
-                if(instrument == 'MIRI'):
-                    ChannelFootPrint = FindFootPrintMIRI(self, input_model, this_a, InstrumentInfo)
-                    amin, amax, bmin, bmax, lmin, lmax = ChannelFootPrint
-                    t1 = time.time()
 
-                log.info("Time find foot print = %.1f.s" % (t1 - t0,))
-# If a dither offset list exists then apply the dither offsets (offsets in arc seconds)
 
-                amin = amin - c1_offset/3600.0
-                amax = amax - c1_offset/3600.0
+#********************************************************************************
+def DetermineCubeSize(self, Cube, MasterTable, InstrumentInfo):
+#********************************************************************************
+    """
+    Short Summary
+    -------------
+    Function to determine the min and max coordinates of the spectral cube,given channel & subchannel
 
-                bmin = bmin - c2_offset/3600.0
-                bmax = bmax - c2_offset/3600.0
+    Parameter
+    ----------
+    Cube: class the holds the basic paramters of the IFU cube to be created
+    MasterTable:  A table that contains the channel/subchannel or filter/grating for each input file
+    InstrumentInfo: Default information on the MIRI and NIRSPEC instruments. This information might
+                    contained in a different file in the future. Probably a reference file
+
+    Returns
+    -------
+    Cube Dimension Information:
+
+    Footprint of cube: min and max of coordinates of cube. If an offset list is provided then these values are applied.
+    if the coordinate system is alpha-beta (MIRI) then min and max coordinates of alpha (arc sec),
+    beta (arc sec) and lambda (microns) 
+    if the coordinate system is ra-dec then the min and max of ra(degress), dec (degrees) and lambda (microns)
+    is returned. 
+
+
+    """
+    self.log.info('Number of bands in cube  %i', 
+                              self.metadata['num_bands'])
 
-                a_min.append(amin)
-                a_max.append(amax)
-                b_min.append(bmin)
-                b_max.append(bmax)
-                lambda_min.append(lmin)
-                lambda_max.append(lmax)
+    # each file find the min and max a and lambda, the files are independent
+    tasks = BandFileTasks(self, Cube, MasterTable)
+    footprints = list(RunTasks(self, FindFileFootPrint, tasks,
+                               (Cube, InstrumentInfo)))
+
+    a_min = [footprint[0] for footprint in footprints]
+    a_max = [footprint[1] for footprint in footprints]
+    b_min = [footprint[2] for footprint in footprints]
+    b_max = [footprint[3] for footprint in footprints]
+    lambda_min = [footprint[4] for footprint in footprints]
+    lambda_max = [footprint[5] for footprint in footprints]
 
 #________________________________________________________________________________
     # done looping over files determine final size of cube
@@ -372,245 +417,265 @@ def DetermineCubeSize(self, Cube, MasterTable, InstrumentInfo):
 
 
 #********************************************************************************
-def MapDetectorToCube(self, this_par1, this_par2, 
-                      Cube, spaxel, 
-                      PixelCloud, 
-                      MasterTable, 
-                      InstrumentInfo,
-                      IFUCube):
+def FindFileFootPrint(self, task, Cube, InstrumentInfo):
 #********************************************************************************
     """
     Short Summary
     -------------
-    Loop over files that cover the cube and map the detector pixel to Cube spaxels
-    If dither offsets have been supplied then apply those values to the data
+    Find the min and max coordinates of one input file of a band
+
+    Parameter
+    ----------
+    task: band, file and dither offsets, see BandFileTasks
+    Cube: class the holds the basic paramters of the IFU cube to be created
+    InstrumentInfo: Default information on the MIRI and NIRSPEC instruments.
+
+    Returns
+    -------
+    min and max of the coordinates of the file, with the dither offsets applied
+    """
+    instrument = Cube.instrument
+    this_a, this_b, file_no, ifile, c1_offset, c2_offset = task
+    self.log.info('Working on data  from %s,%s',this_a,this_b)
+
+#________________________________________________________________________________
+# Open the input data model
+    with datamodels.ImageModel(ifile) as input_model:
+        t0 = time.time()
+        if(instrument == 'NIRSPEC'):
+            flag_data = 0 
+            ChannelFootPrint = FindFootPrintNIRSPEC(self, input_model,flag_data)
+            amin, amax, bmin, bmax, lmin, lmax = ChannelFootPrint
+            t1 = time.time()
+#________________________________________________________________________________
+        if(instrument == 'MIRI'):
+            ChannelFootPrint = FindFootPrintMIRI(self, input_model, this_a, InstrumentInfo)
+            amin, amax, bmin, bmax, lmin, lmax = ChannelFootPrint
+            t1 = time.time()
+
+        log.info("Time find foot print = %.1f.s" % (t1 - t0,))
+# If a dither offset list exists then apply the dither offsets (offsets in arc seconds)
+
+    amin = amin - c1_offset/3600.0
+    amax = amax - c1_offset/3600.0
+
+    bmin = bmin - c2_offset/3600.0
+    bmax = bmax - c2_offset/3600.0
+
+    return amin, amax, bmin, bmax, lmin, lmax
+#________________________________________________________________________________
+
+
+#********************************************************************************
+def MapDetectorToCube(self, Cube, MasterTable, InstrumentInfo):
+#********************************************************************************
+    """
+    Short Summary
+    -------------
+    Map the detector pixels of the files of all of the bands that cover the cube to
+    the Cube spaxels. Each band and file is mapped independently (in parallel if
+    maximum_cores allows), the sums of the weights and weighted fluxes found for
+    each file are added up.
 
     Parameter
     ----------
     
     Cube - contains the basic header information of Cube
-    spaxel: List of Spaxels
+    MasterTable:  A table that contains the channel/subchannel or filter/grating for each input file
+    InstrumentInfo: Default information on the MIRI and NIRSPEC instruments.
+
+    Returns
+    -------
+    weight_sum, value_sum, count: sums of the weights and of the weighted fluxes
+    of the detector pixels contributing to each spaxel and the number of
+    contributions, as flat arrays over the cube spaxels
+    """
+    tasks = BandFileTasks(self, Cube, MasterTable)
+    log.info('Number of files in cube %i', len(tasks))
+
+    nspaxel = Cube.naxis1 * Cube.naxis2 * Cube.naxis3
+    weight_sum = np.zeros(nspaxel, dtype=np.float64)
+    value_sum = np.zeros(nspaxel, dtype=np.float64)
+    count = np.zeros(nspaxel, dtype=np.intp)
+
+    for file_sums in RunTasks(self, MapFileToCube, tasks, (Cube, InstrumentInfo)):
+        weight_sum += file_sums[0]
+        value_sum += file_sums[1]
+        count += file_sums[2]
+
+    return weight_sum, value_sum, count
+
+
+#********************************************************************************
+def MapFileToCube(self, task, Cube, InstrumentInfo):
+#********************************************************************************
+    """
+    Short Summary
+    -------------
+    Map the detector pixels of one file of a band to the cube spaxels
+    If dither offsets have been supplied then apply those values to the data
+
+    Parameter
+    ----------
+    task: band, file and dither offsets, see BandFileTasks
+    Cube - contains the basic header information of Cube
+    InstrumentInfo: Default information on the MIRI and NIRSPEC instruments.
 
     Returns
     -------
+    weight_sum, value_sum, count of the spaxels for this file, see MapDetectorToCube
     if(interpolation = area - only valid for alpha-beta
+    the pixels are weighted by their overlap with the spaxels
     or
     if(interpolation = pointcloud
+    the pixels are weighted by their distance to the spaxel centers within the ROI
     """
 
     instrument = Cube.instrument
-    nfiles = len(MasterTable.FileMap[instrument][this_par1][this_par2])
-    log.info('Number of files in cube %i', nfiles)
+    this_par1, this_par2, file_no, ifile, c1_offset, c2_offset = task
+    self.log.info("Working on Band defined by:%s %s " ,this_par1,this_par2)
 
-    # loop over the files that cover the spectral range the cube is for
-    
-    for k in range(nfiles):
-        ifile = MasterTable.FileMap[instrument][this_par1][this_par2][k]
-        
-        ioffset = len(MasterTable.FileOffset[this_par1][this_par2]['C1'])
-        Cube.file.append(ifile)
-        c1_offset = 0.0
-        c2_offset = 0.0
-        # c1_offset and c2_offset are the dither offset sets (in arc seconds)
-        # by default these are zer0. The user has to supply these 
-        if(ioffset == nfiles):
-            c1_offset = MasterTable.FileOffset[this_par1][this_par2]['C1'][k]
-            c2_offset = MasterTable.FileOffset[this_par1][this_par2]['C2'][k]
+    # the store of the point cloud members (or detector pixels) contributing
+    # to each spaxel, and the point cloud of the file: 10 rows, one column for
+    # each detector pixel
+    spaxel = cube.SpaxelStore(Cube.naxis1 * Cube.naxis2 * Cube.naxis3)
+    PixelCloud = np.zeros(shape=(10, 0))
+
+    Cube.file[file_no] = ifile
 
 # Open the input data model
-        with datamodels.ImageModel(ifile) as input_model:
+    with datamodels.ImageModel(ifile) as input_model:
 
 #********************************************************************************
-            if(instrument == 'MIRI'):
-                v2ab_transform = input_model.meta.wcs.get_transform('v2v3', 
-                                                                    'alpha_beta')
-                wave_weights = CubeCloud.FindWaveWeights(this_par1, this_par2)
-                worldtov23 = input_model.meta.wcs.get_transform("world","v2v3")
+        if(instrument == 'MIRI'):
+            v2ab_transform = input_model.meta.wcs.get_transform('v2v3', 
+                                                                'alpha_beta')
+            wave_weights = CubeCloud.FindWaveWeights(this_par1, this_par2)
+            worldtov23 = input_model.meta.wcs.get_transform("world","v2v3")
 
             # for each file we need information that will be the same for all
             # the pixels on the image.
             # For MIRI this information is used in the weight scheme on how to 
             # combine the surface brightness information. The Cube class stores 
-            # these paramters as a series of lists.  
-
-                Cube.a_wave.append(wave_weights[0])
-                Cube.c_wave.append(wave_weights[1])
-                Cube.a_weight.append(wave_weights[2])
-                Cube.c_weight.append(wave_weights[3])
-                Cube.transform_worldtov23.append(worldtov23) 
-                Cube.transform_v23toab.append(v2ab_transform)
+            # these paramters keyed by the file number.  
+
+            Cube.a_wave[file_no] = wave_weights[0]
+            Cube.c_wave[file_no] = wave_weights[1]
+            Cube.a_weight[file_no] = wave_weights[2]
+            Cube.c_weight[file_no] = wave_weights[3]
+            Cube.transform_worldtov23[file_no] = worldtov23
+            Cube.transform_v23toab[file_no] = v2ab_transform
 #________________________________________________________________________________
 # Standard method 
-                if(self.interpolation == 'pointcloud'):
-                    xstart, xend = InstrumentInfo.GetMIRISliceEndPts(this_par1)
-                    y, x = np.mgrid[:1024, xstart:xend]
-                    y = np.reshape(y, y.size)
-                    x = np.reshape(x, x.size)
+            if(self.interpolation == 'pointcloud'):
+                xstart, xend = InstrumentInfo.GetMIRISliceEndPts(this_par1)
                     
-                    t0 = time.time()
-                    cloud = CubeCloud.MakePointCloudMIRI(self,input_model,
-                                                         x, y, k, 
-                                                         Cube,
-                                                        c1_offset, c2_offset)
-                    n = PixelCloud.size
-                    if(n == 10):  # If first time
-                        PixelCloud = cloud
-                    else:    #  add information for another slice  to the  PixelCloud
-
-                        PixelCloud = np.hstack((PixelCloud, cloud))
-
-                    t1 = time.time()
-                    log.debug("Time Map one Channel from 1 file  to Cloud = %.1f.s" 
-                              % (t1 - t0,))
+                t0 = time.time()
+                cloud = CubeCloud.MakePointCloudMIRI(self,input_model,
+                                                     xstart, xend, file_no, 
+                                                     Cube,
+                                                     c1_offset, c2_offset)
+                PixelCloud = np.hstack((PixelCloud, cloud))
+
+                t1 = time.time()
+                log.debug("Time Map one Channel from 1 file  to Cloud = %.1f.s" 
+                          % (t1 - t0,))
 #________________________________________________________________________________
 #2D area method - only works for single files and coord_system = 'alpha-beta'
-                if(self.interpolation == 'area'):
-                    det2ab_transform = input_model.meta.wcs.get_transform('detector', 
-                                                                      'alpha_beta')
-                    start_region = InstrumentInfo.GetStartSlice(this_par1)
-                    end_region = InstrumentInfo.GetEndSlice(this_par1)
-                    regions = list(range(start_region, end_region + 1))
+            if(self.interpolation == 'area'):
+                det2ab_transform = input_model.meta.wcs.get_transform('detector', 
+                                                                  'alpha_beta')
+                start_region = InstrumentInfo.GetStartSlice(this_par1)
+                end_region = InstrumentInfo.GetEndSlice(this_par1)
+                regions = list(range(start_region, end_region + 1))
 
-                    for i in regions:
-                        log.info('Working on Slice # %d', i)
+                for i in regions:
+                    log.info('Working on Slice # %d', i)
 
-                        y, x = (det2ab_transform.label_mapper.mapper == i).nonzero()
+                    y, x = (det2ab_transform.label_mapper.mapper == i).nonzero()
 
-                    # spaxel object holds all needed information in a set of lists
-                    #    flux (of overlapping detector pixel)
-                    #    error (of overlapping detector pixel)
-                    #    overlap ratio
-                    #    beta distance
+                    # the pixels of the slice are added to the PixelCloud and
+                    # spaxel records the overlap ratio of each pixel overlapping
+                    # a spaxel
 
 # getting pixel corner - ytop = y + 1 (routine fails for y = 1024)
-                        index = np.where(y < 1023) 
-                        y = y[index]
-                        x = x[index]
-                        t0 = time.time()
-
-                        beta_width = Cube.Cdelt2
-                        CubeOverlap.SpaxelOverlap(self, x, y, i, 
-                                                  start_region, 
-                                                  input_model, 
-                                                  det2ab_transform, 
-                                                  beta_width, 
-                                                  Cube, spaxel)
-                        t1 = time.time()
-                        log.debug("Time Map one Slice  to Cube = %.1f.s" % (t1 - t0,))
+                    index = np.where(y < 1023) 
+                    y = y[index]
+                    x = x[index]
+                    t0 = time.time()
+
+                    beta_width = Cube.Cdelt2
+                    cloud = CubeOverlap.SpaxelOverlap(self, x, y, i, 
+                                                      start_region, 
+                                                      input_model, 
+                                                      det2ab_transform, 
+                                                      beta_width, 
+                                                      Cube, spaxel,
+                                                      file_no, PixelCloud.shape[1])
+                    PixelCloud = np.hstack((PixelCloud, cloud))
+                    t1 = time.time()
+                    log.debug("Time Map one Slice  to Cube = %.1f.s" % (t1 - t0,))
 
 #********************************************************************************
-            elif(instrument == 'NIRSPEC'):
+        elif(instrument == 'NIRSPEC'):
 # each file, detector has 30 slices - wcs information access seperately for each slice 
-                start_slice = 0
-                end_slice = 29
-                nslices = end_slice - start_slice + 1
-                regions = list(range(start_slice, end_slice + 1))
-
-                for i in regions:
+            start_slice = 0
+            end_slice = 29
+            nslices = end_slice - start_slice + 1
+            regions = list(range(start_slice, end_slice + 1))
 
+            for i in regions:
 
-                    t0 = time.time()
-                    cloud = CubeCloud.MakePointCloudNIRSPEC(self,input_model,
-                                                            k,
-                                                            i,
-                                                            Cube,
-                                                            c1_offset, c2_offset)
-
+                t0 = time.time()
+                cloud = CubeCloud.MakePointCloudNIRSPEC(self,input_model,
+                                                        file_no,
+                                                        i,
+                                                        Cube,
+                                                        c1_offset, c2_offset)
 
-                    n = PixelCloud.size
-                    if(n == 10):  # If first time
-                        PixelCloud = cloud
-                    else:    #  add information for another slice  to the  PixelCloud
-                        PixelCloud = np.hstack((PixelCloud, cloud))
+                PixelCloud = np.hstack((PixelCloud, cloud))
 
-                    t1 = time.time()
-                    log.debug("Time Map one NIRSPEC slice  to Cloud = %.1f.s" % (t1 - t0,))
+                t1 = time.time()
+                log.debug("Time Map one NIRSPEC slice  to Cloud = %.1f.s" % (t1 - t0,))
 
 #________________________________________________________________________________
+# Mapped the file to the Point Cloud, find the spaxels within the ROI of each
+# member of the cloud
 
-    return PixelCloud
+    if self.interpolation == 'pointcloud':
+        t0 = time.time()
+        CubeCloud.FindROI(self, Cube, spaxel, PixelCloud)
+        t1 = time.time()
+        log.info("Time to find the ROI = %.1f.s" % (t1 - t0,))
+
+    weight_sum, value_sum = spaxel.sums(PixelCloud[5])
+    return weight_sum, value_sum, spaxel.counts()
 
 
 #********************************************************************************
-def FindCubeFlux(self, Cube, spaxel, PixelCloud):
+def FindCubeFlux(self, Cube, weight_sum, value_sum):
 #********************************************************************************
     """
     Short Summary
     -------------
-    Depending on the interpolation method, find the flux for each spaxel value
+    Find the flux for each spaxel value
 
     Parameter
     ----------
     Cube - contains the basic header information of Cube
-    spaxel: List of Spaxels
-    PixelCloud - pixel point cloud, only filled in if doing 3-D interpolation
+    weight_sum, value_sum: sums of the weights and of the weighted fluxes of the
+    detector pixels contributing to each spaxel, see MapDetectorToCube
 
     Returns
     -------
-    if(interpolation = area) flux determined for each spaxel
+    flux of each spaxel, as a (naxis3, naxis2, naxis1) array:
+    if(interpolation = area) the pixel fluxes weighted by their overlap with the spaxel
     or
     if(interpolation = pointcloud) flux determined for each spaxel based on interpolation of PixelCloud
     """
+    flux = cube.WeightedMean(weight_sum, value_sum)
 
-
-
-    if self.interpolation == 'area':
-        nspaxel = len(spaxel)
-
-        for i in range(nspaxel):
-            s = len(spaxel[i].pixel_overlap)
-            if(s > 0):
-                CubeOverlap.SpaxelFlux(self.roi2, i, Cube, spaxel)
-
-    elif self.interpolation == 'pointcloud':
-        icube = 0
-        t0 = time.time()
-        iz = 0
-
-        for z in Cube.zcoord:
-            iy = 0
-
-            for y in Cube.ycoord:
-                ix = 0
-                for x in Cube.xcoord:
-                    num = len(spaxel[icube].ipointcloud)
-
-                    if(num > 0):
-                        pointcloud_index = spaxel[icube].ipointcloud
-                        weightpt = spaxel[icube].pointcloud_weight
-                        pixelflux = PixelCloud[5, pointcloud_index]
-
-                        weight = 0
-                        value = 0
-                        for j in range(num):
-                            weight = weight + weightpt[j]
-                            value = value + (weightpt[j] * pixelflux[j])
-#                            if(iz == 39 or iz == 40 ):
-#                                if(ix == 14 and iy == 16): 
-#                                    print('Checking ', icube, ix, iy, iz)
-#                                    print('icube', icube)
-#                                    print('pointcloud', pointcloud_index[j])
-#                                    print('flux = {0:.5f}'.format(pixelflux[j]))
-#                                    print('w', weightpt[j])
-#                                    print(' ',weightpt[j] * pixelflux[j])
-#                                    print('num',num)
-
-
-                        if(weight != 0):
-                            value = value / weight
-                            spaxel[icube].flux = value
-#                            if(iz == 39 or iz == 40 ):
-#                                if(ix == 14 and iy == 16): 
-#                                    print('Final Flux', value* weight, weight, value,num)
-
-
-                    icube = icube + 1
-                    ix = ix + 1
-                iy = iy + 1
-            iz = iz + 1
-
-        t1 = time.time()
-        log.info("Time to interpolate at spaxel values = %.1f.s" % (t1 - t0,))
+    return np.reshape(flux, (Cube.naxis3, Cube.naxis2, Cube.naxis1))
 
 
 #________________________________________________________________________________
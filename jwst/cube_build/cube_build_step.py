@@ -40,6 +40,7 @@ class CubeBuildStep (Step):
          waveslice = float(default=0.0)
          xdebug = integer(default=0)
          ydebug = integer(default=0) 
+         maximum_cores = option('none', 'quarter', 'half', 'all', default='none') # max number of processes mapping the input files to the cube, as a fraction of the cores
        """
 
     def process(self, input):
@@ -229,74 +230,24 @@ class CubeBuildStep (Step):
                               self.roi1, self.roi2, self.roiw)
 
 
-            # now you have the size of cube - create an instance for each spaxel
-            # create an empty spaxel list - this will become a list of Spaxel classses
-        spaxel = []
-
-            # set up center of the corner cube spaxel
-        t0 = time.time()
-        for z in range(Cube.naxis3):
-            for y in range(Cube.naxis2):
-                for x in range(Cube.naxis1):
-                    spaxel.append(cube.Spaxel(Cube.xcoord[x], 
-                                              Cube.ycoord[y], 
-                                              Cube.zcoord[z]))                        
-        t1 = time.time()
-#        print("Time to create list of spaxel classes = %.1f.s" % (t1 - t0,))
-
-        # create an empty Pixel Cloud array of 10 columns
-        # if doing interpolation on point cloud this will become a matrix of  Pixel Point cloud values
-        # each row holds information for a single pixel
-
-        # Initialize the PixelCloud to 10   columns of zeros (1 row)
-        PixelCloud = np.zeros(shape=(10, 1))
         t0 = time.time()
-        # now need to loop over every file that covers this channel/subchannel (MIRI) or Grating/filter(NIRSPEC)
-        #and map the detector pixels to the cube spaxel.
-        if(instrument == 'MIRI'):
-            parameter1 = Cube.channel
-            parameter2 = Cube.subchannel
-        elif(instrument == 'NIRSPEC'):
-            parameter1 = Cube.grating
-            parameter2 = Cube.filter
-
-        number_bands = len(parameter1)
-        for i in range(number_bands):
-            this_par1 = parameter1[i]
-            this_par2 = parameter2[i]            
-            
-            self.log.info("Working on Band defined by:%s %s " ,this_par1,this_par2)
-
-            PixelCloud = cube_build.MapDetectorToCube(self, 
-                                                      this_par1, this_par2, 
-                                                      Cube, spaxel, 
-                                                      PixelCloud,
-                                                      MasterTable, 
-                                                      InstrumentInfo,
-                                                      IFUCube)
+        # now need to map every file that covers the channel/subchannel (MIRI) or
+        # Grating/filter(NIRSPEC) bands of the cube to the cube spaxels.
+        # The files are mapped independently, in parallel if maximum_cores allows
+        weight_sum, value_sum, weightmap = cube_build.MapDetectorToCube(self, Cube,
+                                                                        MasterTable,
+                                                                        InstrumentInfo)
 
         t1 = time.time()
         self.log.info("Time Map All slices on Detector to Cube = %.1f.s" % (t1 - t0,))
 
 #_______________________________________________________________________
-# Mapped all data to cube or Point Cloud
+# Mapped all data to cube
 # now determine Cube Spaxel flux
 
-        t0 = time.time()
-        if self.interpolation == 'pointcloud':
-            CubeCloud.FindROI(self, Cube, spaxel, PixelCloud)
-        t1 = time.time()
-        self.log.info("Time to find the ROI = %.1f.s" % (t1 - t0,))
-
-
-        t0 = time.time()
-        cube_build.FindCubeFlux(self, Cube, spaxel, PixelCloud)
-
-        t1 = time.time()
-        self.log.info("Time find Cube Flux= %.1f.s" % (t1 - t0,))
-
+        flux = cube_build.FindCubeFlux(self, Cube, weight_sum, value_sum)
 
-        result = cube_model.UpdateIFUCube(self, Cube,IFUCube, spaxel)
+        result = cube_model.UpdateIFUCube(self, Cube,IFUCube, flux, weightmap)
 
 # write out the IFU cube
         if self.CubeType == 'File' or self.CubeType =='ASN' :
@@ -32,7 +32,6 @@ def SetUpIFUCube(self,Cube):
     Parameters
     ----------
     Cube: holds meta data of cube
-    spaxel: list of spaxels in cube
 
 
     Returns
@@ -99,7 +98,7 @@ def SetUpIFUCube(self,Cube):
 
 
 #********************************************************************************
-def UpdateIFUCube(self, Cube,IFUCube, spaxel):
+def UpdateIFUCube(self, Cube,IFUCube, flux, weightmap):
 
 #********************************************************************************
     """
@@ -110,7 +109,8 @@ def UpdateIFUCube(self, Cube,IFUCube, spaxel):
     Parameters
     ----------
     Cube: holds meta data of cube
-    spaxel: list of spaxels in cube
+    flux: flux of the spaxels of the cube
+    weightmap: number of detector pixels contributing to each spaxel
 
 
     Returns
@@ -121,9 +121,8 @@ def UpdateIFUCube(self, Cube,IFUCube, spaxel):
     #pull out data into array
 
 
-    temp_flux =np.reshape(np.array([s.flux for s in spaxel]),
-                          [Cube.naxis3,Cube.naxis2,Cube.naxis1])
-    temp_wmap =np.reshape(np.array([len(s.ipointcloud) for s in spaxel]),
+    temp_flux = flux
+    temp_wmap =np.reshape(weightmap,
                           [Cube.naxis3,Cube.naxis2,Cube.naxis1])
     
     IFUCube.data = temp_flux
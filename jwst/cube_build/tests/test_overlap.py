@@ -0,0 +1,51 @@
+"""Test the batched polygon clipping used for the spaxel overlaps"""
+import warnings
+
+import numpy as np
+
+from .. import CubeOverlap
+
+
+def make_pixels(seed, npix=200):
+    # pixels of random orientation around spaxels of unit size, many of
+    # them only partly inside or outside their spaxel, and some axis
+    # aligned so that their sides are parallel to the spaxel sides
+    rng = np.random.RandomState(seed)
+    xcenter = rng.uniform(-5., 5., npix)
+    ycenter = rng.uniform(-5., 5., npix)
+    cx = xcenter + rng.uniform(-1.5, 1.5, npix)
+    cy = ycenter + rng.uniform(-1.5, 1.5, npix)
+    angle = rng.uniform(0., 2. * np.pi, npix)
+    angle[::4] = 0.
+    size = rng.uniform(0.2, 1.5, npix)
+    corners = angle[:, np.newaxis] + np.pi / 4 + np.arange(4) * np.pi / 2
+    radius = size[:, np.newaxis] / np.sqrt(2.)
+    xp_corner = cx[:, np.newaxis] + radius * np.cos(corners)
+    yp_corner = cy[:, np.newaxis] + radius * np.sin(corners)
+    return xcenter, ycenter, xp_corner, yp_corner
+
+
+def test_batch_matches_single():
+    xcenter, ycenter, xp_corner, yp_corner = make_pixels(1)
+    area = CubeOverlap.SH_FindOverlapBatch(xcenter, ycenter, 1., 1.,
+                                           xp_corner, yp_corner)
+    for i in range(len(xcenter)):
+        expected = CubeOverlap.SH_FindOverlap(xcenter[i], ycenter[i], 1., 1.,
+                                              xp_corner[i], yp_corner[i])
+        assert np.isclose(area[i], expected, rtol=1.e-7, atol=1.e-12)
+
+
+def test_batch_no_warnings():
+    # the rows of the clipped polygons are padded past their last vertex;
+    # the padding must not reach the arithmetic
+    xcenter, ycenter, xp_corner, yp_corner = make_pixels(2)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        with np.errstate(all='raise'):
+            area = CubeOverlap.SH_FindOverlapBatch(xcenter, ycenter, 1., 1.,
+                                                   xp_corner, yp_corner)
+            padded_x = np.array([[0., 1., 1., 0., np.nan, np.inf]])
+            padded_y = np.array([[0., 0., 1., 1., np.inf, np.nan]])
+            square = CubeOverlap.FindAreaPolyBatch([4], padded_x, padded_y)
+    assert np.all(np.isfinite(area))
+    assert square[0] == 1.
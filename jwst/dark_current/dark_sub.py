@@ -7,12 +7,15 @@ from __future__ import division
 import numpy as np
 import logging
 from .. import datamodels
+from ..lib import chunks
+from ..stpipe import reference_cache
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
 
 
-def do_correction(input_model, dark_model, dark_output=None):
+def do_correction(input_model, dark_model, dark_output=None, chunk_size=None,
+                  threads=1, dark_name=None):
     """
     Short Summary
     -------------
@@ -29,6 +32,16 @@ def do_correction(input_model, dark_model, dark_output=None):
     dark_output: string
         file name in which to optionally save averaged dark data
 
+    chunk_size: float
+        Size in MB of the blocks of rows the data are processed in
+
+    threads: int
+        Number of threads processing the blocks
+
+    dark_name: string
+        path of the dark reference file, used to cache the averaged dark
+        data made from it
+
     Returns
     -------
     output_model: data model object
@@ -36,12 +49,54 @@ def do_correction(input_model, dark_model, dark_output=None):
 
     """
 
+    # Create output as a copy of the input science data model
+    output_model = input_model.copy()
+
+    kernel = prepare_correction(output_model, dark_model, dark_output,
+                                dark_name)
+    chunks.apply_kernel(kernel, output_model, chunk_size, threads)
+
+    return output_model
+
+
+def prepare_correction(output_model, dark_model, dark_output=None,
+                       dark_name=None):
+    """
+    Short Summary
+    -------------
+    Prepare the Dark Current Subtraction of science data in place:
+    propagate the DQ flags of the dark, and get the operation that
+    subtracts the dark one block of the data at a time
+
+    Parameters
+    ----------
+    output_model: data model object
+        science data to be corrected in place
+
+    dark_model: dark model object
+        dark data
+
+    dark_output: string
+        file name in which to optionally save averaged dark data
+
+    dark_name: string
+        path of the dark reference file.  If given, the averaged dark data
+        are cached, for the exposures with the same group structure.
+
+    Returns
+    -------
+    kernel: ChunkKernel
+        the operation subtracting the dark from a block, or None if the
+        subtraction is skipped
+
+    """
+
     # Save some data params for easy use later
-    instrument = input_model.meta.instrument.name
-    sci_nints = input_model.data.shape[0]
-    sci_ngroups = input_model.data.shape[1]
-    sci_nframes = input_model.meta.exposure.nframes
-    sci_groupgap = input_model.meta.exposure.groupgap
+    instrument = output_model.meta.instrument.name
+    sci_nints = output_model.data.shape[0]
+    sci_ngroups = output_model.data.shape[1]
+    sci_nframes = output_model.meta.exposure.nframes
+    sci_groupgap = output_model.meta.exposure.groupgap
 
     if instrument == 'MIRI':
         drk_nints = dark_model.data.shape[0]
@@ -63,8 +118,8 @@ def do_correction(input_model, dark_model, dark_output=None):
         log.warning("There are more groups in the science data than in the " +
         "dark data.")
         log.warning("Input will be returned without subtracting dark current.")
-        input_model.meta.cal_step.dark_sub = 'SKIPPED'
-        return input_model.copy()
+        output_model.meta.cal_step.dark_sub = 'SKIPPED'
+        return None
 
     # Check that the value of nframes and groupgap in the dark
     # are not greater than those of the science data
@@ -72,8 +127,8 @@ def do_correction(input_model, dark_model, dark_output=None):
         log.warning("The value of nframes or groupgap in the dark data is " +
         "greater than that of the science data.")
         log.warning("Input will be returned without subtracting dark current.")
-        input_model.meta.cal_step.dark_sub = 'SKIPPED'
-        return input_model.copy()
+        output_model.meta.cal_step.dark_sub = 'SKIPPED'
+        return None
 
     # Replace NaN's in the dark with zeros
     dark_model.data[np.isnan(dark_model.data)] = 0.0
@@ -83,7 +138,7 @@ def do_correction(input_model, dark_model, dark_output=None):
     if sci_nframes == drk_nframes and sci_groupgap == drk_groupgap:
 
         # They match, so we can subtract the dark ref file data directly
-        output_model = subtract_dark(input_model, dark_model)
+        kernel = prepare_subtraction(output_model, dark_model)
 
     else:
 
@@ -92,12 +147,23 @@ def do_correction(input_model, dark_model, dark_output=None):
         # If the data are from MIRI, the darks are integration-dependent and
         # we average them with a seperate routine.
 
-        if instrument == 'MIRI':
-            averaged_dark = average_MIRIdark_frames(dark_model, sci_nints,
-                            sci_ngroups, sci_nframes, sci_groupgap)
+        def make_averaged_dark():
+            if instrument == 'MIRI':
+                return average_MIRIdark_frames(dark_model, sci_nints,
+                                sci_ngroups, sci_nframes, sci_groupgap)
+            else:
+                return average_dark_frames(dark_model, sci_ngroups,
+                                sci_nframes, sci_groupgap)
+
+        if dark_name is not None:
+            # A MIRI dark is averaged for as many of its integrations as
+            # the science data have
+            key = ('averaged_dark', instrument, min(sci_nints, drk_nints),
+                   sci_ngroups, sci_nframes, sci_groupgap)
+            averaged_dark = reference_cache.get_model(dark_name, key,
+                                                      make_averaged_dark)
         else:
-            averaged_dark = average_dark_frames(dark_model, sci_ngroups,
-                            sci_nframes, sci_groupgap)
+            averaged_dark = make_averaged_dark()
 
         # Save the frame-averaged dark data that was just created,
         # if requested by the user
@@ -106,13 +172,13 @@ def do_correction(input_model, dark_model, dark_output=None):
             averaged_dark.save(dark_output)
 
         # Subtract the frame-averaged dark data from the science data
-        output_model = subtract_dark(input_model, averaged_dark)
+        kernel = prepare_subtraction(output_model, averaged_dark)
 
         averaged_dark.close()
 
     output_model.meta.cal_step.dark_sub = 'COMPLETE'
 
-    return output_model
+    return kernel
 
 
 def average_dark_frames(input_dark, ngroups, nframes, groupgap):
@@ -267,7 +333,7 @@ def average_MIRIdark_frames(input_dark, nints, ngroups, nframes, groupgap):
     return avg_dark
 
 
-def subtract_dark(input, dark):
+def subtract_dark(input, dark, chunk_size=None, threads=1):
     """
     Subtracts dark current data from science arrays, combines
     error arrays in quadrature, and updates data quality array based on
@@ -281,6 +347,12 @@ def subtract_dark(input, dark):
     dark: dark model object
         the dark current data
 
+    chunk_size: float
+        Size in MB of the blocks of rows the data are processed in
+
+    threads: int
+        Number of threads processing the blocks
+
     Returns
     -------
     output: data model object
@@ -288,18 +360,45 @@ def subtract_dark(input, dark):
 
     """
 
-    instrument = input.meta.instrument.name
+    # Create output as a copy of the input science data model
+    output = input.copy()
+
+    kernel = prepare_subtraction(output, dark)
+    chunks.apply_kernel(kernel, output, chunk_size, threads)
+
+    return output
+
+
+def prepare_subtraction(output, dark):
+    """
+    Updates the data quality array of science data in place, based on
+    DQ flags in the dark arrays, and gets the operation that subtracts
+    dark current data from a block of the science arrays.
+
+    Parameters
+    ----------
+    output: data model object
+        the science data, corrected in place
+
+    dark: dark model object
+        the dark current data
+
+    Returns
+    -------
+    kernel: ChunkKernel
+        the operation subtracting the dark from a block
+
+    """
+
+    instrument = output.meta.instrument.name
     if instrument == 'MIRI':
         dark_nints = dark.data.shape[0]
     else:
         dark_nints = 1
 
     log.debug("subtract_dark: nints=%d, ngroups=%d, size=%d,%d",
-              input.data.shape[0], input.data.shape[1],
-              input.data.shape[2], input.data.shape[3])
-
-    # Create output as a copy of the input science data model
-    output = input.copy()
+              output.data.shape[0], output.data.shape[1],
+              output.data.shape[2], output.data.shape[3])
 
     if instrument == 'MIRI':
         # MIRI dark reference file has a DQ plane for each integration,
@@ -312,27 +411,26 @@ def subtract_dark(input, dark):
         darkdq = dark.dq
 
     # Combine the dark and science DQ data
-    output.pixeldq = np.bitwise_or(input.pixeldq, darkdq)
+    output.pixeldq = np.bitwise_or(output.pixeldq, darkdq)
 
-    # loop over all integrations and groups in input science data
-    for i in range(input.data.shape[0]):
+    data = output.data
+    ngroups = data.shape[1]
+    dark_data = dark.data
 
+    # Subtract the dark from each block of rows of each integration
+    # in the science data
+    def subtract_chunk(chunk):
         if instrument == 'MIRI':
-            if i < dark_nints:
-                dark_int = dark.data[i]
-            else:
-                dark_int = dark.data[dark_nints - 1]
+            dark_int = dark_data[min(chunk.integration, dark_nints - 1)]
+        else:
+            dark_int = dark_data
 
-        for j in range(input.data.shape[1]):
-            # subtract the SCI arrays
-            if instrument == 'MIRI':
-                output.data[i, j] -= dark_int[j]
-            else:
-                output.data[i, j] -= dark.data[j]
+        # subtract the SCI arrays
+        chunk.science(data)[...] -= chunk.rows_of(dark_int[:ngroups])
 
-            # combine the ERR arrays in quadrature
-            # NOTE: currently stubbed out until ERR handling is decided
-            #output.err[i,j] = np.sqrt(
-            #           output.err[i,j]**2 + dark.err[j]**2)
+        # combine the ERR arrays in quadrature
+        # NOTE: currently stubbed out until ERR handling is decided
+        #output.err[i,j] = np.sqrt(
+        #           output.err[i,j]**2 + dark.err[j]**2)
 
-    return output
+    return chunks.ChunkKernel(subtract_chunk)
@@ -35,7 +35,7 @@ import numpy as np
 from os.path import basename
 from astropy.extern import six
 
-from .model_base import DataModel
+from .model_base import DataModel, deferred_validation
 from .amilg import AmiLgModel
 from .asn import AsnModel
 from .combinedspec import CombinedSpecModel
@@ -158,6 +158,15 @@ class ModelContainer(model_base.DataModel):
 
             model.meta.group_id = group_id
 
+    def validate(self):
+        """
+        Validates the deferred changes of the container and of each of
+        its models.
+        """
+        super(ModelContainer, self).validate()
+        for model in self._models:
+            model.validate()
+
     def copy(self):
         """
         Returns a deep copy of the models in this model container.
@@ -3,10 +3,14 @@
 from __future__ import absolute_import, division, unicode_literals, print_function
 
 import datetime
+import functools
 import os
 import re
+import threading
 import warnings
 
+from collections import OrderedDict
+
 import numpy as np
 
 import jsonschema
@@ -203,6 +207,35 @@ def _assert_non_primary_hdu(hdu_name):
 # WRITER
 
 
+# The plans compiled from the schemas by walking them, so that loading
+# and saving a model does not walk its schema again.  They are keyed by
+# the id of the schema; each entry holds on to its schema, so that the id
+# cannot be reused while the entry is cached.  Schemas are assumed not to
+# be modified in place once they are used to load or save a model.
+_PLAN_CACHE_SIZE = 64
+_load_plans = OrderedDict()
+_tag_plans = OrderedDict()
+_plan_lock = threading.Lock()
+
+
+def _get_plan(cache, schema, compile_plan):
+    key = id(schema)
+    with _plan_lock:
+        entry = cache.pop(key, None)
+        if entry is not None and entry[0] is schema:
+            # Move it to the end, as the most recently used
+            cache[key] = entry
+            return entry[1]
+
+    plan = compile_plan(schema)
+
+    with _plan_lock:
+        cache[key] = (schema, plan)
+        while len(cache) > _PLAN_CACHE_SIZE:
+            cache.popitem(last=False)
+    return plan
+
+
 def _fits_comment_section_handler(validator, properties, instance, schema):
     if not validator.is_type(instance, "object"):
         return
@@ -379,6 +412,19 @@ def _save_history(hdulist, tree):
         hdulist[0].header['HISTORY'] = history[i]['description']
 
 
+def _compile_tag_plan(schema):
+    # The (path, tag) pairs of the tagged entries of the schema
+    plan = []
+
+    def callback(subschema, path, combiner, ctx, recurse):
+        tag = subschema.get('tag')
+        if tag is not None:
+            plan.append((path, tag))
+
+    mschema.walk_schema(schema, callback)
+    return plan
+
+
 def _tag_values(tree, schema):
     # Replace tag value in tree with tagged versions
 
@@ -388,21 +434,18 @@ def _tag_values(tree, schema):
         else:
             return part in cursor
 
-    def callback(subschema, path, combiner, ctx, recurse):
-        tag = subschema.get('tag')
-        if tag is not None:
-            cursor = tree
-            for part in path[:-1]:
-                if included(cursor, part):
-                    cursor = cursor[part]
-                else:
-                    return
+    for path, tag in _get_plan(_tag_plans, schema, _compile_tag_plan):
+        cursor = tree
+        for part in path[:-1]:
+            if included(cursor, part):
+                cursor = cursor[part]
+            else:
+                break
+        else:
             part = path[-1]
             if included(cursor, part):
                 cursor[part] = tagged.tag_object(tag, cursor[part])
 
-    mschema.walk_schema(schema, callback)
-
 
 def to_fits(tree, schema, extensions=None):
     hdulist = fits.HDUList()
@@ -463,6 +506,43 @@ def _fits_array_loader(hdulist, schema, hdu_index, known_datas):
     return data2
 
 
+def _validation_schema(schema):
+    # The standalone schema used to validate a single loaded value
+    temp_schema = {
+        '$schema':
+        'http://stsci.edu/schemas/asdf-schema/0.1.0/asdf-schema'}
+    temp_schema.update(schema)
+    return temp_schema
+
+
+def _fits_validated_array_loader(hdulist, schema, hdu_index, known_datas,
+                                 temp_schema=None):
+    result = _fits_array_loader(hdulist, schema, hdu_index, known_datas)
+    if result is not None:
+        if temp_schema is None:
+            temp_schema = _validation_schema(schema)
+        asdf_schema.validate(result, schema=temp_schema)
+    return result
+
+
+def _fits_lazy_array_loader(hdulist, schema, hdu_index, known_datas, path,
+                            tree, lazy_arrays, temp_schema=None):
+    # Register a loader for the array instead of reading it.  The HDU is
+    # still marked as known, so that _load_extra_fits doesn't read it.
+    hdu_name = _get_hdu_name(schema)
+    _assert_non_primary_hdu(hdu_name)
+    try:
+        hdu = get_hdu(hdulist, hdu_name, hdu_index)
+    except AttributeError:
+        return
+
+    known_datas.add(hdu)
+    parent = properties.get_parent(path, tree)
+    loader = functools.partial(_fits_validated_array_loader, hdulist, schema,
+                               hdu_index, set(), temp_schema)
+    lazy_arrays[(id(parent), path[-1])] = (parent, loader)
+
+
 def _schema_has_fits_hdu(schema):
     has_fits_hdu = [False]
 
@@ -473,24 +553,56 @@ def _schema_has_fits_hdu(schema):
     return has_fits_hdu[0]
 
 
-def _load_from_schema(hdulist, schema, tree, validate=True,
-                      pass_invalid_values=False):
-    known_keywords = {}
-    known_datas = set()
+def _compile_load_plan(schema):
+    # Walk the schema once, recording what _load_from_plan has to do in
+    # the order of the walk.  The entries are
+    #   ('keyword', path, subschema, validation schema)
+    #   ('array', path, subschema, validation schema)
+    #   ('items', path, plan of the items schema)
+    # where an 'items' entry is repeated for every HDU of the file.
+    plan = []
 
     def callback(schema, path, combiner, ctx, recurse):
-        result = None
-
         if 'fits_keyword' in schema:
+            plan.append(
+                ('keyword', path, schema, _validation_schema(schema)))
+
+        elif 'fits_hdu' in schema and (
+                'max_ndim' in schema or 'ndim' in schema or 'datatype' in schema):
+            plan.append(
+                ('array', path, schema, _validation_schema(schema)))
+
+        if schema.get('type') == 'array':
+            has_fits_hdu = _schema_has_fits_hdu(schema)
+            if has_fits_hdu:
+                plan.append(
+                    ('items', path, _compile_load_plan(schema['items'])))
+                return True
+
+    mschema.walk_schema(schema, callback)
+    return plan
+
+
+def _load_from_plan(plan, hdulist, tree, known_keywords, known_datas,
+                    validate, pass_invalid_values, lazy_arrays,
+                    hdu_index=None, prefix=[]):
+    for entry in plan:
+        kind = entry[0]
+        path = prefix + entry[1]
+
+        if kind == 'items':
+            for i in range(len(hdulist)):
+                _load_from_plan(
+                    entry[2], hdulist, tree, known_keywords, known_datas,
+                    validate, pass_invalid_values, lazy_arrays,
+                    hdu_index=i, prefix=path + [i])
+
+        elif kind == 'keyword':
+            schema, temp_schema = entry[2:]
             fits_keyword = schema['fits_keyword']
             result = _fits_keyword_loader(
-                hdulist, fits_keyword, schema,
-                ctx.get('hdu_index'), known_keywords)
+                hdulist, fits_keyword, schema, hdu_index, known_keywords)
             if result is not None:
-                temp_schema = {
-                    '$schema':
-                    'http://stsci.edu/schemas/asdf-schema/0.1.0/asdf-schema'}
-                temp_schema.update(schema)
                 try:
                     asdf_schema.validate(result, schema=temp_schema)
                 except jsonschema.ValidationError:
@@ -504,29 +616,27 @@ def _load_from_schema(hdulist, schema, tree, validate=True,
                 else:
                     properties.put_value(path, result, tree)
 
-        elif 'fits_hdu' in schema and (
-                'max_ndim' in schema or 'ndim' in schema or 'datatype' in schema):
-            result = _fits_array_loader(
-                hdulist, schema, ctx.get('hdu_index'), known_datas)
-            if result is not None:
-                temp_schema = {
-                    '$schema':
-                    'http://stsci.edu/schemas/asdf-schema/0.1.0/asdf-schema'}
-                temp_schema.update(schema)
-                asdf_schema.validate(result, schema=temp_schema)
-                properties.put_value(path, result, tree)
+        else:
+            schema, temp_schema = entry[2:]
+            if lazy_arrays is not None:
+                _fits_lazy_array_loader(
+                    hdulist, schema, hdu_index, known_datas,
+                    path, tree, lazy_arrays, temp_schema)
+            else:
+                result = _fits_validated_array_loader(
+                    hdulist, schema, hdu_index, known_datas, temp_schema)
+                if result is not None:
+                    properties.put_value(path, result, tree)
 
-        if schema.get('type') == 'array':
-            has_fits_hdu = _schema_has_fits_hdu(schema)
-            if has_fits_hdu:
-                for i in range(len(hdulist)):
-                    recurse(schema['items'],
-                            path + [i],
-                            combiner,
-                            {'hdu_index': i})
-                return True
 
-    mschema.walk_schema(schema, callback)
+def _load_from_schema(hdulist, schema, tree, validate=True,
+                      pass_invalid_values=False, lazy_arrays=None):
+    known_keywords = {}
+    known_datas = set()
+
+    plan = _get_plan(_load_plans, schema, _compile_load_plan)
+    _load_from_plan(plan, hdulist, tree, known_keywords, known_datas,
+                    validate, pass_invalid_values, lazy_arrays)
     return known_keywords, known_datas
 
 
@@ -568,12 +678,21 @@ def _load_history(hdulist, tree):
 
 
 def from_fits(hdulist, schema, extensions=None, validate=True,
-              pass_invalid_values=False):
+              pass_invalid_values=False, lazy_arrays=None):
+    """
+    Load the object tree of a model from a FITS file.
+
+    If `lazy_arrays` is a dict, the arrays described by the schema are not
+    read.  Instead, for each array, an entry mapping
+    ``(id(parent), name)`` to ``(parent, loader)`` is added to
+    `lazy_arrays`, where ``parent`` is the node of the tree that will hold
+    the array, and calling ``loader()`` reads and returns it.
+    """
     ff = fits_embed.AsdfInFits.open(hdulist, extensions=extensions)
 
     known_keywords, known_datas = _load_from_schema(
         hdulist, schema, ff.tree, validate,
-        pass_invalid_values=pass_invalid_values)
+        pass_invalid_values=pass_invalid_values, lazy_arrays=lazy_arrays)
     _load_extra_fits(hdulist, known_keywords, known_datas, ff.tree)
     _load_history(hdulist, ff.tree)
 
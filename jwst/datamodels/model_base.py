@@ -4,15 +4,20 @@ Data model class heirarchy
 """
 from __future__ import absolute_import, unicode_literals, division, print_function
 
+import contextlib
 import copy
 import datetime
+import functools
 import inspect
 import os
 import sys
+import threading
 import warnings
 
 import numpy as np
 
+import jsonschema
+
 from astropy.extern import six
 from astropy.io import fits
 from astropy.time import Time
@@ -34,6 +39,57 @@ from gwcs.extension import GWCSExtension
 
 jwst_extensions = [GWCSExtension(), JWSTExtension(), BaseExtension()]
 
+# The flattened schemas of the model classes, keyed by class and schema
+# path, so that they are loaded once and the plans fits_support compiles
+# from them are reused.
+_schema_cache = {}
+
+# The number of deferred_validation blocks the current thread is in.
+_deferred_validation = threading.local()
+
+
+@contextlib.contextmanager
+def deferred_validation():
+    """
+    Context manager in which the changes made to data models are not
+    validated against their schemas when they are made, but by the
+    `DataModel.validate` method of each model, as for models created with
+    ``defer_validation=True``.  It applies to the current thread only.
+
+    `Step.run` runs the `process` method of steps in such a block, so that
+    steps setting many metadata values validate each of them only once,
+    after `process` returns.
+    """
+    depth = getattr(_deferred_validation, 'depth', 0)
+    _deferred_validation.depth = depth + 1
+    try:
+        yield
+    finally:
+        _deferred_validation.depth = depth
+
+
+def _iter_dict_arrays(node):
+    # Yields the (parent, key, array) of the arrays held by the dicts of a tree
+    if isinstance(node, dict):
+        for key, val in six.iteritems(node):
+            if isinstance(val, np.ndarray):
+                yield node, key, val
+            else:
+                for item in _iter_dict_arrays(val):
+                    yield item
+    elif isinstance(node, list):
+        for val in node:
+            for item in _iter_dict_arrays(val):
+                yield item
+
+
+def _copy_loaded(loader):
+    # Loads an array for a copy of a lazily opened model.  The loader of
+    #   the original model may return an array it also returns to that
+    #   model, such as the data of a memory mapped FITS HDU.
+    return copy.deepcopy(loader())
+
+
 class DataModel(properties.ObjectNode):
     """
     Base class of all of the data models.
@@ -41,7 +97,8 @@ class DataModel(properties.ObjectNode):
     schema_url = "core.schema.yaml"
 
     def __init__(self, init=None, schema=None, extensions=None,
-                 pass_invalid_values=False):
+                 pass_invalid_values=False, lazy=False,
+                 defer_validation=False):
         """
         Parameters
         ----------
@@ -74,11 +131,24 @@ class DataModel(properties.ObjectNode):
 
         pass_invalid_values: If True, values that do not validate the schema can
             be read and written, but with a warning message
+
+        lazy: If True, and init is a FITS file or HDUList, the arrays are
+            not read until they are first accessed, and FITS files are
+            memory mapped.  Metadata is available right away.  The file
+            must stay open until all of the arrays needed have been read.
+
+        defer_validation: If True, changes to the model are not validated
+            against the schema when they are made, but by the `validate`
+            method, which is also called before the model is saved or
+            copied.  Validation is also deferred, whatever this is, inside
+            a `deferred_validation` block.
         """
         filename = os.path.abspath(inspect.getfile(self.__class__))
         base_url = os.path.join(
             os.path.dirname(filename), 'schemas', '')
 
+        # Only the schemas resolved with the default extensions are cached
+        cache_schema = extensions is None
         if extensions is None:
             extensions = jwst_extensions[:]
         else:
@@ -87,11 +157,17 @@ class DataModel(properties.ObjectNode):
 
         if schema is None:
             schema_path = os.path.join(base_url, self.schema_url)
-            extension_list = asdf_extension.AsdfExtensionList(self._extensions)
-            schema = asdf_schema.load_schema(schema_path, 
-                resolver=extension_list.url_mapping, resolve_references=True)
-
-        self._schema = mschema.flatten_combiners(schema)
+            cache_key = (self.__class__, schema_path)
+            self._schema = _schema_cache.get(cache_key) if cache_schema else None
+            if self._schema is None:
+                extension_list = asdf_extension.AsdfExtensionList(self._extensions)
+                schema = asdf_schema.load_schema(schema_path,
+                    resolver=extension_list.url_mapping, resolve_references=True)
+                self._schema = mschema.flatten_combiners(schema)
+                if cache_schema:
+                    _schema_cache[cache_key] = self._schema
+        else:
+            self._schema = mschema.flatten_combiners(schema)
 
         if "PASS_INVALID_VALUES" in os.environ:
             pass_invalid_values = os.environ["PASS_INVALID_VALUES"]
@@ -103,6 +179,10 @@ class DataModel(properties.ObjectNode):
             self._pass_invalid_values = pass_invalid_values
 
         self._files_to_close = []
+        self._lazy_arrays = {}
+        lazy_arrays = self._lazy_arrays if lazy else None
+        self._defer_validation = defer_validation
+        self._pending_changes = {}
         is_array = False
         is_shape = False
         shape = None
@@ -115,6 +195,8 @@ class DataModel(properties.ObjectNode):
             shape = init.shape
             is_array = True
         elif isinstance(init, self.__class__):
+            init.validate()
+            init._load_lazy_arrays()
             instance = copy.deepcopy(init._instance)
             self._schema = init._schema
             self._shape = init._shape
@@ -140,12 +222,13 @@ class DataModel(properties.ObjectNode):
             asdf = fits_support.from_fits(init, self._schema,
                                           extensions=self._extensions,
                                           validate=False,
-                                          pass_invalid_values=self._pass_invalid_values)
+                                          pass_invalid_values=self._pass_invalid_values,
+                                          lazy_arrays=lazy_arrays)
         elif isinstance(init, six.string_types):
             if isinstance(init, bytes):
                 init = init.decode(sys.getfilesystemencoding())
             try:
-                hdulist = fits.open(init)
+                hdulist = fits.open(init, memmap=True if lazy else None)
             except IOError:
                 try:
                     asdf = AsdfFile.open(init, extensions=self._extensions)
@@ -157,7 +240,8 @@ class DataModel(properties.ObjectNode):
                 asdf = fits_support.from_fits(hdulist, self._schema,
                                               extensions=self._extensions,
                                               validate=False,
-                                              pass_invalid_values=self._pass_invalid_values)
+                                              pass_invalid_values=self._pass_invalid_values,
+                                              lazy_arrays=lazy_arrays)
                 self._files_to_close.append(hdulist)
         else:
             raise ValueError(
@@ -208,15 +292,112 @@ class DataModel(properties.ObjectNode):
             if fd is not None:
                 fd.close()
 
-    def copy(self, memo=None):
+    def _load_lazy_arrays(self):
         """
-        Returns a deep copy of this model.
+        Reads all of the arrays that have not been read yet, for a model
+        opened with ``lazy=True``, and copies the arrays still shared by
+        a copy made with ``share_arrays=True``.
+        """
+        while self._lazy_arrays:
+            (_, attr), (parent, loader) = self._lazy_arrays.popitem()
+            parent[attr] = loader()
+
+    def _has_array(self, attr):
+        # Whether the top level attribute is set or still has to be read,
+        #   without making a default value for it
+        return (attr in self._instance or
+                (id(self._instance), attr) in self._lazy_arrays)
+
+    @property
+    def _validation_deferred(self):
+        return (self._defer_validation or
+                getattr(_deferred_validation, 'depth', 0) > 0)
+
+    def _record_changes(self, node, changes):
+        # Records the changes that node is making to its attributes, as a
+        # dict mapping each attribute to its (old value, lazy loader), for
+        # validate.  A change to the items of a list node has no changes.
+        # The original value of an attribute changed several times is kept.
+        if changes is None:
+            changes = {None: None}
+        for attr, old in six.iteritems(changes):
+            self._pending_changes.setdefault(
+                (id(node._instance), attr), (node, attr, old))
+
+    def validate(self):
+        """
+        Validates the changes made to the model while its validation was
+        deferred, either because it was created with
+        ``defer_validation=True`` or because they were made inside a
+        `deferred_validation` block.
+
+        Only the new value of each changed attribute is validated, against
+        its part of the schema.  If a value is not valid, that attribute is
+        reverted to its original value, and `jsonschema.ValidationError` is
+        raised, as it would have been when the attribute was set on a model
+        that doesn't defer validation.  The changes that are not validated
+        yet at that point stay pending.
+        """
+        pending = self._pending_changes
+        while pending:
+            node, attr, old = pending.pop(next(iter(pending)))
+            try:
+                node._validate_change(attr)
+            except jsonschema.ValidationError:
+                if attr is not None:
+                    if attr in node._instance:
+                        msgfmt = "'{0}' is not valid to write to '{1}'"
+                        warnings.warn(msgfmt.format(
+                            node._instance[attr], attr))
+                    self._has_invalid_values = False
+                    node._revert({attr: old})
+                raise
+
+    def copy(self, memo=None, share_arrays=False):
         """
+        Returns a deep copy of this model.
+
+        Parameters
+        ----------
+        share_arrays : bool, optional
+            If True, the arrays are not copied right away.  The copy shares
+            them with this model, and an array is only copied when it is
+            first accessed on the copy, or when the copy is saved or
+            copied, so arrays that the copy never uses are not duplicated.
+            The arrays of this model must then not be modified in place
+            while the copy may still share them.  The arrays that this
+            model has not read yet, if it was opened with ``lazy=True``,
+            are not read either: the copy reads its own copy of them when
+            it first uses them, so this model must stay open until then.
+        """
+        self.validate()
+        if not share_arrays:
+            self._load_lazy_arrays()
+        if memo is None:
+            memo = {}
+        if share_arrays:
+            # Have deepcopy keep the arrays as they are
+            for _, _, array in _iter_dict_arrays(self._instance):
+                memo[id(array)] = array
         result = self.__class__(
             init=copy.deepcopy(self._instance, memo=memo),
             schema=self._schema,
             extensions=self._extensions)
         result._shape = self._shape
+        if share_arrays:
+            # Replace the shared arrays by loaders that copy them
+            for parent, key, array in list(_iter_dict_arrays(result._instance)):
+                if memo.get(id(array)) is array:
+                    del parent[key]
+                    loader = functools.partial(copy.deepcopy, array)
+                    result._lazy_arrays[(id(parent), key)] = (parent, loader)
+            # Have the copy read the arrays not read yet itself
+            for (_, key), (parent, loader) in six.iteritems(self._lazy_arrays):
+                parent_copy = memo.get(id(parent))
+                if parent_copy is not None:
+                    loader = functools.partial(_copy_loaded, loader)
+                    result._lazy_arrays[(id(parent_copy), key)] = \
+                        (parent_copy, loader)
         return result
 
     __copy__ = __deepcopy__ = copy
@@ -311,6 +492,8 @@ class DataModel(properties.ObjectNode):
             `asdf.AsdfFile.write_to`.
         """
         self.on_save(init)
+        self.validate()
+        self._load_lazy_arrays()
 
         AsdfFile(self._instance, extensions=self._extensions).write_to(init, *args, **kwargs)
 
@@ -349,6 +532,8 @@ class DataModel(properties.ObjectNode):
             `astropy.io.fits.writeto`.
         """
         self.on_save(init)
+        self.validate()
+        self._load_lazy_arrays()
 
         with fits_support.to_fits(self._instance, self._schema,
                                   extensions=self._extensions) as ff:
@@ -357,7 +542,8 @@ class DataModel(properties.ObjectNode):
     @property
     def shape(self):
         if self._shape is None:
-            if self.get_primary_array_name() in self._instance:
+            primary_array_name = self.get_primary_array_name()
+            if self._has_array(primary_array_name):
                 return getattr(self, self.get_primary_array_name()).shape
             else:
                 return None
@@ -514,6 +700,12 @@ class DataModel(properties.ObjectNode):
 
             ("meta.observation.date": "2012-04-22T03:22:05.432")
         """
+        self._load_lazy_arrays()
+        return self._iteritems()
+
+    def _iteritems(self):
+        # Same as iteritems, without reading arrays that have not been
+        # read yet.
         def recurse(tree, path=[]):
             if isinstance(tree, dict):
                 for key, val in six.iteritems(tree):
@@ -701,7 +893,7 @@ class DataModel(properties.ObjectNode):
         if include_arrays:
             return dict((key, convert_val(val)) for (key, val) in self.iteritems())
         else:
-            return dict((key, convert_val(val)) for (key, val) in self.iteritems()
+            return dict((key, convert_val(val)) for (key, val) in self._iteritems()
                         if not isinstance(val, np.ndarray))
 
     @property
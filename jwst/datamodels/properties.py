@@ -120,6 +120,30 @@ def _unmake_node(obj):
     return obj
 
 
+def _pop_lazy_loader(ctx, instance, attr):
+    # Arrays of a model opened with lazy=True are not read until they are
+    # first used; until then, the model keeps a loader for each of them,
+    # keyed by the object tree node that will hold the array.
+    lazy_arrays = getattr(ctx, '_lazy_arrays', None)
+    if not lazy_arrays:
+        return None
+    entry = lazy_arrays.pop((id(instance), attr), None)
+    if entry is None:
+        return None
+    return entry[1]
+
+
+def _holds_array(val):
+    # Whether val is an array, or a tree holding one
+    if isinstance(val, np.ndarray):
+        return True
+    elif isinstance(val, dict):
+        return any(_holds_array(x) for x in six.itervalues(val))
+    elif isinstance(val, list):
+        return any(_holds_array(x) for x in val)
+    return False
+
+
 def _get_schema_for_property(schema, attr):
     subschema = schema.get('properties', {}).get(attr, None)
     if subschema is not None:
@@ -150,15 +174,47 @@ class Node(object):
         self._schema['$schema'] = 'http://stsci.edu/schemas/asdf-schema/0.1.0/asdf-schema'
         self._ctx = ctx
 
-    def _validate(self):
+    def _validate(self, changes=None):
+        # If the model defers validation, just record the attributes being
+        # changed, with their original values, so that the changes can be
+        # validated (and reverted) later by DataModel.validate.  Changes
+        # replacing arrays are validated right away instead, against the
+        # attribute's subschema, so that the replaced arrays are not kept.
+        if getattr(self._ctx, '_validation_deferred', False):
+            if changes is None:
+                # A change to the items of a list
+                self._ctx._record_changes(self, None)
+                return
+            for attr, (old_val, loader) in six.iteritems(changes):
+                if _holds_array(old_val):
+                    self._validate_change(attr)
+                else:
+                    self._ctx._record_changes(self, {attr: (old_val, loader)})
+            return
+
+        self._validate_instance(self._instance, self._schema)
+
+    def _validate_change(self, attr):
+        # Validates a change recorded while validation was deferred: only
+        # the new value of the attribute, against its own subschema.  The
+        # whole node is validated when the attribute was deleted, has no
+        # subschema, or is None for a change to the items of a list.
+        if attr is not None and attr in self._instance:
+            subschema = _get_schema_for_property(self._schema, attr)
+            if subschema:
+                self._validate_instance(self._instance[attr], subschema)
+                return
+        self._validate_instance(self._instance, self._schema)
+
+    def _validate_instance(self, instance, subschema):
         instance = yamlutil.custom_tree_to_tagged_tree(
-            self._instance, self._ctx._asdf)
+            instance, self._ctx._asdf)
         try:
             previously_invalid = self._ctx._has_invalid_values
         except AttributeError:
             previously_invalid = False
         try:
-            schema.validate(instance, schema=self._schema)
+            schema.validate(instance, schema=subschema)
             self._ctx._has_invalid_values = False
         except jsonschema.ValidationError:
             self._ctx._has_invalid_values = True
@@ -167,6 +223,17 @@ class Node(object):
             else:
                 raise
 
+    def _revert(self, old_values):
+        # Restore the attributes to the values recorded by _validate.
+        for attr, (old_val, loader) in six.iteritems(old_values):
+            if old_val is None:
+                self._instance.pop(attr, None)
+                if loader is not None:
+                    self._ctx._lazy_arrays[(id(self._instance), attr)] = \
+                        (self._instance, loader)
+            else:
+                self._instance[attr] = old_val
+
     @property
     def instance(self):
         return self._instance
@@ -191,9 +258,13 @@ class ObjectNode(Node):
         try:
             val = self._instance[attr]
         except KeyError:
-            if schema == {}:
+            loader = _pop_lazy_loader(self._ctx, self._instance, attr)
+            if loader is not None:
+                val = loader()
+            elif schema == {}:
                 raise AttributeError("No attribute '{0}'".format(attr))
-            val = _make_default(attr, schema, self._ctx)
+            else:
+                val = _make_default(attr, schema, self._ctx)
             self._instance[attr] = val
 
         return _make_node(val, schema, self._ctx)
@@ -207,18 +278,16 @@ class ObjectNode(Node):
                 val = _make_default(attr, schema, self._ctx)
             val = _cast(val, schema)
             old_val = self._instance.get(attr, None)
+            loader = _pop_lazy_loader(self._ctx, self._instance, attr)
             self._instance[attr] = val
             try:
-                self._validate()
+                self._validate({attr: (old_val, loader)})
             except jsonschema.ValidationError:
                 # Revert the transaction
                 msgfmt = "'{0}' is not valid to write to '{1}'"
                 warnings.warn(msgfmt.format(val, attr))
                 self._ctx._has_invalid_values = False
-                if old_val is None:
-                    del self._instance[attr]
-                else:
-                    self._instance[attr] = old_val
+                self._revert({attr: (old_val, loader)})
                 raise
 
     def __delattr__(self, attr):
@@ -229,15 +298,15 @@ class ObjectNode(Node):
             try:
                 del self._instance[attr]
             except KeyError:
-                raise AttributeError(
-                    "Attribute '{0}' missing".format(attr))
+                if _pop_lazy_loader(self._ctx, self._instance, attr) is None:
+                    raise AttributeError(
+                        "Attribute '{0}' missing".format(attr))
             try:
-                self._validate()
+                self._validate({attr: (old_val, None)})
             except jsonschema.ValidationError:
                 # Revert the transaction
                 self._ctx._has_invalid_values = False
-                if old_val is not None:
-                    self._instance[attr] = old_val
+                self._revert({attr: (old_val, None)})
                 raise
 
     def __hasattr__(self, attr):
@@ -361,6 +430,30 @@ def put_value(path, value, tree):
 
     tree : JSON object tree
     """
+    cursor = get_parent(path, tree)
+    if isinstance(path[-1], int):
+        while len(cursor) <= path[-1]:
+            cursor.append({})
+    cursor[path[-1]] = value
+
+
+def get_parent(path, tree):
+    """
+    Get the node of tree that holds the element at the given path,
+    creating it if it is not already present.
+
+    Parameters
+    ----------
+    path : list of str or int
+        The path to the element.
+
+    tree : JSON object tree
+
+    Returns
+    -------
+    cursor : dict or list
+        The parent of the element.
+    """
     cursor = tree
     for i in range(len(path) - 1):
         part = path[i]
@@ -374,10 +467,7 @@ def put_value(path, value, tree):
             else:
                 cursor = cursor.setdefault(part, {})
 
-    if isinstance(path[-1], int):
-        while len(cursor) <= path[-1]:
-            cursor.append({})
-    cursor[path[-1]] = value
+    return cursor
 
 
 def merge_tree(a, b):
@@ -372,3 +372,64 @@ def test_image_with_extra_keyword_to_multislit():
         assert len(ms.slits) == 3
         for slit in ms.slits:
             assert slit.data.shape == (4, 4)
+
+
+def test_lazy_open():
+    with ImageModel(data=np.arange(16, dtype=np.float32).reshape((4, 4))) as im:
+        im.meta.instrument.name = 'NIRCAM'
+        im.save(TMP_FITS, overwrite=True)
+
+    with open(TMP_FITS, lazy=True) as im:
+        assert isinstance(im, ImageModel)
+        assert 'data' not in im._instance
+        assert im.meta.instrument.name == 'NIRCAM'
+        assert 'meta.instrument.name' in im.to_flat_dict(include_arrays=False)
+        assert 'data' not in im._instance
+
+        assert_array_equal(im.data,
+                           np.arange(16, dtype=np.float32).reshape((4, 4)))
+        assert 'data' in im._instance
+        assert 'dq' not in im._instance
+
+        im.dq = np.ones((4, 4), dtype=np.uint32)
+        with im.copy() as im2:
+            assert_array_equal(im2.dq, 1)
+            assert im2.err.shape == (4, 4)
+
+
+def test_schema_reused():
+    with ImageModel() as im1, ImageModel() as im2:
+        assert im1._schema is im2._schema
+
+    with MultiSlitModel() as ms:
+        ms.meta.instrument.name = 'NIRSPEC'
+        for i in range(2):
+            ms.slits.append(ms.slits.item())
+            ms.slits[i].data = np.full((4, 4), i, dtype=np.float32)
+        ms.save(TMP_FITS, overwrite=True)
+
+    for i in range(2):
+        with MultiSlitModel(TMP_FITS) as ms:
+            assert ms.meta.instrument.name == 'NIRSPEC'
+            assert len(ms.slits) == 2
+            assert_array_equal(ms.slits[1].data, 1)
+
+
+def test_copy_share_arrays():
+    with ImageModel(data=np.zeros((4, 4), dtype=np.float32)) as im:
+        im.meta.instrument.name = 'NIRCAM'
+        im.dq = np.ones((4, 4), dtype=np.uint32)
+
+        with im.copy(share_arrays=True) as im2:
+            assert 'data' not in im2._instance
+            assert im2.shape == (4, 4)
+            im2.meta.instrument.name = 'MIRI'
+            im2.data += 1
+            assert 'data' in im2._instance
+            assert 'dq' not in im2._instance
+
+            assert im.meta.instrument.name == 'NIRCAM'
+            assert_array_equal(im.data, 0)
+            assert_array_equal(im2.data, 1)
+            assert_array_equal(im2.dq, 1)
+            assert im2.dq is not im.dq
@@ -4,9 +4,11 @@
 from __future__ import absolute_import, division, unicode_literals, print_function
 
 import datetime
+import gc
 import os
 import shutil
 import tempfile
+import weakref
 
 import pytest
 import numpy as np
@@ -15,6 +17,7 @@ from numpy.testing import assert_array_equal, assert_array_almost_equal
 import jsonschema
 
 from .. import DataModel, ImageModel, RampModel, MaskModel, MultiSlitModel, AsnModel
+from .. import deferred_validation
 
 from asdf import schema as mschema
 
@@ -496,6 +499,61 @@ def test_add_schema_entry():
             assert False
 
 
+def test_deferred_validation():
+    with DataModel(defer_validation=True) as dm:
+        dm.add_schema_entry('meta.foo.bar', {'enum': ['foo', 'bar', 'baz']})
+        dm.meta.foo.bar = 'bar'
+        dm.validate()
+        assert dm.meta.foo.bar == 'bar'
+
+        # Invalid values are only caught, and reverted, by validate
+        dm.meta.foo.bar = 'what?'
+        assert dm.meta.foo.bar == 'what?'
+        with pytest.raises(jsonschema.ValidationError):
+            dm.validate()
+        assert dm.meta.foo.bar == 'bar'
+
+        dm.meta.foo.bar = 'what?'
+        with pytest.raises(jsonschema.ValidationError):
+            dm.save(TMP_FITS)
+
+
+def test_deferred_validation_block():
+    with DataModel() as dm:
+        dm.add_schema_entry('meta.foo.bar', {'enum': ['foo', 'bar', 'baz']})
+        dm.add_schema_entry('meta.foo.baz', {'enum': ['foo', 'bar', 'baz']})
+        dm.meta.foo.bar = 'foo'
+
+        with deferred_validation():
+            dm.meta.foo.bar = 'bar'
+            dm.meta.foo.baz = 'what?'
+
+        # Only the invalid change is reverted
+        with pytest.raises(jsonschema.ValidationError):
+            dm.validate()
+        assert dm.meta.foo.bar == 'bar'
+        assert 'baz' not in dm.meta.foo.instance
+
+        # Outside of the block, changes are validated right away again
+        with pytest.raises(jsonschema.ValidationError):
+            dm.meta.foo.baz = 'what?'
+
+
+def test_deferred_validation_arrays():
+    with ImageModel(data=np.zeros((4, 4), dtype=np.float32)) as im:
+        replaced = weakref.ref(im.data)
+        with deferred_validation():
+            im.data = np.ones((4, 4), dtype=np.float32)
+            im.meta.instrument.name = 'NIRCAM'
+
+            # The change replacing the array was validated right away, so
+            # that the replaced array is not kept until validate
+            gc.collect()
+            assert replaced() is None
+        im.validate()
+        assert_array_equal(im.data, 1)
+
+
 def test_table_size_zero():
     with AsnModel() as dm:
         assert len(dm.asn_table) == 0
@@ -45,6 +45,11 @@ def open(init=None, extensions=None, **kwargs):
         A list of extensions to the ASDF to support when reading
         and writing ASDF files.
 
+    kwargs : dict
+        Additional arguments passed to the model constructor; for example,
+        ``lazy=True`` delays reading the arrays of a FITS file until they
+        are first accessed.
+
    Results
     -------
 
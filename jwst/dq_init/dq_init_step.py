@@ -14,48 +14,54 @@ class DQInitStep(Step):
 
     reference_file_types = ['mask']
 
+    chunkable = True
+
     def process(self, input):
 
-        with datamodels.open(input) as input_model:
-
-            # Check for consistency between keyword values and data shape
-            nints, ngroups, ysize, xsize = input_model.data.shape
-            nints_kwd = input_model.meta.exposure.nints
-            ngroups_kwd = input_model.meta.exposure.ngroups
-            ysize_kwd = input_model.meta.subarray.ysize
-            xsize_kwd = input_model.meta.subarray.xsize
-            if nints != nints_kwd:
-                self.log.error("Keyword 'NINTS' value of '{0} does not match data array size of '{1}'".format(nints_kwd,nints))
-                raise ValueError("Bad data dimensions")
-            if ngroups != ngroups_kwd:
-                self.log.error("Keyword 'NGROUPS' value of '{0}' does not match data array size of '{1}'".format(ngroups_kwd,ngroups))
-                raise ValueError("Bad data dimensions")
-            if ysize != ysize_kwd and 'IRS2' not in input_model.meta.exposure.readpatt.upper():
-                self.log.error("Keyword 'SUBSIZE2' value of '{0}' does not match data array size of '{1}'".format(ysize_kwd,ysize))
-                raise ValueError("Bad data dimensions")
-            if xsize != xsize_kwd:
-                self.log.error("Keyword 'SUBSIZE1' value of '{0}' does not match data array size of '{1}'".format(xsize_kwd,xsize))
-                raise ValueError("Bad data dimensions")
-
-            # Retreive the mask reference file name
-            self.mask_filename = self.get_reference_file(input_model, 'mask')
-            self.log.info('Using MASK reference file %s', self.mask_filename)
-
-            # Check for a valid reference file
-            if self.mask_filename == 'N/A':
-                self.log.warning('No MASK reference file found')
-                self.log.warning('DQ initialization step will be skipped')
-                result = input_model.copy()
-                result.meta.cal_step.dq_init = 'SKIPPED'
-                return result
-
-            # Load the reference file
-            mask_model = datamodels.MaskModel(self.mask_filename)
-
-            # Apply the step
-            result = dq_initialization.correct_model(input_model, mask_model)
-
-            # Close the reference file
-            mask_model.close()
-
-        return result
+        return self.run_chunks(input)
+
+    def prepare_chunks(self, input_model):
+
+        # Check for consistency between keyword values and data shape
+        nints, ngroups, ysize, xsize = input_model.data.shape
+        nints_kwd = input_model.meta.exposure.nints
+        ngroups_kwd = input_model.meta.exposure.ngroups
+        ysize_kwd = input_model.meta.subarray.ysize
+        xsize_kwd = input_model.meta.subarray.xsize
+        if nints != nints_kwd:
+            self.log.error("Keyword 'NINTS' value of '{0} does not match data array size of '{1}'".format(nints_kwd,nints))
+            raise ValueError("Bad data dimensions")
+        if ngroups != ngroups_kwd:
+            self.log.error("Keyword 'NGROUPS' value of '{0}' does not match data array size of '{1}'".format(ngroups_kwd,ngroups))
+            raise ValueError("Bad data dimensions")
+        if ysize != ysize_kwd and 'IRS2' not in input_model.meta.exposure.readpatt.upper():
+            self.log.error("Keyword 'SUBSIZE2' value of '{0}' does not match data array size of '{1}'".format(ysize_kwd,ysize))
+            raise ValueError("Bad data dimensions")
+        if xsize != xsize_kwd:
+            self.log.error("Keyword 'SUBSIZE1' value of '{0}' does not match data array size of '{1}'".format(xsize_kwd,xsize))
+            raise ValueError("Bad data dimensions")
+
+        # Retreive the mask reference file name
+        self.mask_filename = self.get_reference_file(input_model, 'mask')
+        self.log.info('Using MASK reference file %s', self.mask_filename)
+
+        # Check for a valid reference file
+        if self.mask_filename == 'N/A':
+            self.log.warning('No MASK reference file found')
+            self.log.warning('DQ initialization step will be skipped')
+            input_model.meta.cal_step.dq_init = 'SKIPPED'
+            return None
+
+        # Load the reference file
+        mask_model = self.open_reference_model(self.mask_filename,
+                                               datamodels.MaskModel)
+
+        # Apply the step.  Only the 2-D PIXELDQ array is initialized
+        # from the mask, so there is nothing to do block by block.
+        dq_initialization.check_dimensions(input_model)
+        dq_initialization.init_pixeldq(input_model, mask_model)
+
+        # Close the reference file
+        mask_model.close()
+
+        return None
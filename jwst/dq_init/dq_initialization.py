@@ -29,6 +29,13 @@ def do_dqinit(input_model, mask_model):
 
     output_model = input_model.copy()
 
+    init_pixeldq(output_model, mask_model)
+
+    return output_model
+
+def init_pixeldq(output_model, mask_model):
+    """Do the DQ initialization of a model in place"""
+
     if is_subarray(output_model):
         log.debug('input exposure is a subarray readout')
         mask_array = get_mask_subarray(mask_model, output_model)
@@ -36,13 +43,11 @@ def do_dqinit(input_model, mask_model):
         mask_array = mask_model.dq
     #
     # Bitwise-OR the data pixeldq with the reference file mask
-    dq = np.bitwise_or(input_model.pixeldq, mask_array)
+    dq = np.bitwise_or(output_model.pixeldq, mask_array)
     output_model.pixeldq = dq
 
     output_model.meta.cal_step.dq_init = 'COMPLETE'
 
-    return output_model
-
 def is_subarray(input_model):
 
     nrows, ncols = input_model.pixeldq.shape
@@ -8,6 +8,8 @@ from collections import namedtuple
 import logging
 import numpy as np
 
+from ..lib import chunks
+
 from . import x_irs2
 
 log = logging.getLogger(__name__)
@@ -18,7 +20,7 @@ NumRefPixels = namedtuple("NumRefPixels",
                            "left_columns", "right_columns"])
 
 
-def do_correction(input_model, ipc_model):
+def do_correction(input_model, ipc_model, threads=1):
     """
     Short Summary
     -------------
@@ -33,6 +35,9 @@ def do_correction(input_model, ipc_model):
         Deconvolution kernel, either a 2-D or 4-D image in the first
         extension.
 
+    threads: int
+        Number of threads correcting the integrations
+
     Returns
     -------
     output_model: data model object
@@ -49,12 +54,12 @@ def do_correction(input_model, ipc_model):
               (sci_nints, sci_ngroups, sci_nframes, sci_groupgap))
 
     # Apply the correction.
-    output_model = ipc_correction(input_model, ipc_model)
+    output_model = ipc_correction(input_model, ipc_model, threads)
 
     return output_model
 
 
-def ipc_correction(input_model, ipc_model):
+def ipc_correction(input_model, ipc_model, threads=1):
     """Apply the IPC correction to the science arrays.
 
     Parameters
@@ -66,61 +71,91 @@ def ipc_correction(input_model, ipc_model):
         The IPC kernel.  The input is corrected for IPC by convolving
         with this 2-D or 4-D array.
 
+    threads: int
+        Number of threads correcting the integrations
+
     Returns
     -------
     output: data model object
         IPC-corrected science data.
     """
 
-    log.debug("ipc_correction: nints=%d, ngroups=%d, size=%d,%d",
-              input_model.meta.exposure.nints,
-              input_model.meta.exposure.ngroups,
-              input_model.data.shape[-1],
-              input_model.data.shape[-2])
-
     # Create output as a copy of the input science data model.
     output = input_model.copy()
 
+    chunk_kernel = prepare_correction(output, ipc_model)
+    chunks.apply_kernel(chunk_kernel, output, threads=threads)
+
+    return output
+
+
+def prepare_correction(output, ipc_model):
+    """Get the operation that applies the IPC correction in place to the
+    science arrays, one integration at a time.
+
+    Parameters
+    ----------
+    output: data model object
+        The science data, corrected in place.
+
+    ipc_model: ipc model object
+        The IPC kernel.  The input is corrected for IPC by convolving
+        with this 2-D or 4-D array.
+
+    Returns
+    -------
+    chunk_kernel: ChunkKernel
+        The operation correcting an integration.
+    """
+
+    log.debug("ipc_correction: nints=%d, ngroups=%d, size=%d,%d",
+              output.meta.exposure.nints,
+              output.meta.exposure.ngroups,
+              output.data.shape[-1],
+              output.data.shape[-2])
+
     # Was IRS2 readout used?
-    is_irs2_format = x_irs2.is_irs2(input_model)
+    is_irs2_format = x_irs2.is_irs2(output)
     if is_irs2_format:
-        irs2_mask = x_irs2.make_mask(input_model)
+        irs2_mask = x_irs2.make_mask(output)
 
-    detector = input_model.meta.instrument.detector
+    detector = output.meta.instrument.detector
 
     # The number of reference pixels along the bottom edge, top edge,
     # left edge, and right edge.
-    nref = get_num_ref_pixels(input_model)
+    nref = get_num_ref_pixels(output)
 
-    # Get the data for the IPC kernel.  This can be a slice, if input_model
+    # Get the data for the IPC kernel.  This can be a slice, if output
     # is a subarray.
-    kernel = get_ipc_slice(input_model, ipc_model)
+    kernel = get_ipc_slice(output, ipc_model)
 
     log.debug("substrt1 = %d, subsize1 = %d, substrt2 = %d, subsize2 = %d" %
-          (input_model.meta.subarray.xstart, input_model.meta.subarray.xsize,
-           input_model.meta.subarray.ystart, input_model.meta.subarray.ysize))
+          (output.meta.subarray.xstart, output.meta.subarray.xsize,
+           output.meta.subarray.ystart, output.meta.subarray.ysize))
     log.debug('Number of reference pixels: bottom, top, left, right ='
               ' %d, %d, %d, %d' %
               (nref.bottom_rows, nref.top_rows,
                nref.left_columns, nref.right_columns))
     log.debug("Shape of ipc image = %s" % repr(ipc_model.data.shape))
 
-    # Loop over all integrations and groups in input science data.
-    for i in range(input_model.data.shape[0]):                  # integrations
-        for j in range(input_model.data.shape[1]):              # groups
+    data = output.data
+
+    # Loop over all groups of each integration in input science data.  The
+    # convolution mixes neighbouring rows, so integrations are not split
+    # into blocks of rows.
+    def correct_integration(chunk):
+        for group in chunk.science(data):
             # Convolve the current group in-place with the IPC kernel.
             if is_irs2_format:
                 # Extract normal data from input IRS2-format data.
-                temp = x_irs2.from_irs2(output.data[i, j, :, :], irs2_mask,
-                                        detector)
+                temp = x_irs2.from_irs2(group, irs2_mask, detector)
                 ipc_convolve(temp, kernel, nref)
                 # Insert normal data back into original, IRS2-format data.
-                x_irs2.to_irs2(output.data[i, j, :, :], temp, irs2_mask,
-                               detector)
+                x_irs2.to_irs2(group, temp, irs2_mask, detector)
             else:
-                ipc_convolve(output.data[i, j], kernel, nref)
+                ipc_convolve(group, kernel, nref)
 
-    return output
+    return chunks.ChunkKernel(correct_integration, split_rows=False)
 
 def get_num_ref_pixels(input_model):
     """Get the number of reference pixel rows and columns.
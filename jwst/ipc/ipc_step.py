@@ -11,31 +11,33 @@ class IPCStep(Step):
 
     reference_file_types = ['ipc']
 
+    chunkable = True
+
     def process(self, input):
 
-        # Open the input data model
-        with datamodels.open(input) as input_model:
+        return self.run_chunks(input)
+
+    def prepare_chunks(self, input_model):
 
-            # Get the name of the ipc reference file to use
-            self.ipc_name = self.get_reference_file(input_model, 'ipc')
-            self.log.info('Using IPC reference file %s', self.ipc_name)
+        # Get the name of the ipc reference file to use
+        self.ipc_name = self.get_reference_file(input_model, 'ipc')
+        self.log.info('Using IPC reference file %s', self.ipc_name)
 
-            # Check for a valid reference file
-            if self.ipc_name == 'N/A':
-                self.log.warning('No IPC reference file found')
-                self.log.warning('IPC step will be skipped')
-                result = input_model.copy()
-                result.meta.cal_step.ipc = 'SKIPPED'
-                return result
+        # Check for a valid reference file
+        if self.ipc_name == 'N/A':
+            self.log.warning('No IPC reference file found')
+            self.log.warning('IPC step will be skipped')
+            input_model.meta.cal_step.ipc = 'SKIPPED'
+            return None
 
-            # Open the ipc reference file data model
-            ipc_model = datamodels.IPCModel(self.ipc_name)
+        # Open the ipc reference file data model
+        ipc_model = datamodels.IPCModel(self.ipc_name)
 
-            # Do the ipc correction
-            result = ipc_corr.do_correction(input_model, ipc_model)
+        # Get the ipc correction
+        kernel = ipc_corr.prepare_correction(input_model, ipc_model)
 
-            # Close the reference file and update the step status
-            ipc_model.close()
-            result.meta.cal_step.ipc = 'COMPLETE'
+        # Close the reference file and update the step status
+        ipc_model.close()
+        input_model.meta.cal_step.ipc = 'COMPLETE'
 
-        return result
+        return kernel
@@ -11,7 +11,8 @@ log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
 
 def detect_jumps (input_model, gain_model, readnoise_model,
-                  rejection_threshold, do_yint, signal_threshold):
+                  rejection_threshold, do_yint, signal_threshold,
+                  yint_method='batched'):
     """
     This is the high-level controlling routine for the jump detection process.
     It loads and sets the various input data and parameters needed by each of
@@ -28,13 +29,21 @@ def detect_jumps (input_model, gain_model, readnoise_model,
     appropriate instrument- and detector-dependent values for each pixel of an
     image.  Also, a 2-dimensional read noise array with appropriate values for
     each pixel is passed to the detection methods.
+
+    The y-intercept method is applied either to blocks of pixels at once
+    (yint_method='batched') or one pixel at a time (yint_method='pixel');
+    both flag the same groups, since intervals whose y-intercept
+    differences tie to within rounding are resolved the same way.
     """
 
-    # Load the data arrays that we need from the input model
+    # Load the data arrays that we need from the output model, a copy of
+    # the input.  Its SCI and ERR arrays are scaled in place below, and
+    # restored from the input once the jumps have been flagged in its GROUPDQ,
+    # so that the input is left unchanged without more full-size copies.
     output_model = input_model.copy()
-    data = input_model.data
-    err  = input_model.err
-    gdq  = input_model.groupdq
+    data = output_model.data
+    err  = output_model.err
+    gdq  = output_model.groupdq
 
     ngroups = data.shape[1]
     nframes = input_model.meta.exposure.nframes
@@ -86,13 +95,22 @@ def detect_jumps (input_model, gain_model, readnoise_model,
         # Now apply the y-intercept method
         log.info('Executing yintercept method')
         start = time.time()
-        yint.find_CRs( data, err, gdq, times, readnoise_2d,
-                       rejection_threshold, signal_threshold, median_slopes)
+        if yint_method == 'pixel':
+            yint.find_CRs( data, err, gdq, times, readnoise_2d,
+                           rejection_threshold, signal_threshold,
+                           median_slopes)
+        else:
+            yint.find_CRs_batched( data, err, gdq, times, readnoise_2d,
+                                   rejection_threshold, signal_threshold,
+                                   median_slopes)
         elapsed = time.time() - start
         log.debug('Elapsed time = %g sec' %elapsed)
 
-    # Update the DQ array of the output model with the jump detection results
+    # Update the DQ array of the output model with the jump detection
+    # results, and restore its unscaled SCI and ERR arrays
     output_model.groupdq = gdq
+    np.copyto(output_model.data, input_model.data)
+    np.copyto(output_model.err, input_model.err)
 
     return output_model
 
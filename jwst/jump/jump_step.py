@@ -17,6 +17,7 @@ class JumpStep(Step):
         rejection_threshold = float(default=4.0,min=0) # CR rejection threshold
         do_yintercept = boolean(default=False) # do y-intercept method?
         yint_threshold = float(default=1.0,min=0) # y-intercept signal threshold
+        yint_method = option('batched', 'pixel', default='batched') # y-intercept implementation
     """
 
     reference_file_types = ['gain', 'readnoise']
@@ -47,22 +48,26 @@ class JumpStep(Step):
             self.log.info('CR rejection threshold = %g sigma', rej_thresh)
             if do_yint:
                 self.log.info('Y-intercept signal threshold = %g', sig_thresh)
+                self.log.info('Y-intercept method = %s', self.yint_method)
 
             # Get the gain and readnoise reference files
             gain_filename = self.get_reference_file(input_model, 'gain')
             self.log.info('Using GAIN reference file: %s', gain_filename)
 
-            gain_model = datamodels.GainModel( gain_filename )
+            gain_model = self.open_reference_model(gain_filename,
+                                                   datamodels.GainModel)
 
             readnoise_filename = self.get_reference_file(input_model,
                                                           'readnoise')
             self.log.info('Using READNOISE reference file: %s',
                           readnoise_filename)
-            readnoise_model = datamodels.ReadnoiseModel( readnoise_filename )
+            readnoise_model = self.open_reference_model(
+                readnoise_filename, datamodels.ReadnoiseModel)
 
             # Call the jump detection routine
             result = detect_jumps(input_model, gain_model, readnoise_model,
-                                   rej_thresh, do_yint, sig_thresh)
+                                   rej_thresh, do_yint, sig_thresh,
+                                   yint_method=self.yint_method)
 
             gain_model.close()
             readnoise_model.close()
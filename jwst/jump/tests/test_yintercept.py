@@ -0,0 +1,51 @@
+"""Test that the batched y-intercept method flags the same groups as the
+pixel-by-pixel one"""
+import numpy as np
+import pytest
+
+from ...datamodels import dqflags
+from .. import yintercept
+
+
+def find_both(data, gdq, times, read_noise):
+    err = np.ones_like(data)
+    median_slopes = np.zeros((data.shape[0],) + data.shape[2:])
+    pixel_gdq = gdq.copy()
+    batched_gdq = gdq.copy()
+    yintercept.find_CRs(data, err, pixel_gdq, times, read_noise, 4., 100.,
+                        median_slopes)
+    yintercept.find_CRs_batched(data, err, batched_gdq, times, read_noise,
+                                4., 100., median_slopes, block_rows=4)
+    return pixel_gdq, batched_gdq
+
+
+@pytest.mark.parametrize('ngroups', [3, 4, 5, 8])
+def test_batched_matches_pixel(ngroups):
+    for seed in range(5):
+        rng = np.random.RandomState(seed)
+        shape = (2, ngroups, 6, 7)
+        data = 100. + rng.normal(0., 5., shape).cumsum(axis=1)
+        data[:, ngroups // 2:, ::2, ::3] += 200.
+        gdq = np.zeros(shape, dtype=np.uint8)
+        gdq[:, -1, 1, :] = dqflags.group['SATURATED']
+        gdq[:, 1, 4, ::2] = dqflags.group['JUMP_DET']
+        times = (np.arange(ngroups) + 1) * 10.6
+        read_noise = np.full(shape[2:], 5.)
+
+        pixel_gdq, batched_gdq = find_both(data, gdq, times, read_noise)
+        assert np.all(pixel_gdq == batched_gdq)
+
+
+def test_batched_matches_pixel_ties():
+    # The two y-intercept differences of a 3-group semi-ramp are equal;
+    # both methods flag the first of them
+    data = np.zeros((1, 3, 2, 2))
+    data[0, 1] = 50.
+    gdq = np.zeros(data.shape, dtype=np.uint8)
+    times = np.array([10.6, 21.2, 31.8])
+    read_noise = np.full((2, 2), 1.)
+
+    pixel_gdq, batched_gdq = find_both(data, gdq, times, read_noise)
+    assert np.all(pixel_gdq == batched_gdq)
+    assert np.all(pixel_gdq[0, 1] == dqflags.group['JUMP_DET'])
+    assert np.all(pixel_gdq[0, 2] == 0)
@@ -4,9 +4,16 @@ Two-Point Difference method for finding outliers in a 3-d ramp data cube.
 The scheme used in this variation of the method uses numpy array methods
 to compute first-differences and find the max outlier in each pixel while
 still working in the full 3-d data array. This makes detection of the first
-outlier very fast. We then iterate pixel-by-pixel over only those pixels
-that are already known to contain an outlier, to look for any additional
-outliers and set the appropriate DQ mask for all outliers in the pixel.
+outlier very fast. We then iterate over only those pixels that are already
+known to contain an outlier, to look for any additional outliers and set the
+appropriate DQ mask for all outliers in the pixel.
+
+The search for additional outliers is done for all of the candidate pixels
+at once: on each iteration the masked median and sigma are recomputed as
+arrays for every pixel that is still active, and a pixel drops out of the
+active set as soon as its largest remaining ratio is below the threshold.
+The original pixel-by-pixel loop is retained as a reference mode
+(``use_pixel_loop=True``) and gives identical DQ results.
 
 This is MUCH faster than doing all the work on a pixel-by-pixel basis.
 '''
@@ -22,13 +29,19 @@ log.setLevel(logging.DEBUG)
 
 HUGE_NUM = np.finfo(np.float32).max
 
-def find_CRs(data, gdq, read_noise, rej_threshold, nframes):
+def find_CRs(data, gdq, read_noise, rej_threshold, nframes,
+             use_pixel_loop=False):
     """
     Find CRs/Jumps in each integration within the input data array.
 
     The input data array is assumed to be in units of electrons, i.e. already
     multiplied by the gain. We also assume that the read noise is in units of
     electrons.
+
+    If `use_pixel_loop` is True, the search for additional outliers in
+    pixels that already contain one is done one pixel at a time, which is
+    the original (slow) reference implementation. Otherwise all candidate
+    pixels are processed together as arrays.
     """
 
     # Get data characteristics
@@ -111,84 +124,191 @@ def find_CRs(data, gdq, read_noise, rej_threshold, nframes):
         r2, c2 = np.where(ratio[r,c,max_index2] > rej_threshold)
 
         if nframes>1:  # Use 2nd highest outliers if nframes>1
+            log.debug('From 2nd highest outlier Twopt found %d pixels with at least one CR' % (len(r2)))
+        else:
+            r2 = c2 = np.zeros(0, dtype=r1.dtype)
+
+        if use_pixel_loop:
             # Combine both sets of rows,columns for outliers above threshold
             rboth = np.concatenate((r1,r2))
             cboth = np.concatenate((c1,c2))
-            log.debug('From 2nd highest outlier Twopt found %d pixels with at least one CR' % (len(r2)))
+            find_more_CRs_by_pixel(integration, rboth, cboth, total_1,
+                                   max_index1, max_index2, first_diffs,
+                                   read_noise_2, gdq, median_slopes,
+                                   rej_threshold, nframes)
         else:
-            rboth = r1.copy()
-            cboth = c1.copy()
-
-        total_both = len(rboth)  
-
-        # Loop over pixels that have an outlier, checking to see if they have
-        # more than 1 outlier
-        for j in range(total_both):
-            # Get the row/col indexes of current pixel with an outlier.
-            # From the concatenate() above, the initial total_1 values (r1,c1)
-            # correspond to the highest outlier, and the remaining values
-            # (r2,c2) correspond to the 2nd highest outlier.
-            row, col = rboth[j], cboth[j]
-            masked_diffs = first_diffs[row, col]
-            rn2 = read_noise_2[row, col]
-
-            # Create a saturation mask based on NaN's in the first_diffs
-            sat_mask = np.isfinite(masked_diffs)
-
-            # Create a CR mask and initialize with the max outlier;
-            # cr_mask=0 designates a CR
-            cr_mask = np.ones(masked_diffs.shape, dtype=bool)
-
-            if j < total_1:   # Set mask for the highest outlier
-                cr_mask[ max_index1[row, col]] = 0
-            else:  # It's the 2nd highest
-                cr_mask[ max_index2[row, col]] = 0
-
-            # Now iteratively search for and reject additional outliers for
-            # this pixel
-            iter = 1
-            while iter:
-                # Recompute the masked median, noise, and ratios for this pixel
-                med = np.median(masked_diffs[cr_mask*sat_mask])
-                poisson_noise = np.sqrt(np.abs(med))
-                sigma = np.sqrt(poisson_noise*poisson_noise + rn2/nframes)
-
-                ratio = np.abs(masked_diffs - med)/sigma
- 
-                # Get a list of group indexes sorted from largest to smallest
-                # deviation from the median
-                sortindx = np.argsort(ratio)[::-1]
-
-                # Check through the list to see if any qualify as an outlier.
-                # (since they are sorted, once these don't exceed the threshold
-                # you are done with this pixel)
-                
-                for i in sortindx:
-                    # If already masked, continue to next index
-                    if not cr_mask[i]*sat_mask[i]:
-                        continue
-
-                    # If above threshold, set a CR mask and iterate on this pixel
-                    elif ratio[i] > rej_threshold:
-                        cr_mask[i] = 0
-                        iter = 1
-                        break
-
-                    # If not above threshold, we're done with this pixel
-                    else:
-                        iter = 0
-                        break
-
-            # Set CR flags in input DQ array for this pixel
-            gdq[integration, 1:, row, col] = np.bitwise_or \
-                              (gdq[integration, 1:, row, col],
-                               dqflags.group['JUMP_DET']*np.invert(cr_mask))
-            
-            # Save the CR-cleaned median slope for this pixel
-            median_slopes[integration, row, col] = med
-
-        # Next pixel with an outlier (j loop)
+            # Process the pixels flagged via the highest outlier first,
+            # then those flagged via the 2nd highest, so that pixels
+            # appearing in both sets end up with the same results as the
+            # pixel-by-pixel reference mode
+            for rows, cols, max_index in ((r1, c1, max_index1),
+                                          (r2, c2, max_index2)):
+                find_more_CRs(integration, rows, cols, max_index[rows, cols],
+                              first_diffs, read_noise_2, gdq, median_slopes,
+                              rej_threshold, nframes)
 
     # Next integration (integration loop)
 
     return median_slopes
+
+
+def find_more_CRs(integration, rows, cols, first_cr, first_diffs,
+                  read_noise_2, gdq, median_slopes, rej_threshold, nframes):
+    """
+    Iteratively search for additional outliers in a set of pixels that are
+    already known to contain one, working on all of the pixels at once.
+
+    On each iteration the median of the unmasked first differences, the
+    noise, and the ratios are recomputed for every pixel that is still
+    active. The largest unmasked ratio of each active pixel is compared to
+    the rejection threshold; pixels above it get that group masked and stay
+    active, while the rest are done. The groupdq and median slope arrays
+    are updated in place.
+    """
+
+    npix = len(rows)
+    if npix == 0:
+        return
+
+    diffs = first_diffs[rows, cols]
+    rn2 = read_noise_2[rows, cols]
+
+    # Create a saturation mask based on NaN's in the first_diffs
+    sat_mask = np.isfinite(diffs)
+
+    # Create a CR mask and initialize with the max outlier;
+    # cr_mask=0 designates a CR
+    cr_mask = np.ones(diffs.shape, dtype=bool)
+    cr_mask[np.arange(npix), first_cr] = False
+
+    med = np.zeros(npix, dtype=diffs.dtype)
+    active = np.arange(npix)
+    niter = 0
+
+    while len(active) > 0:
+        niter += 1
+        good = cr_mask[active] & sat_mask[active]
+        adiffs = diffs[active]
+        nactive = len(active)
+        ar = np.arange(nactive)
+
+        # Recompute the masked median for all active pixels, reproducing
+        # np.median: the middle value, or the mean of the two middle values
+        ngood = good.sum(axis=1)
+        sorted_diffs = np.sort(np.where(good, adiffs, np.nan), axis=1)
+        lo = sorted_diffs[ar, (ngood - 1) // 2]
+        hi = sorted_diffs[ar, ngood // 2]
+        amed = np.where(ngood % 2 == 1, lo, (lo + hi) / 2)
+        med[active] = amed
+
+        # Recompute the noise and ratios for the active pixels. The sigma
+        # is accumulated in double precision, as happens for the scalar
+        # values used in the pixel-by-pixel mode.
+        poisson_noise = np.sqrt(np.abs(amed))
+        sigma = np.sqrt((poisson_noise*poisson_noise).astype(np.float64) +
+                        rn2[active].astype(np.float64)/nframes)
+        with np.errstate(invalid='ignore'):
+            ratio = (np.abs(adiffs - amed[:, np.newaxis]) /
+                     sigma[:, np.newaxis].astype(adiffs.dtype))
+
+        # Sort the ratios from largest to smallest deviation and pick the
+        # first group that is not already masked
+        sortindx = np.argsort(ratio, axis=1)[:, ::-1]
+        first_good = np.argmax(good[ar[:, np.newaxis], sortindx], axis=1)
+        candidate = sortindx[ar, first_good]
+        new_cr = good[ar, candidate] & (ratio[ar, candidate] > rej_threshold)
+
+        # Mask the new outliers and keep iterating on those pixels only
+        cr_mask[active[new_cr], candidate[new_cr]] = False
+        active = active[new_cr]
+
+    log.debug('Twopt converged in %d iterations for %d pixels' % (niter, npix))
+
+    # Set CR flags in input DQ array for these pixels; the indexing puts
+    # the pixel axis first, matching the layout of cr_mask
+    gdq[integration, 1:, rows, cols] = np.bitwise_or(
+        gdq[integration, 1:, rows, cols],
+        dqflags.group['JUMP_DET']*np.invert(cr_mask))
+
+    # Save the CR-cleaned median slope for these pixels
+    median_slopes[integration, rows, cols] = med
+
+
+def find_more_CRs_by_pixel(integration, rboth, cboth, total_1, max_index1,
+                           max_index2, first_diffs, read_noise_2, gdq,
+                           median_slopes, rej_threshold, nframes):
+    """
+    Reference implementation of the search for additional outliers, which
+    loops over the pixels that have an outlier one at a time. The groupdq
+    and median slope arrays are updated in place.
+    """
+
+    total_both = len(rboth)
+
+    # Loop over pixels that have an outlier, checking to see if they have
+    # more than 1 outlier
+    for j in range(total_both):
+        # Get the row/col indexes of current pixel with an outlier.
+        # From the concatenate() above, the initial total_1 values (r1,c1)
+        # correspond to the highest outlier, and the remaining values
+        # (r2,c2) correspond to the 2nd highest outlier.
+        row, col = rboth[j], cboth[j]
+        masked_diffs = first_diffs[row, col]
+        rn2 = read_noise_2[row, col]
+
+        # Create a saturation mask based on NaN's in the first_diffs
+        sat_mask = np.isfinite(masked_diffs)
+
+        # Create a CR mask and initialize with the max outlier;
+        # cr_mask=0 designates a CR
+        cr_mask = np.ones(masked_diffs.shape, dtype=bool)
+
+        if j < total_1:   # Set mask for the highest outlier
+            cr_mask[ max_index1[row, col]] = 0
+        else:  # It's the 2nd highest
+            cr_mask[ max_index2[row, col]] = 0
+
+        # Now iteratively search for and reject additional outliers for
+        # this pixel
+        iter = 1
+        while iter:
+            # Recompute the masked median, noise, and ratios for this pixel
+            med = np.median(masked_diffs[cr_mask*sat_mask])
+            poisson_noise = np.sqrt(np.abs(med))
+            sigma = np.sqrt(poisson_noise*poisson_noise + rn2/nframes)
+
+            ratio = np.abs(masked_diffs - med)/sigma
+ 
+            # Get a list of group indexes sorted from largest to smallest
+            # deviation from the median
+            sortindx = np.argsort(ratio)[::-1]
+
+            # Check through the list to see if any qualify as an outlier.
+            # (since they are sorted, once these don't exceed the threshold
+            # you are done with this pixel)
+            
+            for i in sortindx:
+                # If already masked, continue to next index
+                if not cr_mask[i]*sat_mask[i]:
+                    continue
+
+                # If above threshold, set a CR mask and iterate on this pixel
+                elif ratio[i] > rej_threshold:
+                    cr_mask[i] = 0
+                    iter = 1
+                    break
+
+                # If not above threshold, we're done with this pixel
+                else:
+                    iter = 0
+                    break
+
+        # Set CR flags in input DQ array for this pixel
+        gdq[integration, 1:, row, col] = np.bitwise_or \
+                          (gdq[integration, 1:, row, col],
+                           dqflags.group['JUMP_DET']*np.invert(cr_mask))
+        
+        # Save the CR-cleaned median slope for this pixel
+        median_slopes[integration, row, col] = med
+
+    # Next pixel with an outlier (j loop)
@@ -10,6 +10,12 @@ import logging
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
 
+# Relative tolerance within which the y-intercept ratios of the intervals
+# of a semi-ramp are taken as tied.  The differences of a 3-group
+# semi-ramp, for one, are always equal, so which interval is the largest
+# would otherwise depend on how the fits round.
+TIE_TOLERANCE = 1e-8
+
 class PixelRamp(object):
     """
     Base class for a PixelRamp object
@@ -93,6 +99,265 @@ def find_CRs(data, err, gdq, times, read_noise, rejection_threshold, signal_thre
     return
 
 
+def find_CRs_batched(data, err, gdq, times, read_noise, rejection_threshold,
+                     signal_threshold, median_slopes, block_rows=32):
+    """
+    Batched version of `find_CRs`, which gives the same groupdq flags.
+
+    Instead of building a PixelRamp object for each pixel, all of the
+    semi-ramps of the selected pixels within a block of `block_rows` rows
+    are fit together as arrays. Each pass over the list of pending
+    semi-ramps either splits a semi-ramp at its largest y-intercept outlier,
+    adding the two pieces to the next pass, or retires it as good.
+    """
+
+    # Get the attributes of the input data array
+    (nints, ngroups, nrows, ncols) = data.shape
+    group_time = times[1] - times[0]
+
+    for integration in range(nints):
+        for row_start in range(0, nrows, block_rows):
+            row_stop = min(row_start + block_rows, nrows)
+
+            # Select the pixels of this block that are in the read noise
+            # regime
+            rows, cols = np.where(
+                median_slopes[integration, row_start:row_stop] <
+                signal_threshold)
+            if len(rows) == 0:
+                continue
+            rows += row_start
+
+            ramps = data[integration][:, rows, cols].T
+            dqs = gdq[integration][:, rows, cols].T
+            pix, starts, ends = initial_semiramps(dqs)
+
+            # Iterate until no new CRs have been detected
+            while len(pix) > 0:
+                keep = (ends - starts) >= 3
+                pix, starts, ends = pix[keep], starts[keep], ends[keep]
+
+                new_pix = []
+                new_starts = []
+                new_ends = []
+                for groups in np.unique(ends - starts):
+                    this = np.where(ends - starts == groups)[0]
+                    candidate, is_cr = find_semiramp_outliers(
+                        ramps, times, read_noise[rows, cols], pix[this],
+                        starts[this], groups, group_time,
+                        rejection_threshold)
+
+                    # Flag the outliers and split those semi-ramps into
+                    # two pieces for the next pass
+                    cr_pix = pix[this][is_cr]
+                    cr_start = starts[this][is_cr]
+                    cr_group = cr_start + candidate[is_cr] + 1
+                    dqs[cr_pix, cr_group] |= dqflags.group['JUMP_DET']
+                    new_pix.extend([cr_pix, cr_pix])
+                    new_starts.extend([cr_start, cr_group])
+                    new_ends.extend([cr_group, cr_start + groups])
+
+                if len(new_pix) == 0:
+                    break
+                pix = np.concatenate(new_pix)
+                starts = np.concatenate(new_starts)
+                ends = np.concatenate(new_ends)
+
+            # Add any new CR flags to input DQ array
+            gdq[integration, :, rows, cols] = dqs
+
+    return
+
+
+def initial_semiramps(dqs):
+    """
+    Set up the semi-ramps of a set of pixels based on any existing CR and
+    SAT flags, in the same way as PixelRamp does for a single pixel.
+
+    Returns the pixel index, start group and end group (exclusive) of
+    every semi-ramp.
+    """
+
+    npix, ngroups = dqs.shape
+    group_index = np.arange(ngroups)
+
+    # Each ramp ends at the first saturated group
+    saturated = (dqs & dqflags.group['SATURATED']) != 0
+    num_groups = np.where(saturated.any(axis=1),
+                          saturated.argmax(axis=1), ngroups)
+
+    # A new semi-ramp starts at the beginning of the ramp and at each CR
+    # flagged before the ramp ends
+    jumps = ((dqs & dqflags.group['JUMP_DET']) != 0) & \
+            (group_index < num_groups[:, np.newaxis])
+    jump_pix, jump_group = np.where(jumps)
+    pix = np.concatenate((np.arange(npix), jump_pix))
+    starts = np.concatenate((np.zeros(npix, dtype=int), jump_group))
+    order = np.lexsort((starts, pix))
+    pix, starts = pix[order], starts[order]
+
+    # Each semi-ramp ends where the next one of the same pixel starts
+    ends = num_groups[pix]
+    same_pix = pix[:-1] == pix[1:]
+    ends[:-1][same_pix] = starts[1:][same_pix]
+
+    return pix, starts, ends
+
+
+def find_semiramp_outliers(ramps, times, read_noise, pix, starts, groups,
+                           group_time, rejection_threshold):
+    """
+    Apply the y-intercept test to a set of semi-ramps that all have the
+    same number of groups.
+
+    Returns the interval of the largest outlier in each semi-ramp and
+    whether it is above the rejection threshold.
+    """
+
+    # Copy the times and counts for these semi-ramps to working arrays
+    offsets = starts[:, np.newaxis] + np.arange(groups)
+    counts = ramps[pix[:, np.newaxis], offsets].astype(np.float64)
+    semi_times = times[offsets]
+    readnoise = read_noise[pix]
+
+    # Compute the y-intercepts for all intervals in these semi-ramps
+    slopes, slope_errs, yints, yint_errs = fit_semiramps(semi_times, counts,
+                                                         readnoise)
+
+    # The expected uncertainty is computed from the slope pair and the
+    # y-intercept errors of the last interval in each semi-ramp, which is
+    # what the pixel-by-pixel yint() ends up using for all intervals
+    avg_slopes = average_slope_pairs(slopes[:, -1], slope_errs[:, -1])
+    pnoise = np.sqrt(np.abs(avg_slopes) * group_time)
+    yerr_exp = np.sqrt(pnoise * pnoise +
+                       yint_errs[:, -1, 0] * yint_errs[:, -1, 0] +
+                       yint_errs[:, -1, 1] * yint_errs[:, -1, 1])
+
+    # Scale the differences in adjacent y-intercepts by the expected
+    # uncertainties and check for an outlier above the rejection threshold
+    ydiff = np.abs(yints[:, :, 1] - yints[:, :, 0])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio = ydiff / yerr_exp[:, np.newaxis]
+    candidate = outlier_candidates(ratio)
+    with np.errstate(invalid='ignore'):
+        is_cr = ratio[np.arange(len(pix)), candidate] > rejection_threshold
+
+    return candidate, is_cr
+
+
+def fit_semiramps(times, counts, readnoise):
+    """
+    Fit the slopes and y-intercepts for all possible sample combinations
+    within a set of semi-ramps of the same length; this is the batched
+    equivalent of `fit_semiramp`.
+    """
+
+    # Create empty arrays for the results
+    nramps, groups = times.shape
+    slopes = np.empty((nramps, groups - 1, 2))
+    slope_errs = np.empty((nramps, groups - 1, 2))
+    yints = np.empty((nramps, groups - 1, 2))
+    yint_errs = np.empty((nramps, groups - 1, 2))
+
+    # The left-hand side of the first sample pair is just the counts in
+    # the first sample, and the right-hand side of the last sample pair is
+    # just the counts in the last sample
+    slopes[:, 0, 0], slope_errs[:, 0, 0] = 0., 999999.
+    yints[:, 0, 0], yint_errs[:, 0, 0] = counts[:, 0], readnoise
+    slopes[:, -1, 1], slope_errs[:, -1, 1] = 0., 999999.
+    yints[:, -1, 1], yint_errs[:, -1, 1] = counts[:, -1], readnoise
+
+    for group in range(groups - 1):
+
+        # The left-hand side of each sample pair is extrapolated forward
+        # one group to the time of the next sample
+        if group > 0:
+            (slopes[:, group, 0], slope_errs[:, group, 0],
+                yints[:, group, 0], yint_errs[:, group, 0]) = \
+                fit_lines(times[:, :group + 1] -
+                          times[:, group + 1:group + 2],
+                          counts[:, :group + 1], readnoise)
+
+        # The right-hand side of the first sample pair is extrapolated
+        # backwards one group; the others are set to the time of the
+        # sample itself
+        if group == 0:
+            (slopes[:, 0, 1], slope_errs[:, 0, 1],
+                yints[:, 0, 1], yint_errs[:, 0, 1]) = \
+                fit_lines(times[:, 1:] - times[:, :1], counts[:, 1:],
+                          readnoise)
+        elif group < groups - 2:
+            (slopes[:, group, 1], slope_errs[:, group, 1],
+                yints[:, group, 1], yint_errs[:, group, 1]) = \
+                fit_lines(times[:, group + 1:] -
+                          times[:, group + 1:group + 2],
+                          counts[:, group + 1:], readnoise)
+
+    return slopes, slope_errs, yints, yint_errs
+
+
+def fit_lines(xx, yy, readnoise, max_elements=2**22):
+    """
+    Fit 1st-order polynomials to a set of x/y ramp values, one per row of
+    the input arrays; this is the batched equivalent of `fit_line` with
+    random=True.
+
+    The fits are done in chunks so that the stack of covariance matrices
+    holds no more than about `max_elements` values.
+    """
+
+    nfits, nn = xx.shape
+
+    # Initial slope estimate, from which Poisson noise is estimated
+    xmean = xx.mean(axis=1)
+    ymean = yy.mean(axis=1)
+    dx = xx - xmean[:, np.newaxis]
+    slope = (dx * (yy - ymean[:, np.newaxis])).sum(axis=1) / \
+            (dx * dx).sum(axis=1)
+    yint = ymean - slope * xmean
+    photon_noise = np.sqrt(np.abs(slope) * (xx[:, 1] - xx[:, 0]))
+    pn2 = photon_noise * photon_noise
+    readnoise = readnoise.astype(np.float64)
+
+    if nn < 3:
+        return slope, np.sqrt(pn2 / 2.), yint, readnoise
+
+    mm = np.empty(nfits)
+    mm_err = np.empty(nfits)
+    bb = np.empty(nfits)
+    bb_err = np.empty(nfits)
+
+    # Photon noise (correlated) and read noise (uncorrelated) parts of the
+    # full covariance matrix
+    index = np.arange(nn)
+    correlated = np.minimum.outer(index, index) + 1.
+    identity = np.identity(nn)
+
+    chunk = max(1, max_elements // (nn * nn))
+    for first in range(0, nfits, chunk):
+        sl = slice(first, first + chunk)
+        rn2 = readnoise[sl] * readnoise[sl]
+        CC = pn2[sl, np.newaxis, np.newaxis] * correlated + \
+             rn2[:, np.newaxis, np.newaxis] * identity
+
+        # Compute intercept and slope by solving matrices
+        AA = np.stack((np.ones_like(xx[sl]), xx[sl]), axis=2)
+        AAT = AA.transpose(0, 2, 1)
+        CCI = np.linalg.inv(CC)
+        part1 = np.linalg.inv(np.matmul(AAT, np.matmul(CCI, AA)))
+        part2 = np.matmul(AAT, np.matmul(CCI, yy[sl, :, np.newaxis]))
+        XX = np.matmul(part1, part2)
+        bb[sl], mm[sl] = XX[:, 0, 0], XX[:, 1, 0]
+
+        # Calculate uncertainties on slope and intercept, using only the
+        # read noise for the intercept
+        mm_err[sl] = np.sqrt(part1[:, 1, 1])
+        part1 = np.matmul(AAT, AA * (1. / rn2)[:, np.newaxis, np.newaxis])
+        bb_err[sl] = np.sqrt(np.linalg.inv(part1)[:, 0, 0])
+
+    return mm, mm_err, bb, bb_err
+
+
 def mean_ramp_slope(ramp, read_noise):
     """
     Compute the slope of a entire pixel ramp, using the weighted mean
@@ -199,7 +464,7 @@ def yint(ramp, read_noise, rejection_threshold):
             ratio = ydiff[:, 0] / yerr_exp
 
             # Check for an outlier that is above rejection threshold
-            candidate = ratio.argmax()
+            candidate = int(outlier_candidates(ratio))
             if ratio[candidate] > rejection_threshold:
 
                 # Save the position of the outlier and break
@@ -306,6 +571,23 @@ def fit_semiramp(times, counts, readnoise):
     return slopes, slope_errs, yints, yint_errs
 
 
+def outlier_candidates(ratio):
+    """
+    Find the interval with the largest y-intercept ratio, along the last
+    axis of `ratio`.  Ratios within `TIE_TOLERANCE` of the largest are
+    tied, and the first of them is taken, so that the pixel-by-pixel and
+    batched fits, which round differently, pick the same interval.  If
+    there is a NaN ratio, the first NaN is taken, as by argmax.
+    """
+
+    ratio = np.asarray(ratio)
+    best = ratio.max(axis=-1)
+    with np.errstate(invalid='ignore'):
+        tied = ratio >= (best * (1. - TIE_TOLERANCE))[..., np.newaxis]
+    return np.where(np.isnan(best), ratio.argmax(axis=-1),
+                    tied.argmax(axis=-1))
+
+
 def average_slope_pairs(slopes, slope_errs):
     """
     Compute the weighted average of the slopes for each sample pair
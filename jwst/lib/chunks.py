@@ -0,0 +1,294 @@
+"""
+Processing 4-D ramp data in blocks of integrations and rows
+
+Detector level steps apply the same operation to every pixel of every
+group, so the ``(nints, ngroups, ny, nx)`` science cube can be processed
+one block of rows of one integration at a time.  The temporary arrays of
+such a step are then the size of a block rather than of the whole cube,
+and the blocks, which do not overlap, may be processed by several
+threads at once.
+
+The science data need not be in memory either: `open_output` makes the
+output model of such a step without copying the science arrays of its
+input, which may be memory mapped, and `apply_kernel` then copies each
+block from the input just before processing it.
+"""
+from __future__ import absolute_import, division, print_function
+
+import tempfile
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+
+__all__ = ['DEFAULT_CHUNK_SIZE', 'SCIENCE_ARRAYS', 'RampChunk', 'ChunkKernel',
+           'iter_chunks', 'process_chunks', 'open_output', 'finish_output',
+           'apply_kernel', 'fuse_kernels']
+
+
+# The default size of a block of science data, in megabytes
+DEFAULT_CHUNK_SIZE = 64.
+
+# The 4-D arrays of a ramp model that are processed block by block
+SCIENCE_ARRAYS = ('data', 'err', 'groupdq')
+
+
+class RampChunk(namedtuple('RampChunk', ['integration', 'ystart', 'ystop'])):
+    """
+    A block of rows ``ystart:ystop`` of one integration of a ramp cube.
+    """
+    __slots__ = ()
+
+    @property
+    def rows(self):
+        """
+        The slice of the rows of the block.
+        """
+        return slice(self.ystart, self.ystop)
+
+    def science(self, array):
+        """
+        Get the block of a 4-D science array, such as the SCI, ERR or
+        GROUPDQ array.
+
+        Returns
+        -------
+        view : ndarray
+            A ``(ngroups, nrows, nx)`` view of `array`, so that changing
+            it in place changes `array`.
+        """
+        return array[self.integration, :, self.ystart:self.ystop, :]
+
+    def rows_of(self, array):
+        """
+        Get the rows of the block from a reference array, or from any
+        array whose last two axes are the rows and columns of the
+        science data, such as the PIXELDQ array.
+
+        Reference arrays must first be cut to the science subarray, with
+        the ``get_subarray`` helper of the step.
+        """
+        return array[..., self.ystart:self.ystop, :]
+
+
+class ChunkKernel(namedtuple('ChunkKernel', ['func', 'split_rows'])):
+    """
+    An operation applied to the science data one block at a time.
+
+    ``func(chunk)`` changes the arrays of the block `RampChunk` in place.
+    ``split_rows`` is False if the operation needs whole integrations.
+    """
+    __slots__ = ()
+
+    def __new__(cls, func, split_rows=True):
+        return super(ChunkKernel, cls).__new__(cls, func, split_rows)
+
+
+def iter_chunks(shape, itemsize=4, chunk_size=None, split_rows=True):
+    """
+    Iterate over the blocks of a ramp cube.
+
+    Parameters
+    ----------
+    shape : tuple
+        The ``(nints, ngroups, ny, nx)`` shape of the science data.
+
+    itemsize : int, optional
+        The size in bytes of an element of the largest science array
+        processed.
+
+    chunk_size : float, optional
+        The maximum size of a block, in megabytes.  A block has at least
+        one row.  Defaults to `DEFAULT_CHUNK_SIZE`.
+
+    split_rows : bool, optional
+        If False, each block is a whole integration, for operations that
+        need the neighbours of a pixel, such as a convolution.
+
+    Yields
+    ------
+    chunk : RampChunk
+    """
+    if chunk_size is None:
+        chunk_size = DEFAULT_CHUNK_SIZE
+    nints, ngroups, ny, nx = shape
+    if split_rows:
+        row_bytes = max(1, ngroups * nx * itemsize)
+        nrows = int(chunk_size * 2 ** 20) // row_bytes
+        nrows = max(1, min(ny, nrows))
+    else:
+        nrows = max(1, ny)
+    for integration in range(nints):
+        for ystart in range(0, ny, nrows):
+            yield RampChunk(integration, ystart, min(ystart + nrows, ny))
+
+
+def process_chunks(func, shape, itemsize=4, chunk_size=None, threads=1,
+                   split_rows=True):
+    """
+    Call a function on each block of a ramp cube.
+
+    The function is expected to change the arrays of its blocks in place.
+    With more than one thread, it is called on several blocks at once,
+    so it must only change the arrays of the block it is given.  numpy
+    releases the GIL in most array operations, so the blocks are then
+    processed in parallel.
+
+    Parameters
+    ----------
+    func : callable
+        Called as ``func(chunk)`` with each `RampChunk`.
+
+    shape, itemsize, chunk_size, split_rows
+        See `iter_chunks`.
+
+    threads : int, optional
+        The number of threads processing the blocks.
+    """
+    chunks = iter_chunks(shape, itemsize=itemsize, chunk_size=chunk_size,
+                         split_rows=split_rows)
+    if threads is None or threads <= 1:
+        for chunk in chunks:
+            func(chunk)
+        return
+
+    pool = ThreadPool(threads)
+    try:
+        # Consume the results, so that the first error is raised here
+        for _ in pool.imap_unordered(func, chunks):
+            pass
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def open_output(input, directory=None):
+    """
+    Open the input of a step that processes it block by block, and make
+    the output model of the step, without reading or copying the science
+    arrays of the input.
+
+    The output is a copy of the input that shares its other arrays until
+    it uses them, as made by ``copy(share_arrays=True)``.  Its science
+    arrays, those of `SCIENCE_ARRAYS` the input has, are new and empty:
+    `apply_kernel` fills them block by block from the input.
+
+    Parameters
+    ----------
+    input : DataModel instance or str
+        The input.  A file name is opened with ``lazy=True``, so that a
+        FITS file is memory mapped, and only the blocks being processed
+        are read; the arrays of a FITS file that are scaled with BZERO or
+        BSCALE are still read whole.
+
+    directory : str, optional
+        If given, the science arrays of the output are memory mapped to
+        temporary files in this directory, so that data larger than the
+        memory can be processed.  The files are deleted when the arrays
+        are.  By default, they are held in memory.
+
+    Returns
+    -------
+    input_model, output_model : DataModel instances
+        The input, which must stay open until `finish_output` is called,
+        and the output.
+    """
+    from .. import datamodels
+
+    if isinstance(input, datamodels.DataModel):
+        input_model = input
+    else:
+        input_model = datamodels.open(input, lazy=True)
+
+    output_model = input_model.copy(share_arrays=True)
+    for name in SCIENCE_ARRAYS:
+        if not input_model._has_array(name):
+            continue
+        array = getattr(input_model, name)
+        dtype = array.dtype.newbyteorder('=')
+        if directory is None:
+            output = np.empty(array.shape, dtype=dtype)
+        else:
+            output = np.memmap(tempfile.TemporaryFile(dir=directory),
+                               dtype=dtype, mode='w+', shape=array.shape)
+        setattr(output_model, name, output)
+    return input_model, output_model
+
+
+def finish_output(input, input_model, output_model):
+    """
+    Read the arrays the output model of `open_output` still shares with
+    its input, and close the input if `open_output` opened it.
+    """
+    output_model._load_lazy_arrays()
+    if input_model is not input:
+        input_model.close()
+
+
+def apply_kernel(kernel, model, chunk_size=None, threads=1, source=None):
+    """
+    Apply a kernel to the science data of a ramp model, one block at a
+    time.
+
+    Parameters
+    ----------
+    kernel : ChunkKernel or None
+        The operation to apply.  Nothing is done if it is None.
+
+    model : RampModel instance
+        The model, whose arrays the kernel changes in place.
+
+    chunk_size, threads
+        See `process_chunks`.
+
+    source : RampModel instance, optional
+        The input of `open_output`, that ``model`` was made from.  Each
+        block of its science arrays is copied into ``model`` before the
+        kernel is applied to it.
+    """
+    if source is not None:
+        names = [name for name in SCIENCE_ARRAYS
+                 if source._has_array(name) and model._has_array(name)]
+        pairs = [(getattr(source, name), getattr(model, name))
+                 for name in names]
+        if kernel is None:
+            kernel = ChunkKernel(lambda chunk: None)
+
+        def func(chunk, kernel_func=kernel.func):
+            for array, output in pairs:
+                chunk.science(output)[...] = chunk.science(array)
+            kernel_func(chunk)
+
+        kernel = ChunkKernel(func, kernel.split_rows)
+
+    if kernel is None:
+        return
+    process_chunks(kernel.func, model.data.shape,
+                   itemsize=model.data.itemsize, chunk_size=chunk_size,
+                   threads=threads, split_rows=kernel.split_rows)
+
+
+def fuse_kernels(kernels):
+    """
+    Combine kernels into one, which applies each of them in turn to a
+    block.  The data then go through all of the operations in a single
+    pass.
+
+    Parameters
+    ----------
+    kernels : list of ChunkKernel
+
+    Returns
+    -------
+    kernel : ChunkKernel
+        The blocks are whole integrations if any of the kernels needs
+        them.
+    """
+    funcs = [kernel.func for kernel in kernels]
+
+    def func(chunk):
+        for kernel_func in funcs:
+            kernel_func(chunk)
+
+    return ChunkKernel(func, all(kernel.split_rows for kernel in kernels))
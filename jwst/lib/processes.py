@@ -0,0 +1,55 @@
+"""
+Sizing and starting pools of worker processes
+"""
+from __future__ import absolute_import, division, print_function
+
+import multiprocessing
+import os
+
+
+__all__ = ['get_max_processes', 'fork_context']
+
+
+def get_max_processes(max_cores):
+    """
+    Calculate the number of worker processes to use.
+
+    Parameters
+    ----------
+    max_cores : str
+        Fraction of the available cores to use: 'none', 'quarter', 'half'
+        or 'all'.
+
+    Returns
+    -------
+    nproc : int
+        Number of processes, at least 1.
+    """
+    if max_cores == 'none':
+        return 1
+
+    num_cores = multiprocessing.cpu_count()
+    fractions = {'quarter': 4, 'half': 2, 'all': 1}
+
+    return max(1, num_cores // fractions[max_cores])
+
+
+def fork_context():
+    """
+    Get the multiprocessing context that starts worker processes by
+    forking this one.
+
+    Pools whose initializer is handed objects that cannot be pickled, such
+    as steps, need their workers to be forked, whatever the default start
+    method of the platform is.
+
+    Returns
+    -------
+    context : multiprocessing context or module, or None
+        None if processes cannot be forked here, as on Windows.
+    """
+    if not hasattr(os, 'fork'):
+        return None
+    if hasattr(multiprocessing, 'get_context'):
+        return multiprocessing.get_context('fork')
+    return multiprocessing
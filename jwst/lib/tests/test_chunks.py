@@ -0,0 +1,82 @@
+"""Test processing ramp data in blocks"""
+import numpy as np
+import pytest
+
+from ...datamodels import RampModel
+from ..chunks import (ChunkKernel, apply_kernel, iter_chunks, open_output,
+                      process_chunks)
+
+
+class RecordingArray(np.ndarray):
+    """An array recording the indexes it is read with"""
+    def __getitem__(self, key):
+        self.__dict__.setdefault('reads', []).append(key)
+        return np.ndarray.__getitem__(self, key).view(np.ndarray)
+
+
+def test_iter_chunks_cover_cube():
+    shape = (3, 4, 10, 8)
+    data = np.zeros(shape, dtype=np.float32)
+    # Room for 3 rows of 4 groups of 8 float32 pixels
+    chunk_size = 3 * 4 * 8 * 4 / 2. ** 20
+    for chunk in iter_chunks(shape, chunk_size=chunk_size):
+        assert chunk.ystop - chunk.ystart <= 3
+        chunk.science(data)[...] += 1
+    assert np.all(data == 1)
+
+
+def test_iter_chunks_whole_integrations():
+    chunks = list(iter_chunks((2, 4, 10, 8), chunk_size=1e-6,
+                              split_rows=False))
+    assert [(c.integration, c.ystart, c.ystop) for c in chunks] == \
+        [(0, 0, 10), (1, 0, 10)]
+
+
+@pytest.mark.parametrize('threads', [1, 3])
+def test_process_chunks(threads):
+    data = np.arange(2 * 3 * 50 * 6, dtype=np.float32).reshape(2, 3, 50, 6)
+    reference = np.arange(50 * 6, dtype=np.float32).reshape(50, 6)
+    expected = data - reference
+
+    def subtract(chunk):
+        chunk.science(data)[...] -= chunk.rows_of(reference)
+
+    process_chunks(subtract, data.shape, chunk_size=1e-4, threads=threads)
+    assert np.all(data == expected)
+
+
+def test_process_chunks_error():
+    def fail(chunk):
+        raise ValueError(chunk.integration)
+
+    with pytest.raises(ValueError):
+        process_chunks(fail, (2, 3, 50, 6), threads=2)
+
+
+@pytest.mark.parametrize('memmap', [False, True])
+def test_apply_kernel_reads_blocks(memmap, tmpdir):
+    data = np.arange(2 * 3 * 10 * 4, dtype=np.float32).reshape(2, 3, 10, 4)
+    source = data.copy().view(RecordingArray)
+
+    with RampModel(data=source) as input_model:
+        input_model, output_model = open_output(
+            input_model, str(tmpdir) if memmap else None)
+        output = output_model.data
+        assert output is not source
+        assert isinstance(output, np.memmap) == memmap
+
+        def add_one(chunk):
+            chunk.science(output)[...] += 1
+
+        # Room for 3 rows of 3 groups of 4 float32 pixels
+        source.reads = []
+        apply_kernel(ChunkKernel(add_one), output_model,
+                     chunk_size=3 * 3 * 4 * 4 / 2. ** 20, source=input_model)
+
+        # The input was only read one block of rows at a time
+        assert len(source.reads) == 2 * 4
+        for key in source.reads:
+            assert key[2].stop - key[2].start <= 3
+
+        assert np.all(output_model.data == data + 1)
+        assert np.all(input_model.data == data)
@@ -1,7 +1,12 @@
 from __future__ import division
 
 from ..datamodels import dqflags
-from .linearity_func import apply_linearity_func
+from ..lib import chunks
+from .linearity_func import linearity_kernel
+
+from collections import OrderedDict
+import os
+import threading
 
 import numpy as np
 import logging
@@ -9,8 +14,14 @@ import logging
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
 
+# The coefficient masks of the most recently used reference files, by
+# reference file and subarray.  See get_coeff_masks.
+_MASKS_CACHE_SIZE = 8
+_masks_cache = OrderedDict()
+_masks_lock = threading.Lock()
+
 
-def do_correction(input_model, lin_model):
+def do_correction(input_model, lin_model, chunk_size=None, threads=1):
     """
     Short Summary
     -------------
@@ -24,6 +35,12 @@ def do_correction(input_model, lin_model):
     lin_model: linearity model object
         linearity reference file data model
 
+    chunk_size: float
+        Size in MB of the blocks of rows the data are corrected in
+
+    threads: int
+        Number of threads correcting the blocks
+
     Returns
     -------
     output_model: data model object
@@ -33,13 +50,43 @@ def do_correction(input_model, lin_model):
     # Create the output model as a copy of the input
     output_model = input_model.copy()
 
+    kernel = prepare_correction(output_model, lin_model)
+    chunks.apply_kernel(kernel, output_model, chunk_size, threads)
+
+    return output_model
+
+
+def prepare_correction(output_model, lin_model, ref_name=None):
+    """
+    Short Summary
+    -------------
+    Propagate the DQ flags of the linearity reference data into a science
+    data model in place, and get the operation that applies the linearity
+    correction one block of the data at a time.
+
+    Parameters
+    ----------
+    output_model: data model object
+        science data model to be corrected in place
+
+    lin_model: linearity model object
+        linearity reference file data model
+
+    ref_name: string
+        path of the linearity reference file, used to cache the masks of
+        its coefficients
+
+    Returns
+    -------
+    kernel: ChunkKernel
+        the operation correcting a block
+
+    """
     # Propagate the DQ flags from the linearity ref data into the 2D science DQ
     propagate_dq_info(output_model, lin_model)
 
-    # Apply the linearity correction coeffs to the science data
-    apply_linearity(output_model, lin_model)
-
-    return output_model
+    # Get the correction by the linearity coeffs of the science data
+    return prepare_linearity(output_model, lin_model, ref_name)
 
 
 def propagate_dq_info(input, linearity_ref_model):
@@ -72,7 +119,7 @@ def propagate_dq_info(input, linearity_ref_model):
     input.pixeldq = np.bitwise_or(input.pixeldq, lindq)
 
 
-def apply_linearity(input, linearity_ref_model):
+def apply_linearity(input, linearity_ref_model, chunk_size=None, threads=1):
     """
     Short Summary
     -------------
@@ -87,16 +134,53 @@ def apply_linearity(input, linearity_ref_model):
 
     linearity_ref_model: linearity reference file model object
 
+    chunk_size: float
+        Size in MB of the blocks of rows the data are corrected in
+
+    threads: int
+        Number of threads correcting the blocks
+
+    Returns
+    -------
+    """
+
+    kernel = prepare_linearity(input, linearity_ref_model)
+    chunks.apply_kernel(kernel, input, chunk_size, threads)
+
+
+def prepare_linearity(input, linearity_ref_model, ref_name=None):
+    """
+    Short Summary
+    -------------
+
+    Get the operation that applies the linearity correction to the pixels
+    of a block of the science ramp data that have not been flagged as
+    saturated by the saturation step.
+
+    Parameters
+    ----------
+    input: data model object
+        The input science data to be corrected in place
+
+    linearity_ref_model: linearity reference file model object
+
+    ref_name: string
+        path of the linearity reference file, used to cache the masks of
+        its coefficients
+
     Returns
     -------
+    kernel: ChunkKernel
+        the operation correcting a block
     """
 
     ramp = input.data
     dq = input.groupdq
 
-    # If the input data does not have an expanded DQ array, create one
+    # If the input data does not have an expanded DQ array, no group
+    # has been flagged as saturated
     if len(dq) == 0:
-        dq = (ramp * 0).astype(np.uint32)
+        dq = None
 
     # Check for subarray mode
     if ref_matches_sci(linearity_ref_model, input):
@@ -106,17 +190,27 @@ def apply_linearity(input, linearity_ref_model):
         lin_coeffs = get_subarray(linearity_ref_model.coeffs, input)
         lin_dq = get_subarray(linearity_ref_model.dq, input)
 
+    # Find the pixels flagged as NO_LIN_CORR in the DQ extension of the
+    # ref file, and those with NaN coefficients
+    if ref_name is not None and os.path.exists(ref_name):
+        key = (os.path.abspath(ref_name), os.path.getmtime(ref_name),
+               lin_coeffs.shape, input.meta.subarray.xstart,
+               input.meta.subarray.ystart)
+    else:
+        key = None
+    flag_mask, nan_mask = get_coeff_masks(lin_coeffs, lin_dq, key)
+
     # Check for NO_LIN_CORR flags in the DQ extension of the ref file
-    lin_coeffs = correct_for_flag(lin_coeffs, lin_dq)
+    lin_coeffs = correct_for_flag(lin_coeffs, lin_dq, flag_mask)
 
     # Check for NaNs in the COEFFS extension of the ref file
-    lin_coeffs = correct_for_NaN(lin_coeffs, input)
+    lin_coeffs = correct_for_NaN(lin_coeffs, input, nan_mask)
 
     # Get the DQ bit value that represents saturation
     sat_val = dqflags.group['SATURATED']
 
-    # Apply the correction function
-    input.data = apply_linearity_func(ramp, dq, lin_coeffs, sat_val)
+    # Get the correction function
+    return linearity_kernel(ramp, dq, lin_coeffs, sat_val)
 
 
 def ref_matches_sci(ref_model, sci_model):
@@ -149,7 +243,61 @@ def ref_matches_sci(ref_model, sci_model):
         return False
 
 
-def correct_for_NaN(lin_coeffs, input):
+def get_coeff_masks(lin_coeffs, lin_dq, key=None):
+    """
+    Short Summary
+    -------------
+    Find the pixels whose coefficients in the ref file must be replaced by
+    benign coefficients: those flagged as NO_LIN_CORR in the DQ extension,
+    and the other pixels having at least one NaN coefficient.  The masks
+    are cached by key, so that they are only computed once per reference
+    file and subarray.
+
+    Parameters
+    ----------
+    lin_coeffs: 3D array
+        array of correction coefficients in reference file
+
+    lin_dq: 2D array
+        array of data quality flags in reference file
+
+    key: hashable
+        identifies the reference file and subarray of lin_coeffs, or None
+        to not cache the masks
+
+    Returns
+    -------
+    flag_mask: 2D boolean array
+        True for pixels flagged as NO_LIN_CORR
+
+    nan_mask: 2D boolean array
+        True for the other pixels having NaN coefficients
+    """
+
+    if key is not None:
+        with _masks_lock:
+            masks = _masks_cache.pop(key, None)
+            if masks is not None:
+                # Move it to the end, as the most recently used
+                _masks_cache[key] = masks
+                return masks
+
+    flag_mask = (np.bitwise_and(lin_dq, dqflags.pixel['NO_LIN_CORR']) ==
+                 dqflags.pixel['NO_LIN_CORR'])
+    nan_mask = np.isnan(lin_coeffs).any(axis=0)
+    nan_mask &= ~flag_mask
+    masks = (flag_mask, nan_mask)
+
+    if key is not None:
+        with _masks_lock:
+            _masks_cache[key] = masks
+            while len(_masks_cache) > _MASKS_CACHE_SIZE:
+                _masks_cache.popitem(last=False)
+
+    return masks
+
+
+def correct_for_NaN(lin_coeffs, input, nan_mask=None):
     """
     Short Summary
     -------------
@@ -167,28 +315,26 @@ def correct_for_NaN(lin_coeffs, input):
     input: data model object
         science data model to be corrected in place
 
+    nan_mask: 2D boolean array
+        the pixels having NaN coefficients, if already known
+
     Returns
     -------
     lin_coeffs: 3D array
         updated array of correction coefficients in reference file
     """
 
-    wh_nan = np.where(np.isnan(lin_coeffs))
-    znan, ynan, xnan = wh_nan[0], wh_nan[1], wh_nan[2]
-    num_nan = 0
-
-    nan_array = np.zeros((lin_coeffs.shape[1], lin_coeffs.shape[2]),
-                         dtype=np.uint32)
+    if nan_mask is None:
+        nan_mask = np.isnan(lin_coeffs).any(axis=0)
 
     # If there are NaNs as the correction coefficients, update those
     # coefficients so that those SCI values will be unchanged.
-    if len(wh_nan[0]) > 0:
+    if nan_mask.any():
         ben_cor = ben_coeffs(lin_coeffs) # get benign coefficients
-        num_nan = len(wh_nan[0])
 
-        for ii in range(num_nan):
-            lin_coeffs[:, ynan[ii], xnan[ii]] = ben_cor
-            nan_array[ynan[ii], xnan[ii]] = dqflags.pixel['NO_LIN_CORR']
+        lin_coeffs[:, nan_mask] = ben_cor[:, np.newaxis]
+        nan_array = np.where(nan_mask, dqflags.pixel['NO_LIN_CORR'],
+                             0).astype(np.uint32)
 
         # Include these pixels in the output pixeldq
         input.pixeldq = np.bitwise_or(input.pixeldq, nan_array)
@@ -200,7 +346,7 @@ def correct_for_NaN(lin_coeffs, input):
     return lin_coeffs
 
 
-def correct_for_flag(lin_coeffs, lin_dq):
+def correct_for_flag(lin_coeffs, lin_dq, flag_mask=None):
     """
     Short Summary
     -------------
@@ -218,25 +364,25 @@ def correct_for_flag(lin_coeffs, lin_dq):
     lin_dq: 2D array
         array of data quality flags in reference file
 
+    flag_mask: 2D boolean array
+        the pixels flagged as NO_LIN_CORR, if already known
+
     Returns
     -------
     lin_coeffs: 3D array
         updated array of correction coefficients in reference file
     """
 
-    wh_flag = np.bitwise_and(lin_dq, dqflags.pixel['NO_LIN_CORR'])
-    num_flag = len(np.where(wh_flag > 0)[0])
-
-    wh_lin = np.where(wh_flag == dqflags.pixel['NO_LIN_CORR'])
-    yf, xf = wh_lin[0], wh_lin[1]
+    if flag_mask is None:
+        flag_mask = (np.bitwise_and(lin_dq, dqflags.pixel['NO_LIN_CORR']) ==
+                     dqflags.pixel['NO_LIN_CORR'])
 
     # If there are pixels flagged as 'NO_LIN_CORR', update the corresponding
     #     coefficients so that those SCI values will be unchanged.
-    if (num_flag > 0):
+    if flag_mask.any():
         ben_cor = ben_coeffs(lin_coeffs) # get benign coefficients
 
-        for ii in range(num_flag):
-            lin_coeffs[:, yf[ii], xf[ii]] = ben_cor
+        lin_coeffs[:, flag_mask] = ben_cor[:, np.newaxis]
 
         log.debug("Pixels were flagged in the DQ of the reference file as"
                   " NO_LIN_CORR ('Linearity correction not available'); for"
@@ -7,7 +7,10 @@ log.setLevel(logging.DEBUG)
 
 import numpy as np
 
-def apply_linearity_func(ramparr, dqarr, coeffarr, dq_flag):
+from ..lib import chunks
+
+def apply_linearity_func(ramparr, dqarr, coeffarr, dq_flag, chunk_size=None,
+                         threads=1):
     """
     Short Summary
     -------------
@@ -33,37 +36,80 @@ def apply_linearity_func(ramparr, dqarr, coeffarr, dq_flag):
     dq_flag: Integer value representing the saturation flag value that was
              applied to dqarr by the saturation step
 
+    chunk_size: Size in MB of the blocks of rows the data are corrected in
+
+    threads: Number of threads correcting the blocks
+
     Returns
     -------
     ramparr: Linearity corrected 4D array containing ramp data
 
     """
 
-    # Retrieve the ramp data cube characteristics
-    nints, ngroups, nrows, ncols = ramparr.shape
+    kernel = linearity_kernel(ramparr, dqarr, coeffarr, dq_flag)
+    chunks.process_chunks(kernel.func, ramparr.shape,
+                          itemsize=ramparr.itemsize, chunk_size=chunk_size,
+                          threads=threads)
 
-    # Number of coeffs is equal to the number of planes in coeff cube
-    ncoeffs = coeffarr.shape[0]
+    return ramparr
 
-    # Apply the linearity correction one integration at a time.
-    for ints in range(nints):
 
-        # Apply the linearity correction one group at a time
-        for plane in range(ngroups):
+def linearity_kernel(ramparr, dqarr, coeffarr, dq_flag):
+    """
+    Short Summary
+    -------------
+    Get the operation that applies the linearity correction in place to
+    one block of rows of an integration of ramparr at a time.  See
+    apply_linearity_func.
 
-            # Accumulate the polynomial terms into the corrected counts
-            scorr = coeffarr[ncoeffs - 1] * ramparr[ints, plane]
-            for j in range(ncoeffs - 2, 0, -1):
-                scorr = (scorr + coeffarr[j]) * ramparr[ints, plane]
-            scorr = coeffarr[0] + scorr
+    Parameters
+    ----------
+    ramparr: 4D array containing ramp data
 
-           # Only use the corrected signal where the original signal value
-           # has not been flagged by the saturation step.
-           # Otherwise use the original signal.
-            ramparr[ints, plane, :, :] = \
-                np.where(np.bitwise_and(dqarr[ints, plane, :, :], dq_flag),\
-                        ramparr[ints, plane, :, :], scorr)
+    dqarr: 4D array containing DQ information, or None if no group has
+           been flagged
 
-    del scorr
+    coeffarr: 3D array containing pixel-by-pixel linearity coefficient values
+              for each term in the polynomial fit.
 
-    return ramparr
+    dq_flag: Integer value representing the saturation flag value that was
+             applied to dqarr by the saturation step
+
+    Returns
+    -------
+    kernel: ChunkKernel applying the correction to a block
+
+    """
+
+    # Retrieve the ramp data cube characteristics
+    nints, ngroups, nrows, ncols = ramparr.shape
+
+    # Number of coeffs is equal to the number of planes in coeff cube
+    ncoeffs = coeffarr.shape[0]
+
+    # Apply the linearity correction one block of rows of an
+    # integration at a time, to all of its groups at once.
+    def correct_chunk(chunk):
+        ramp = chunk.science(ramparr)
+        coeffs = chunk.rows_of(coeffarr)
+
+        # Accumulate the polynomial terms into the corrected counts, in
+        # place.  The operations, and their order, are the same for each
+        # pixel as when correcting one group at a time.
+        scorr = coeffs[ncoeffs - 1] * ramp
+        for j in range(ncoeffs - 2, 0, -1):
+            np.add(scorr, coeffs[j], out=scorr)
+            np.multiply(scorr, ramp, out=scorr)
+        np.add(scorr, coeffs[0], out=scorr)
+
+        # Only use the corrected signal where the original signal value
+        # has not been flagged by the saturation step.
+        # Otherwise keep the original signal.
+        if dqarr is None:
+            ramp[...] = scorr
+        else:
+            np.copyto(ramp, scorr, casting='unsafe',
+                      where=np.bitwise_and(chunk.science(dqarr),
+                                           dq_flag) == 0)
+
+    return chunks.ChunkKernel(correct_chunk)
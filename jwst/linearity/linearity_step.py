@@ -10,32 +10,35 @@ class LinearityStep(Step):
 
     reference_file_types = ['linearity']
 
+    chunkable = True
 
     def process(self, input):
 
-        # Open the input data model
-        with datamodels.open(input) as input_model:
+        return self.run_chunks(input)
 
-            # Get the name of the linearity reference file to use
-            self.lin_name = self.get_reference_file(input_model, 'linearity')
-            self.log.info('Using Linearity reference file %s', self.lin_name)
+    def prepare_chunks(self, input_model):
 
-            # Check for a valid reference file
-            if self.lin_name == 'N/A':
-                self.log.warning('No Linearity reference file found')
-                self.log.warning('Linearity step will be skipped')
-                result = input_model.copy()
-                result.meta.cal_step.linearity = 'SKIPPED'
-                return result
+        # Get the name of the linearity reference file to use
+        self.lin_name = self.get_reference_file(input_model, 'linearity')
+        self.log.info('Using Linearity reference file %s', self.lin_name)
 
-            # Open the linearity reference file data model
-            lin_model = datamodels.LinearityModel(self.lin_name)
+        # Check for a valid reference file
+        if self.lin_name == 'N/A':
+            self.log.warning('No Linearity reference file found')
+            self.log.warning('Linearity step will be skipped')
+            input_model.meta.cal_step.linearity = 'SKIPPED'
+            return None
 
-            # Do the linearity correction
-            result = linearity.do_correction(input_model, lin_model)
+        # Open the linearity reference file data model
+        lin_model = self.open_reference_model(
+            self.lin_name, datamodels.LinearityModel)
 
-            # Close the reference file and update the step status
-            lin_model.close()
-            result.meta.cal_step.linearity = 'COMPLETE'
+        # Get the linearity correction
+        kernel = linearity.prepare_correction(input_model, lin_model,
+                                              self.lin_name)
 
-        return result
+        # Close the reference file and update the step status
+        lin_model.close()
+        input_model.meta.cal_step.linearity = 'COMPLETE'
+
+        return kernel
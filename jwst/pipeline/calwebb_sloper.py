@@ -37,6 +37,7 @@ class SloperPipeline(Pipeline):
 
     spec = """
         save_calibrated_ramp = boolean(default=False)
+        fuse_steps = boolean(default=False) # Apply consecutive chunkable steps in a single pass over the data
     """
 
     # Define aliases to steps
@@ -73,29 +74,22 @@ class SloperPipeline(Pipeline):
             # the steps are in a different order than NIR
             log.debug('Processing a MIRI exposure')
 
-            input = self.dq_init(input)
-            input = self.saturation(input)
-            input = self.ipc(input)
-            input = self.linearity(input)
-            input = self.rscd(input)
-            input = self.lastframe(input)
-            input = self.dark_current(input)
-            input = self.refpix(input)
-            input = self.persistence(input)
+            input = self.run_steps(
+                [self.dq_init, self.saturation, self.ipc, self.linearity,
+                 self.rscd, self.lastframe, self.dark_current, self.refpix,
+                 self.persistence],
+                input, fuse=self.fuse_steps)
 
         else:
 
             # process Near-IR exposures
             log.debug('Processing a Near-IR exposure')
 
-            input = self.dq_init(input)
-            input = self.saturation(input)
-            input = self.ipc(input)
-            input = self.superbias(input)
-            input = self.refpix(input)
-            input = self.linearity(input)
-            input = self.persistence(input)
-            input = self.dark_current(input)
+            input = self.run_steps(
+                [self.dq_init, self.saturation, self.ipc, self.superbias,
+                 self.refpix, self.linearity, self.persistence,
+                 self.dark_current],
+                input, fuse=self.fuse_steps)
 
         # apply the jump step
         input = self.jump(input)
@@ -193,6 +193,10 @@ def determine_slope(data_sect, input_var_sect,
 
     use_extra_terms = True
 
+    # The design matrices depend only on the locations of the cosmic rays
+    # within the ramp, so they can be reused for every iteration.
+    design_cache = {}
+
     iter = 0
     done = False
     if NUM_ITER_NO_EXTRA_TERMS <= 0:
@@ -208,7 +212,7 @@ def determine_slope(data_sect, input_var_sect,
                               prev_fit, prev_slope_sect,
                               frame_time, group_time, nframes_used,
                               max_num_cr, saturated_flag, jump_flag,
-                              temp_use_extra_terms)
+                              temp_use_extra_terms, design_cache)
         iter += 1
         if iter == NUM_ITER_NO_EXTRA_TERMS:
             temp_use_extra_terms = use_extra_terms
@@ -339,7 +343,7 @@ def compute_slope(data_sect, input_var_sect,
                   prev_fit, prev_slope_sect,
                   frame_time, group_time, nframes_used,
                   max_num_cr, saturated_flag, jump_flag,
-                  use_extra_terms):
+                  use_extra_terms, design_cache=None):
     """Set up the call to fit a slope to ramp data.
 
     This loops over the number of cosmic rays (jumps).  That is, all the
@@ -402,6 +406,10 @@ def compute_slope(data_sect, input_var_sect,
         covariance matrix.
         See JWST-STScI-003193.pdf
 
+    design_cache: dict or None
+        Design matrices from previous calls, keyed by the locations of the
+        cosmic rays within the ramp; this is passed to gls_fit.
+
     Returns
     -------
     tuple:  (intercept_sect, int_var_sect, slope_sect, slope_var_sect,
@@ -510,13 +518,12 @@ def compute_slope(data_sect, input_var_sect,
             gain[:] = gain_sect[ncr_mask]
         cr_flagged_2d = np.empty((ngroups, nz), dtype=cr_flagged.dtype)
         saturated_data = np.empty((ngroups, nz), dtype=prev_fit.dtype)
-        for k in range(ngroups):
-            ramp_data[k] = data_sect[k][ncr_mask]
-            input_var_data[k] = input_var_sect[k][ncr_mask]
-            prev_fit_data[k] = prev_fit[k][ncr_mask]
-            cr_flagged_2d[k] = cr_flagged[k][ncr_mask]
-            # This is for clobbering saturated pixels.
-            saturated_data[k] = saturated[k][ncr_mask]
+        ramp_data[:] = data_sect[:, ncr_mask]
+        input_var_data[:] = input_var_sect[:, ncr_mask]
+        prev_fit_data[:] = prev_fit[:, ncr_mask]
+        cr_flagged_2d[:] = cr_flagged[:, ncr_mask]
+        # This is for clobbering saturated pixels.
+        saturated_data[:] = saturated[:, ncr_mask]
 
         (result, variances) = \
                 gls_fit(ramp_data, input_var_data,
@@ -524,7 +531,8 @@ def compute_slope(data_sect, input_var_sect,
                         readnoise, gain,
                         frame_time, group_time, nframes_used,
                         num_cr, cr_flagged_2d, saturated_data,
-                        use_extra_terms=use_extra_terms)
+                        use_extra_terms=use_extra_terms,
+                        design_cache=design_cache)
         # Copy the intercept, slope, and cosmic-ray amplitudes and their
         # variances to the arrays to be returned.
         # ncr_mask is a mask array that is True for each pixel that has the
@@ -549,13 +557,19 @@ def gls_fit(ramp_data, input_var_data,
              readnoise, gain,
              frame_time, group_time, nframes_used,
              num_cr, cr_flagged_2d, saturated_data,
-             use_extra_terms=True):
+             use_extra_terms=True, design_cache=None):
     """Generalized least squares linear fit.
 
     It is assumed that every input pixel has num_cr cosmic-ray hits
     somewhere within the ramp.  This function should be called separately
     for different values of num_cr.
 
+    Pixels that have their cosmic rays in the same groups share the same
+    design matrix, so the pixels are grouped by the locations of their
+    cosmic rays, and one design matrix is made for each such group (or
+    taken from design_cache).  The matrix equations for all pixels are
+    then solved together.
+
     Parameters
     ----------
     ramp_data: 2-D ndarray; indices:  group, pixel number
@@ -615,6 +629,13 @@ def gls_fit(ramp_data, input_var_data,
         weight matrix.
         See JWST-STScI-003193.pdf
 
+    design_cache: dict or None
+        If not None, design matrices that have been computed for a previous
+        call, keyed by the tuple of groups in which the cosmic rays were
+        detected.  Design matrices computed in this call will be added.
+        The cached matrices are only valid for the same frame_time,
+        group_time, nframes_used and number of groups.
+
     Returns
     -------
     tuple:  (result2d, variances)
@@ -636,29 +657,30 @@ def gls_fit(ramp_data, input_var_data,
 
     # x is an array (length nz) of matrices, each of which is the
     # independent variable of a linear equation.  Each such matrix
-    # has ngroups rows and 2 + num_cr columns.  The first column is set
-    # to 1, for finding the intercept.  The second column is the time at
-    # each group, for finding the slope.  The remaining columns (if any),
-    # are 0 for all rows prior to a certain point, then 1 for all
-    # subsequent rows (i.e. the Heaviside function).  The transition from
-    # 0 to 1 is the location of a cosmic ray hit; the first 1 in a column
-    # corresponds to the value in cr_flagged_2d being 1.
-    x = np.zeros((nz, ngroups, 2 + num_cr), dtype=np.float64)
-    x[:, :, 0] = 1.
-    x[:, :, 1] = np.arange(ngroups, dtype=np.float64) * group_time + \
-                 frame_time * (M + 1.) / 2.
-
+    # has ngroups rows and 2 + num_cr columns (see design_matrix).  Pixels
+    # with cosmic rays in the same groups have the same matrix, so there is
+    # one matrix for each unique set of cosmic-ray locations.
     if num_cr > 0:
-        sum_crs = cr_flagged_2d.cumsum(axis=0)
-        for k in range(ngroups):
-            s = slice(k, ngroups)
-            for n in range(1, num_cr + 1):
-                temp = np.where(np.logical_and(cr_flagged_2d[k] == 1,
-                                               sum_crs[k] == n))
-                if len(temp[0]) > 0:
-                    index = (temp[0], s, n + 1)
-                    x[index] = 1
-        del temp, index
+        # Group in which each cosmic ray was detected, for each pixel.
+        cr_pix, cr_group = np.nonzero(np.transpose(cr_flagged_2d, (1, 0)))
+        cr_locations = cr_group.reshape((nz, num_cr))
+        signatures, which = np.unique(cr_locations, axis=0,
+                                      return_inverse=True)
+        which = which.ravel()
+    else:
+        signatures = np.zeros((1, 0), dtype=np.intp)
+        which = np.zeros(nz, dtype=np.intp)
+    if design_cache is None:
+        design_cache = {}
+    x_unique = np.empty((len(signatures), ngroups, 2 + num_cr),
+                        dtype=np.float64)
+    for i, signature in enumerate(signatures):
+        key = tuple(signature)
+        if key not in design_cache:
+            design_cache[key] = design_matrix(ngroups, signature,
+                                              frame_time, group_time, M)
+        x_unique[i] = design_cache[key]
+    x = x_unique[which]
 
     y = np.transpose(ramp_data, (1, 0)).reshape((nz, ngroups, 1))
 
@@ -669,69 +691,63 @@ def gls_fit(ramp_data, input_var_data,
     # smaller matrix (see near the end of this function) that contains
     # the variances and covariances of the fitted parameters.
 
-    cov = np.ones((nz, ngroups, ngroups), dtype=np.float64)
-
     # Use the previous fit to the data to populate the covariance matrix,
-    # for each of the nz pixels.  prev_fit_data has shape (ngroups, nz),
-    # similar to the ramp data, but we want the nz axis to be the first
-    # (we're constructing an array of nz matrix equations), so transpose
-    # prev_fit_data.
+    # for each of the nz pixels.  Element [j, k] of each matrix is the
+    # previous fit at group min(j, k).  prev_fit_data has shape
+    # (ngroups, nz), similar to the ramp data, but we want the nz axis to
+    # be the first (we're constructing an array of nz matrix equations), so
+    # transpose prev_fit_data.
     prev_fit_T = np.transpose(prev_fit_data, (1, 0))
-    for k in range(ngroups):
-        # Populate the upper right, row by row.
-        cov[:, k, k:ngroups] = prev_fit_T[:, k:k + 1]
-        # Populate the lower left, column by column.
-        cov[:, k:ngroups, k] = prev_fit_T[:, k:k + 1]
-        # Propagate errors from input.
-        cov[:, k, k] += input_var_data[k, :]
-        # Give saturated pixels very low weight (i.e. high variance).
-        cov[:, k, k] += saturated_data[k, :]
+    min_index = np.minimum.outer(np.arange(ngroups), np.arange(ngroups))
+    cov = prev_fit_T[:, min_index].astype(np.float64)
     del prev_fit_T
-
-    # I is 2-D, but it can broadcast to 4-D.  This is used to add terms to
-    # the diagonal of the covariance matrix.
-    I = np.identity(ngroups)
+    diag = np.arange(ngroups)
+    # Propagate errors from input.
+    cov[:, diag, diag] += np.transpose(input_var_data, (1, 0))
+    # Give saturated pixels very low weight (i.e. high variance).
+    cov[:, diag, diag] += np.transpose(saturated_data, (1, 0))
 
     # Divide by sqrt(2) to convert the readnoise from CDS to single readout.
-    rn3d = readnoise.reshape((nz, 1, 1)) * SINGLE_READOUT_RN_FACTOR
-    cov += (I * (rn3d**2 / M))
+    rn2d = readnoise.reshape((nz, 1)) * SINGLE_READOUT_RN_FACTOR
+    cov[:, diag, diag] += rn2d**2 / M
 
     # prev_slope_data must be non-negative.
     flags = prev_slope_data < 0.
     prev_slope_data[flags] = 1.
 
     if use_extra_terms:
-        # Include two dummy axes to allow broadcasting with cov.
-        slope3d = prev_slope_data.reshape((nz, 1, 1))
+        # Include a dummy axis to allow broadcasting with the diagonal.
+        slope2d = prev_slope_data.reshape((nz, 1))
         # diagonal:
         if gain is not None:
-            g3d = gain.reshape((nz, 1, 1))
+            g2d = gain.reshape((nz, 1))
         else:
-            g3d = 1.
-        delta_diag = I * (slope3d * frame_time *
-                          (M - 1.) * (M - 2.) / (3. * M) +
-                          (g3d * M)**2 / 12.)
-        cov += delta_diag
-        del delta_diag
+            g2d = 1.
+        cov[:, diag, diag] += (slope2d * frame_time *
+                               (M - 1.) * (M - 2.) / (3. * M) +
+                               (g2d * M)**2 / 12.)
 
     # This is the solution:  (xT @ weight @ x)^-1 @ [xT @ weight @ y]
-    # where @ means matrix multiplication.
+    # where @ means matrix multiplication, and weight is the inverse of
+    # cov.  Rather than computing the inverse, solve cov @ z = [x, y]
+    # for all pixels at once, so that weight @ x and weight @ y are the
+    # columns of z.
 
     # shape of xT is (nz, 2 + num_cr, ngroups)
     xT = np.transpose(x, (0, 2, 1))
 
-    # shape of `weight` is (nz, ngroups, ngroups)
-    I = I.reshape((1, ngroups, ngroups))
-    weight = la.solve(cov, I)                   # inverse of cov
-    del I
-
-    # temp1 = xT @ weight
-    # shape of temp1 is (nz, 2 + num_cr, ngroups)
-    temp1 = np.einsum('...ij,...jk->...ik', xT, weight)
+    # shape of z is (nz, ngroups, 2 + num_cr + 1)
+    z = la.solve(cov, np.concatenate((x, y), axis=2))
+    del cov
 
     # temp_var = xT @ weight @ x
     # shape of temp_var is (nz, 2 + num_cr, 2 + num_cr)
-    temp_var = np.einsum('...ij,...jk->...ik', temp1, x)
+    temp_var = np.einsum('...ij,...jk->...ik', xT, z[:, :, :-1])
+
+    # [xT @ weight @ y]
+    # shape of temp2 is (nz, 2 + num_cr, 1)
+    temp2 = np.einsum('...ij,...jk->...ik', xT, z[:, :, -1:])
+    del z
 
     # `covar` is an array of nz covariance matrices.
     # covar = (xT @ weight @ x)^-1
@@ -748,10 +764,6 @@ def gls_fit(ramp_data, input_var_data,
                 raise la.LinAlgError(msg2)
     del I_2
 
-    # [xT @ weight @ y]
-    # shape of temp2 is (nz, 2 + num_cr, 1)
-    temp2 = np.einsum('...ij,...jk->...ik', temp1, y)
-
     # shape of result is (nz, 2 + num_cr, 1)
     result = np.einsum('...ij,...jk->...ik', covar, temp2)
     r_shape = result.shape
@@ -762,3 +774,45 @@ def gls_fit(ramp_data, input_var_data,
     variances = covar.diagonal(axis1=1, axis2=2).copy()
 
     return (result2d, variances)
+
+def design_matrix(ngroups, cr_groups, frame_time, group_time, nframes_used):
+    """Create the design matrix for a ramp with cosmic rays.
+
+    Parameters
+    ----------
+    ngroups: int
+        The number of groups in the ramp.
+
+    cr_groups: 1-D ndarray
+        The group in which each cosmic ray was detected, in increasing
+        order.
+
+    frame_time: float
+        The time to read one frame, in seconds (e.g. 10.6 s).
+
+    group_time: float
+        Time increment between groups, in seconds.
+
+    nframes_used: float
+        Number of frames that were averaged together to make a group.
+
+    Returns
+    -------
+    x: 2-D ndarray, shape (ngroups, 2 + len(cr_groups))
+        The first column is set to 1, for finding the intercept.  The
+        second column is the time at each group, for finding the slope.
+        The remaining columns (if any) are 0 for all rows prior to the
+        group containing a cosmic-ray hit, then 1 for that group and all
+        subsequent rows (i.e. the Heaviside function).
+    """
+
+    num_cr = len(cr_groups)
+    x = np.zeros((ngroups, 2 + num_cr), dtype=np.float64)
+    x[:, 0] = 1.
+    x[:, 1] = np.arange(ngroups, dtype=np.float64) * group_time + \
+              frame_time * (nframes_used + 1.) / 2.
+    if num_cr > 0:
+        x[:, 2:] = (np.arange(ngroups).reshape((ngroups, 1)) >=
+                    np.asarray(cr_groups).reshape((1, num_cr)))
+
+    return x
@@ -13,12 +13,17 @@
 #  In this module, comments on the 'first read','second read', etc are 1-based.
 
 from __future__ import division
+import multiprocessing
+import os
+import shutil
+import tempfile
 import time
 import numpy as np
 import logging
 
 from .. import datamodels
 from ..datamodels import dqflags
+from ..lib.processes import get_max_processes
 
 from . import gls_fit           # used only if algorithm is "GLS"
 from . import utils
@@ -35,7 +40,7 @@ LARGE_VARIANCE = 1.e8
 
 
 def ramp_fit(model, buffsize, save_opt, readnoise_model, gain_model,
-              algorithm, weighting):
+              algorithm, weighting, max_cores='none', engine='stack'):
     """
     Extended Summary
     ----------------
@@ -71,6 +76,15 @@ def ramp_fit(model, buffsize, save_opt, readnoise_model, gain_model,
         'unweighted' specifies that no weighting should be used (default)
         'optimal' specifies that optimal weighting should be used
 
+    max_cores: string
+        fraction of the available cores to use for fitting the data
+        sections in parallel with 'OLS': 'none' (default), 'quarter',
+        'half' or 'all'
+
+    engine: string
+        'stack' (default) to fit the segments of the ramps with 'OLS' one at
+        a time using the end stack, or 'array' to fit all segments at once
+
     Returns
     -------
     new_model: Data Model object
@@ -96,7 +110,8 @@ def ramp_fit(model, buffsize, save_opt, readnoise_model, gain_model,
     else:
         new_model, int_model, opt_model = ols_ramp_fit(model,
                                 buffsize, save_opt,
-                                readnoise_model, gain_model, weighting)
+                                readnoise_model, gain_model, weighting,
+                                max_cores, engine)
         gls_opt_model = None
 
 
@@ -104,7 +119,7 @@ def ramp_fit(model, buffsize, save_opt, readnoise_model, gain_model,
 
 
 def ols_ramp_fit(model, buffsize, save_opt, readnoise_model, gain_model,
-                  weighting):
+                  weighting, max_cores='none', engine='stack'):
     """
     Extended Summary
     ----------------
@@ -134,6 +149,14 @@ def ols_ramp_fit(model, buffsize, save_opt, readnoise_model, gain_model,
         'unweighted' specifies that no weighting should be used (default)
         'optimal' specifies that optimal weighting should be used
 
+    max_cores: string
+        fraction of the available cores to use for fitting the data
+        sections in parallel: 'none' (default), 'quarter', 'half' or 'all'
+
+    engine: string
+        'stack' (default) to fit the segments of the ramps one at a time
+        using the end stack, or 'array' to fit all segments at once
+
     Returns
     -------
     new_model: Data Model object
@@ -220,43 +243,60 @@ def ols_ramp_fit(model, buffsize, save_opt, readnoise_model, gain_model,
         max_seg = 1 # needed for calc_slope()
         opt_res = None
 
+    # With multiple processes, make sure there are enough data sections
+    #   to keep all of them busy
+    nproc = get_max_processes(max_cores)
+    if nproc > 1:
+        nrows = min(nrows, -(-cubeshape[1] // nproc))
+
+    sections = [(num_int, rlo, min(rlo + nrows, cubeshape[1]))
+                for num_int in range(n_int)
+                for rlo in range(0, cubeshape[1], nrows)]
+    nproc = min(nproc, len(sections))
+
+    fit_args = (frame_time, max_seg, ngroups, weighting, save_opt, engine)
+    if nproc > 1:
+        log.info('Fitting %d data sections using %d processes' %
+                 (len(sections), nproc))
+        results = fit_sections_parallel(model, sections, readnoise_2d,
+                                        gain_2d, fit_args, nproc)
+    else:
+        results = (fit_section(model.get_section('data')[num_int, :, rlo:rhi, :],
+                               gdq_cube[num_int, :, rlo:rhi, :],
+                               readnoise_2d[rlo:rhi, :], gain_2d[rlo:rhi, :],
+                               *fit_args)
+                   for num_int, rlo, rhi in sections)
+
     # loop over data integrations
     for num_int in range(0, n_int):
 
-        # loop over data sections
+        # loop over data sections, stitching the results of each into the
+        #   output arrays
         for rlo in range(0, cubeshape[1], nrows):
-            rhi = rlo + nrows
+            rhi = min(rlo + nrows, cubeshape[1])
 
-            if rhi > cubeshape[1]:
-                rhi = cubeshape[1]
+            err_2d, m_by_var, inv_var, sect_opt_res = next(results)
 
             data_sect = model.get_section('data')[num_int, :, rlo:rhi, :]
+            gdq_sect = gdq_cube[num_int, :, rlo:rhi, :]
 
             # first frame section for 1st read of current integration
             ff_sect = model.get_section('data')[num_int,
                                                 0, rlo:rhi, :].astype(np.float32)
-            # get appropriate sections
-            gdq_sect = gdq_cube[num_int, :, rlo:rhi, :]
-            rn_sect = readnoise_2d[rlo:rhi, :]
-            gain_sect = gain_2d[rlo:rhi, :]
-
-            t_err_cube, t_dq_cube, m_by_var, inv_var, opt_res = \
-                 calc_slope(data_sect, gdq_sect, frame_time, opt_res, \
-                             rn_sect, gain_sect, max_seg, ngroups, weighting)
 
-            err_cube[num_int, :, rlo:rhi, :] += t_err_cube
-            gdq_cube[num_int, :, rlo:rhi, :] = t_dq_cube
+            err_cube[num_int, :, rlo:rhi, :] += err_2d
 
             # Compress 4D->2D dq arrays for saturated and jump-detected pixels
             pixeldq_sect = pixeldq[rlo:rhi, :].copy()
             dq_int[num_int, rlo:rhi, :] = \
-                  dq_compress_sect(t_dq_cube, pixeldq_sect).copy()
+                  dq_compress_sect(gdq_sect, pixeldq_sect).copy()
 
             sect_shape = data_sect.shape[-2:]
             m_sum_2d[rlo:rhi, :] += m_by_var.reshape(sect_shape)
             var_sum_2d[rlo:rhi, :] += inv_var.reshape(sect_shape)
 
             if save_opt: # collect optional results for output
+                opt_res.take_2d(sect_opt_res)
                 opt_res.reshape_res(num_int, rlo, rhi, sect_shape, ff_sect)
 
             # Calculate difference between each slice and the previous slice
@@ -793,6 +833,175 @@ def calc_nrows(model, buffsize, cubeshape, nreads):
     return nrows
 
 
+def fit_section(data_sect, gdq_sect, rn_sect, gain_sect, frame_time, max_seg,
+                ngroups, weighting, save_opt, engine='stack'):
+    """
+    Short Summary
+    -------------
+    Fit the ramps of all pixels in one data section of one integration.
+
+    Parameters
+    ----------
+    data_sect: float, 3D array
+        section of input data cube array
+
+    gdq_sect: int, 3D array
+        section of GROUPDQ data quality array
+
+    rn_sect: float, 2D array
+        read noise values for all pixels in data section
+
+    gain_sect: float, 2D array
+        gain values for all pixels in data section
+
+    frame_time: float
+        integration time
+
+    max_seg: int
+        maximum number of segments that will be fit within an
+        integration, calculated over all pixels and all integrations
+
+    ngroups: int
+        number of groups per integration
+
+    weighting: string
+        'unweighted' or 'optimal'
+
+    save_opt: boolean
+        calculate optional fitting results
+
+    engine: string
+        'stack' to fit the segments with calc_slope, or 'array' to fit them
+        with calc_slope_array
+
+    Returns
+    -------
+    err_2d: float, 2D array
+        fitting error estimate for pixels in section, the same for all reads
+
+    m_by_var: float, 1D array
+        values of slope/variance for good pixels
+
+    inv_var: float, 1D array
+        values of 1/variance for good pixels
+
+    opt_res: OptRes object or None
+        holds the segment-specific optional results for this section only
+    """
+    if save_opt:
+        # The per-integration arrays are not needed for a single section
+        opt_res = utils.OptRes(0, data_sect.shape[-2:], max_seg,
+                               data_sect.shape[0])
+    else:
+        opt_res = None
+
+    if engine == 'array':
+        slope_func = calc_slope_array
+    else:
+        slope_func = calc_slope
+
+    err_sect, gdq_sect, m_by_var, inv_var, opt_res = \
+         slope_func(np.asarray(data_sect), np.asarray(gdq_sect), frame_time,
+                    opt_res, rn_sect, gain_sect, max_seg, ngroups, weighting)
+
+    return err_sect[0], m_by_var, inv_var, opt_res
+
+
+# Inputs shared by all of the sections fit in a worker process; these are
+#   set by init_section_worker when the process pool starts up.
+_worker_inputs = {}
+
+
+def init_section_worker(data_file, gdq_file, readnoise_2d, gain_2d, fit_args):
+    """
+    Short Summary
+    -------------
+    Open memory-mapped, read-only views of the data and GROUPDQ cubes in a
+    worker process, and save the other fitting inputs.
+    """
+    _worker_inputs['data'] = np.load(data_file, mmap_mode='r')
+    _worker_inputs['gdq'] = np.load(gdq_file, mmap_mode='r')
+    _worker_inputs['readnoise_2d'] = readnoise_2d
+    _worker_inputs['gain_2d'] = gain_2d
+    _worker_inputs['fit_args'] = fit_args
+
+
+def fit_section_worker(section):
+    """
+    Short Summary
+    -------------
+    Fit one data section, given as (integration, first row, last row + 1),
+    in a worker process.
+    """
+    num_int, rlo, rhi = section
+
+    return fit_section(_worker_inputs['data'][num_int, :, rlo:rhi, :],
+                       _worker_inputs['gdq'][num_int, :, rlo:rhi, :],
+                       _worker_inputs['readnoise_2d'][rlo:rhi, :],
+                       _worker_inputs['gain_2d'][rlo:rhi, :],
+                       *_worker_inputs['fit_args'])
+
+
+def fit_sections_parallel(model, sections, readnoise_2d, gain_2d, fit_args,
+                          nproc):
+    """
+    Short Summary
+    -------------
+    Fit the data sections in a pool of worker processes. The data and
+    GROUPDQ cubes are written once to temporary memory-mapped files, from
+    which each worker reads only the sections it fits.
+
+    Parameters
+    ----------
+    model: instance of Data Model
+        DM object for input
+
+    sections: list of (int, int, int) tuples
+        integration, first row and last row + 1 of each data section
+
+    readnoise_2d: float, 2D array
+        read noise values for all pixels
+
+    gain_2d: float, 2D array
+        gain values for all pixels
+
+    fit_args: tuple
+        remaining arguments to `fit_section`
+
+    nproc: int
+        number of worker processes
+
+    Returns
+    -------
+    results: generator
+        `fit_section` results for each section, in the order of `sections`
+    """
+    tmpdir = tempfile.mkdtemp(prefix='ramp_fit_')
+    try:
+        data_file = os.path.join(tmpdir, 'data.npy')
+        gdq_file = os.path.join(tmpdir, 'groupdq.npy')
+        for filename, array in ((data_file, model.data),
+                                (gdq_file, model.groupdq)):
+            mmap = np.lib.format.open_memmap(filename, mode='w+',
+                                             dtype=array.dtype,
+                                             shape=array.shape)
+            mmap[...] = array
+            del mmap
+
+        pool = multiprocessing.Pool(nproc, initializer=init_section_worker,
+                                    initargs=(data_file, gdq_file,
+                                              np.asarray(readnoise_2d),
+                                              np.asarray(gain_2d), fit_args))
+        try:
+            for result in pool.imap(fit_section_worker, sections):
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
 def calc_slope(data_sect, gdq_sect, frame_time, opt_res, rn_sect, gain_sect,
                 max_seg, ngroups, weighting):
     """
@@ -966,6 +1175,296 @@ def calc_slope(data_sect, gdq_sect, frame_time, opt_res, rn_sect, gain_sect,
     return err_sect, gdq_sect, m_by_var, inv_var, opt_res
 
 
+def calc_slope_array(data_sect, gdq_sect, frame_time, opt_res, rn_sect,
+                     gain_sect, max_seg, ngroups, weighting):
+    """
+    Short Summary
+    -------------
+    Alternative to calc_slope, which determines the segments of all pixels
+    from the GROUPDQ array in one pass instead of iterating over the
+    segments with the end stack. The sums for all segments are then
+    calculated at once, using cumulative sums along the reads for
+    unweighted fits, so that the cost does not depend on the number of
+    cosmic rays in the worst pixel.  Datasets having NGROUPS <= 2 are
+    passed on to calc_slope.
+
+    Parameters and return values are the same as for calc_slope.
+    """
+    if ngroups <= 2:
+        return calc_slope(data_sect, gdq_sect, frame_time, opt_res, rn_sect,
+                          gain_sect, max_seg, ngroups, weighting)
+
+    nreads, asize2, asize1 = data_sect.shape
+    npix = asize2 * asize1  # number of pixels in section of 2D array
+    imshape = data_sect.shape[-2:]
+    cubeshape = (nreads,) + imshape  # cube section shape
+
+    data_r = np.reshape(data_sect, (nreads, npix))
+    gdq_sect_r = np.reshape(gdq_sect, (nreads, npix))
+    good_read = (gdq_sect_r == 0)
+
+    # Create nominal 2D ERR array, which is 1st slice of
+    #    avged_data_cube * readtime
+    err_2d_array = data_sect[0, :, :] * frame_time
+    err_2d_array[err_2d_array < 0] = 0
+
+    # Segment boundaries: every flagged read after the first one ends a
+    #   segment and starts the next one, and the last read ends the last
+    #   segment. seg_end[k, pix] is the last read of the k-th segment of a
+    #   pixel, or -1 where the pixel has fewer segments.
+    is_end = ~good_read
+    is_end[0, :] = False
+    is_end[-1, :] = True
+    seg_count = is_end.sum(axis=0)
+    end_reads, end_pix = np.where(is_end)
+    end_rank = np.cumsum(is_end, axis=0)[end_reads, end_pix] - 1
+
+    seg_end = np.zeros((seg_count.max(), npix), dtype=np.int32) - 1
+    seg_end[end_rank, end_pix] = end_reads
+    seg_start = np.zeros_like(seg_end)
+    seg_start[1:, :] = seg_end[:-1, :]
+    valid = (seg_end >= 0)
+    seg_start[~valid] = 0
+    seg_end_c = np.where(valid, seg_end, 0)
+
+    # The reads fit in a segment run from its first read (the read in which
+    #   the cosmic ray was flagged) through its last good read
+    all_pix = np.arange(npix)[np.newaxis, :]
+    last_fit = np.where(good_read[seg_end_c, all_pix], seg_end_c, seg_end_c - 1)
+    has_good = (last_fit > seg_start) | \
+               ((seg_start == 0) & good_read[0, all_pix])
+    nreads_seg = np.where(valid & has_good, last_fit - seg_start + 1, 0)
+    good_seg = nreads_seg > MIN_LEN
+
+    slope = np.zeros(seg_end.shape, dtype=np.float64)
+    variance = np.zeros(seg_end.shape, dtype=np.float64) + MIN_ERR
+    intercept = np.zeros(seg_end.shape, dtype=np.float64)
+    sig_intercept = np.zeros(seg_end.shape, dtype=np.float64) + MIN_ERR
+    sig_slope = np.zeros(seg_end.shape, dtype=np.float64) + MIN_ERR
+
+    # For ramps in which only the 1st read has good data (the 2nd and all
+    #   following reads are flagged) set the slope equal to that good data
+    #   value, and set the intercept to 0.
+    wh_sat1 = np.where((seg_count == nreads - 1) & (nreads_seg[0] == 1) &
+                       good_read[0])
+    slope[0][wh_sat1] = data_r[0][wh_sat1]
+    intercept[0][wh_sat1] = 0.
+    sig_intercept[0][wh_sat1] = 0.
+
+    seg_k, seg_pix = np.where(good_seg)
+    first = seg_start[seg_k, seg_pix]
+    last = last_fit[seg_k, seg_pix]
+    nreads_1d = nreads_seg[seg_k, seg_pix]
+
+    if weighting.lower() == 'optimal':
+        sumx, sumxx, sumxy, sumy, nreads_wtd = \
+            calc_opt_segment_sums(data_r, rn_sect, gain_sect, seg_pix, first,
+                                  nreads_1d)
+        seg_slope, seg_intercept, seg_sig_slope, seg_sig_intercept = \
+            calc_opt_fit(nreads_wtd, sumxx, sumx, sumxy, sumy)
+        denominator = nreads_wtd * sumxx - sumx**2
+    else:
+        sumx, sumxx, sumxy, sumy = \
+            calc_unwtd_segment_sums(data_r, seg_pix, first, last)
+        seg_slope, seg_intercept, seg_sig_slope, seg_sig_intercept, \
+            line_fit = calc_unwtd_fit(0, nreads_1d, sumxx, sumx, sumxy, sumy)
+        denominator = nreads_1d * sumxx - sumx**2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        seg_variance = nreads_1d / denominator
+
+    # check to prevent NaN propagation
+    wh_varnan = np.isnan(seg_variance)
+    if wh_varnan.any():
+        data_diff = (data_r[-1] - data_r[0])[seg_pix[wh_varnan]]
+        rn_2d = rn_sect.ravel()[seg_pix[wh_varnan]]
+        seg_variance[wh_varnan] = np.sqrt(data_diff + rn_2d**2.)
+
+    slope[seg_k, seg_pix] = seg_slope
+    variance[seg_k, seg_pix] = seg_variance
+    intercept[seg_k, seg_pix] = seg_intercept
+    sig_intercept[seg_k, seg_pix] = seg_sig_intercept
+    sig_slope[seg_k, seg_pix] = seg_sig_slope
+
+    # Decide which segments contribute to each pixel's slope, following the
+    #   cases in fit_next_segment:
+    #   - a segment that spans more than MIN_LEN reads contributes if its
+    #     variance is positive
+    #   - a segment of length 1 containing the only good read of the ramp
+    #     contributes, and ends the processing of the pixel
+    #   - no other segment contributes
+    l_interval = seg_end - seg_start
+    at_end = (seg_end == nreads - 1)
+    only_read = (l_interval == 1) & (nreads_seg == 1) & ~at_end & \
+                (good_read.sum(axis=0) == 1)
+    uses = valid & (((l_interval > MIN_LEN) & (variance > 0.)) | only_read)
+    after_done = np.cumsum(only_read, axis=0) - only_read > 0
+    uses &= ~after_done
+
+    inv_var_seg = np.where(uses, 1.0 / variance, 0.)
+    m_by_var_seg = np.where(uses, slope / variance, 0.)
+
+    # Accumulate the segments of each pixel in order
+    inv_var_cum = np.cumsum(inv_var_seg, axis=0)
+    inv_var = inv_var_cum[-1]
+    m_by_var = np.cumsum(m_by_var_seg, axis=0)[-1]
+
+    if opt_res is not None:
+        opt_res.init_2d(npix, max_seg)
+        num_seg = np.cumsum(uses, axis=0) - 1
+        use_k, use_pix = np.where(uses)
+        use_seg = num_seg[use_k, use_pix]
+        opt_res.interc_2d[use_seg, use_pix] = intercept[use_k, use_pix]
+        opt_res.slope_2d[use_seg, use_pix] = slope[use_k, use_pix]
+        opt_res.siginterc_2d[use_seg, use_pix] = \
+            sig_intercept[use_k, use_pix]
+        opt_res.sigslope_2d[use_seg, use_pix] = sig_slope[use_k, use_pix]
+        opt_res.inv_var_2d[use_seg, use_pix] = inv_var_cum[use_k, use_pix]
+
+    err_sect = np.zeros(cubeshape, dtype=np.float32)
+
+    # For now, making all error array slices within an integration and
+    #  section identical. Update later when use of error array has been decided
+    for ii in range(cubeshape[0]):
+        err_sect[ii, :, :] = err_2d_array
+
+    return err_sect, gdq_sect, m_by_var, inv_var, opt_res
+
+
+def calc_unwtd_segment_sums(data_r, seg_pix, first, last):
+    """
+    Short Summary
+    -------------
+    Calculate the sums needed for unweighted fits of a set of segments,
+    each covering the reads first..last of a pixel, using cumulative sums
+    of the data along the reads.
+
+    Parameters
+    ----------
+    data_r: float, 2D array
+        data section, reshaped to (nreads, npix)
+
+    seg_pix: int, 1D array
+        pixel of each segment
+
+    first: int, 1D array
+        first read fit in each segment
+
+    last: int, 1D array
+        last read fit in each segment
+
+    Returns
+    -------
+    sumx, sumxx, sumxy, sumy: float, 1D arrays
+        sums of x, x**2, x*data and data over each segment
+    """
+    reads = np.arange(data_r.shape[0], dtype=np.float64)[:, np.newaxis]
+    cum_y = np.zeros((data_r.shape[0] + 1, data_r.shape[1]), dtype=np.float64)
+    cum_xy = np.zeros_like(cum_y)
+    np.cumsum(data_r, axis=0, dtype=np.float64, out=cum_y[1:])
+    np.cumsum(data_r * reads, axis=0, out=cum_xy[1:])
+
+    sumy = cum_y[last + 1, seg_pix] - cum_y[first, seg_pix]
+    sumxy = cum_xy[last + 1, seg_pix] - cum_xy[first, seg_pix]
+
+    # Sums of the read numbers, and their squares, over first..last
+    first = first.astype(np.float64)
+    last = last.astype(np.float64)
+    sumx = (first + last) * (last - first + 1) / 2.
+    sumxx = (last * (last + 1) * (2 * last + 1) -
+             (first - 1) * first * (2 * first - 1)) / 6.
+
+    return sumx, sumxx, sumxy, sumy
+
+
+def calc_opt_segment_sums(data_r, rn_sect, gain_sect, seg_pix, first,
+                          nreads_1d):
+    """
+    Short Summary
+    -------------
+    Calculate the sums needed for optimally weighted fits of a set of
+    segments, using the weights of calc_opt_sums. The reads of all segments
+    are laid out in one flat array, so the cost is proportional to the
+    total number of reads fit.
+
+    Parameters
+    ----------
+    data_r: float, 2D array
+        data section, reshaped to (nreads, npix)
+
+    rn_sect: float, 2D array
+        read noise values for all pixels in data section
+
+    gain_sect: float, 2D array
+        gain values for all pixels in data section
+
+    seg_pix: int, 1D array
+        pixel of each segment
+
+    first: int, 1D array
+        first read fit in each segment
+
+    nreads_1d: int, 1D array
+        number of reads fit in each segment
+
+    Returns
+    -------
+    sumx, sumxx, sumxy, sumy, nreads_wtd: float, 1D arrays
+        weighted sums of x, x**2, x*data, data and the weights over
+        each segment
+    """
+    nseg = len(seg_pix)
+    if nseg == 0:
+        return np.array([]), np.array([]), np.array([]), np.array([]), \
+               np.array([])
+
+    # Flat index of every read in every segment
+    seg_id = np.repeat(np.arange(nseg), nreads_1d)
+    offsets = np.cumsum(nreads_1d) - nreads_1d
+    jj_rd = np.arange(len(seg_id)) - offsets[seg_id]
+    xvalues = (first[seg_id] + jj_rd).astype(np.float64)
+    data = data_r[first[seg_id] + jj_rd, seg_pix[seg_id]]
+
+    # Calculate the SNR of each segment from the readnoise, the gain, and
+    #   the difference between its last and first reads
+    data_diff = data_r[first + nreads_1d - 1, seg_pix] - \
+                data_r[first, seg_pix]
+    rn_2_r = (rn_sect * rn_sect).ravel()[seg_pix]
+    gain_sect_r = gain_sect.ravel()[seg_pix]
+
+    sqrt_arg = rn_2_r + data_diff * gain_sect_r
+    wh_pos = (sqrt_arg >= 0.) & (gain_sect_r != 0.)
+    snr = data_diff * 0.
+    snr[wh_pos] = data_diff[wh_pos] / \
+                  (np.sqrt(sqrt_arg[wh_pos]) / gain_sect_r[wh_pos])
+    snr[snr < 0.] = 0.0
+
+    power_wt_r = calc_power(snr)  # get the weighting exponent for this SNR
+
+    # Number of nonzero reads in each segment
+    nonzero = (data != 0.)
+    nrd_prime = (np.bincount(seg_id, weights=nonzero, minlength=nseg) - 1) / 2.
+    invrdns2_r = 1. / rn_2_r
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        wt_h = (abs((abs(jj_rd - nrd_prime[seg_id]) / nrd_prime[seg_id])
+                    ** power_wt_r[seg_id]) *
+                invrdns2_r[seg_id]).astype(np.float32)
+
+    wt_h[np.isnan(wt_h)] = 0.
+    wt_h[np.isinf(wt_h)] = 0.
+    wt_h[~nonzero] = 0.
+
+    # Create sums
+    nreads_wtd = np.bincount(seg_id, weights=wt_h, minlength=nseg)
+    sumx = np.bincount(seg_id, weights=xvalues * wt_h, minlength=nseg)
+    sumxx = np.bincount(seg_id, weights=xvalues**2 * wt_h, minlength=nseg)
+    sumy = np.bincount(seg_id, weights=data * wt_h, minlength=nseg)
+    sumxy = np.bincount(seg_id, weights=xvalues * wt_h * data, minlength=nseg)
+
+    return sumx, sumxx, sumxy, sumy, nreads_wtd
+
+
 def fit_next_segment(start, end_st, end_heads, pixel_done, data_sect, mask_2d,
                       inv_var, m_by_var, num_seg, opt_res, rn_sect, gain_sect,
                       ngroups, weighting, total_mask_sum):
@@ -24,6 +24,10 @@ class RampFitStep (Step):
         algorithm = option('OLS', 'GLS', default='OLS') # 'OLS' or 'GLS'
         weighting = option('unweighted', 'optimal', default='unweighted') \
         # 'unweighted' or 'optimal'
+        maximum_cores = option('none', 'quarter', 'half', 'all', default='none') \
+        # max number of processes for OLS fitting, as a fraction of the cores
+        ols_engine = option('stack', 'array', default='stack') \
+        # OLS segment fitting: one segment at a time, or all at once
     """
 
     reference_file_types = ['readnoise', 'gain']
@@ -39,12 +43,16 @@ class RampFitStep (Step):
                                                      'gain')
 
             log.info('Using READNOISE reference file: %s', readnoise_filename)
-            readnoise_model = datamodels.ReadnoiseModel(readnoise_filename)
+            readnoise_model = self.open_reference_model(
+                readnoise_filename, datamodels.ReadnoiseModel)
             log.info('Using GAIN reference file: %s', gain_filename)
-            gain_model = datamodels.GainModel(gain_filename)
+            gain_model = self.open_reference_model(gain_filename,
+                                                   datamodels.GainModel)
 
             log.info('Using algorithm = %s' % self.algorithm)
             log.info('Using weighting = %s' % self.weighting)
+            log.info('Using maximum_cores = %s' % self.maximum_cores)
+            log.info('Using ols_engine = %s' % self.ols_engine)
 
             buffsize = ramp_fit.BUFSIZE
             if self.algorithm == "GLS":
@@ -53,7 +61,9 @@ class RampFitStep (Step):
                         ramp_fit.ramp_fit(input_model,
                                            buffsize, self.save_opt,
                                            readnoise_model, gain_model,
-                                           self.algorithm, self.weighting)
+                                           self.algorithm, self.weighting,
+                                           self.maximum_cores,
+                                           self.ols_engine)
 
             readnoise_model.close()
 
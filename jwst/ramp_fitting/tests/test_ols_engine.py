@@ -0,0 +1,69 @@
+"""Test the array engine for ordinary least squares ramp fitting against
+the stack engine"""
+import numpy as np
+import pytest
+
+from ...datamodels import dqflags
+from .. import ramp_fit
+
+FRAME_TIME = 10.6
+
+
+def fit(calc, data, gdq, rn, gain, weighting):
+    _, _, m_by_var, inv_var, _ = calc(data.copy(), gdq.copy(), FRAME_TIME,
+                                      None, rn, gain, 4, data.shape[0],
+                                      weighting)
+    return m_by_var / inv_var, 1. / inv_var
+
+
+def make_ramps(seed, ngroups=8, shape=(3, 4)):
+    rng = np.random.RandomState(seed)
+    rates = rng.uniform(5., 50., shape)
+    data = 100. + np.arange(ngroups)[:, np.newaxis, np.newaxis] * rates + \
+        rng.normal(0., 3., (ngroups,) + shape)
+    gdq = np.zeros(data.shape, dtype=np.uint8)
+    return data.astype(np.float32), gdq
+
+
+@pytest.mark.parametrize('weighting', ['unweighted', 'optimal'])
+def test_array_matches_stack(weighting):
+    # With the same read noise and gain in every pixel, the engines agree
+    data, gdq = make_ramps(1)
+    gdq[4, 0, 1] = dqflags.group['JUMP_DET']
+    data[4:, 0, 1] += 500.
+    gdq[2, 2, 3] = dqflags.group['JUMP_DET']
+    data[2:, 2, 3] += 300.
+    gdq[6:, 1, 2] = dqflags.group['SATURATED']
+    rn = np.full(data.shape[1:], 7., dtype=np.float32)
+    gain = np.full(data.shape[1:], 2., dtype=np.float32)
+
+    slope, var = fit(ramp_fit.calc_slope_array, data, gdq, rn, gain,
+                     weighting)
+    stack_slope, stack_var = fit(ramp_fit.calc_slope, data, gdq, rn, gain,
+                                 weighting)
+    assert np.allclose(slope, stack_slope, rtol=1.e-5)
+    assert np.allclose(var, stack_var, rtol=1.e-5)
+
+
+def test_array_optimal_uses_pixel_noise():
+    # The optimal weights of each pixel come from its own read noise and
+    # gain. The stack engine does the same for a section of one pixel
+    # without cosmic rays, so fit every pixel on its own as the reference.
+    data, gdq = make_ramps(2)
+    rng = np.random.RandomState(3)
+    rn = rng.uniform(3., 20., data.shape[1:]).astype(np.float32)
+    gain = rng.uniform(1., 4., data.shape[1:]).astype(np.float32)
+
+    slope, var = fit(ramp_fit.calc_slope_array, data, gdq, rn, gain,
+                     'optimal')
+
+    ny, nx = data.shape[1:]
+    for pix in range(ny * nx):
+        j, i = divmod(pix, nx)
+        pix_slope, pix_var = fit(ramp_fit.calc_slope,
+                                 data[:, j:j + 1, i:i + 1],
+                                 gdq[:, j:j + 1, i:i + 1],
+                                 rn[j:j + 1, i:i + 1],
+                                 gain[j:j + 1, i:i + 1], 'optimal')
+        assert np.allclose(slope[pix], pix_slope[0], rtol=1.e-5)
+        assert np.allclose(var[pix], pix_var[0], rtol=1.e-5)
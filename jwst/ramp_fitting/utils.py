@@ -129,6 +129,31 @@ class OptRes(object):
             self.firstf_int[num_int, rlo:rhi, :] = ff_sect
 
 
+    def take_2d(self, sect_res):
+        """
+        Short Summary
+        -------------
+        Use the 2D segment-specific results computed for the current data
+        section by another OptRes object, e.g. one from a worker process.
+
+        Parameters
+        ----------
+        sect_res: OptRes object
+            holds the 2D segment-specific results for the current section
+
+        Returns
+        -------
+        None
+
+        """
+        self.interc_2d = sect_res.interc_2d
+        self.slope_2d = sect_res.slope_2d
+        self.siginterc_2d = sect_res.siginterc_2d
+        self.sigslope_2d = sect_res.sigslope_2d
+        self.inv_var_2d = sect_res.inv_var_2d
+        self.firstf_2d = sect_res.firstf_2d
+
+
     def append_arr(self, num_seg, g_pix, intercept, slope, sig_intercept,
                     sig_slope, inv_var):
         """
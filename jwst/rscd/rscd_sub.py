@@ -62,29 +62,27 @@ def do_correction(input_model, rscd_model):
     tau1_even, scale1_even, tau2_even, scale2_even = even
     tau1_odd, scale1_odd, tau2_odd, scale2_odd = odd
 
+    # Compute the correction factors of all of the groups at once, for
+    # even and odd rows
+    T = (np.arange(sci_ngroups) + 1) * frame_time
+    tau_even = tau1_even * frame_time
+    eterm_even = np.exp(-T / tau_even).reshape(sci_ngroups, 1, 1)
+
+    tau_odd = tau1_odd * frame_time
+    eterm_odd = np.exp(-T / tau_odd).reshape(sci_ngroups, 1, 1)
+
     # loop over all integrations except the first
     for i in range(1, sci_nints):
         dn_last = get_DNaccumulated_last_int(input_model, i, sci_ngroups)
 
-        # loop over groups in input science data:
-        for j in range(sci_ngroups):
-
-            # Compute the correction factors for even and odd rows
-            T = (j + 1) * frame_time
-            tau_even = tau1_even * frame_time
-            eterm_even = np.exp(-T / tau_even)
-
-            tau_odd = tau1_odd * frame_time
-            eterm_odd = np.exp(-T / tau_odd)
+        # Apply the corrections to even and odd rows of all groups:
+        # the first row is defined as odd (python index 0)
+        # the second row is the first even row (python index of 1)
+        correction_odd = dn_last[0::2, :] * scale1_odd * eterm_odd
+        correction_even = dn_last[1::2, :] * scale1_even * eterm_even
 
-            # Apply the corrections to even and odd rows:
-            # the first row is defined as odd (python index 0)
-            # the second row is the first even row (python index of 1)
-            correction_odd = dn_last[0::2, :] * scale1_odd * eterm_odd
-            correction_even = dn_last[1::2, :] * scale1_even * eterm_even
-
-            output.data[i, j, 0::2, :] += correction_odd
-            output.data[i, j, 1::2, :] += correction_even
+        output.data[i, :, 0::2, :] += correction_odd
+        output.data[i, :, 1::2, :] += correction_even
 
     output.meta.cal_step.rscd = 'COMPLETE'
 
@@ -152,25 +150,25 @@ def get_DNaccumulated_last_int(input_model, i, sci_ngroups):
     # need to add skipping N frames (frames affected by reset)
     # Add check to make sure we have enough frames left to do a fit
 
-    nrows = input_model.data.shape[2]
-    ncols = input_model.data.shape[3]
-
     # last frame affected by "last frame" effect - use second to last frame
     # may want to extrapolate to last frame
     # we may want to check if data has saturated
     dn_lastframe = input_model.data[i - 1][sci_ngroups - 2]
 
-    dn_accumulated = dn_lastframe.copy() * 0.0
-    for j in range(nrows):
-        for k in range(ncols):
-            ramp = input_model.data[i, 0:sci_ngroups - 1, j, k]
-            slope, intercept = ols_fit(ramp)
-            dn_accumulated[j, k] = dn_lastframe[j, k] - intercept
+    # Fit the ramps of all of the pixels at once
+    ramps = input_model.data[i, 0:sci_ngroups - 1, :, :]
+    slope, intercept = ols_fit(ramps)
+    dn_accumulated = (dn_lastframe - intercept).astype(dn_lastframe.dtype)
 
     return dn_accumulated
 
 
 def ols_fit(y):
+    """
+    Ordinary least-squares fit of straight lines to y along its first
+    axis, against the index along that axis.  Any other axes are
+    fitted independently, in one pass.
+    """
 
     shape = y.shape
     nelem = float(len(y))
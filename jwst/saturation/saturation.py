@@ -3,6 +3,7 @@
 #
 import logging
 from ..datamodels import dqflags
+from ..lib import chunks
 import numpy as np
 
 from . import x_irs2
@@ -12,7 +13,7 @@ log.setLevel(logging.DEBUG)
 
 HUGE_NUM = 100000.
 
-def do_correction(input_model, ref_model):
+def do_correction(input_model, ref_model, chunk_size=None, threads=1):
     """
     Short Summary
     -------------
@@ -27,29 +28,65 @@ def do_correction(input_model, ref_model):
     ref_model: data model object
         Saturation reference file mode object
 
+    chunk_size: float
+        Size in MB of the blocks of rows the data are processed in
+
+    threads: int
+        Number of threads processing the blocks
+
     Returns
     -------
     output_model: data model object
         object having GROUPDQ array saturation flags set
     """
 
-    ramparr = input_model.data
+   # Create the output model as a copy of the input
+    output_model = input_model.copy()
+
+    kernel = prepare_correction(output_model, ref_model)
+    chunks.apply_kernel(kernel, output_model, chunk_size, threads)
+
+    return output_model
+
+
+def prepare_correction(output_model, ref_model):
+    """
+    Short Summary
+    -------------
+    Update the PIXELDQ array of a science data model in place with the
+    flags of the saturation reference file, and get the operation that
+    sets the saturation flags of the GROUPDQ array, one block of the data
+    at a time.
+
+    Parameters
+    ----------
+    output_model: data model object
+        The science data to be corrected in place
+
+    ref_model: data model object
+        Saturation reference file mode object
+
+    Returns
+    -------
+    kernel: ChunkKernel
+        The operation setting the GROUPDQ saturation flags of a block
+    """
+
+    ramparr = output_model.data
     # Was IRS2 readout used?
-    is_irs2_format = x_irs2.is_irs2(input_model)
+    is_irs2_format = x_irs2.is_irs2(output_model)
     if is_irs2_format:
-        irs2_mask = x_irs2.make_mask(input_model)
+        irs2_mask = x_irs2.make_mask(output_model)
 
-   # Create the output model as a copy of the input
-    output_model = input_model.copy()
     groupdq = output_model.groupdq
 
     # Check for subarray mode
-    if ref_matches_sci(ref_model, input_model):
+    if ref_matches_sci(ref_model, output_model):
         satmask = ref_model.data
         dqmask = ref_model.dq
     else:
-        satmask = get_subarray(ref_model.data, input_model)
-        dqmask = get_subarray(ref_model.dq, input_model)
+        satmask = get_subarray(ref_model.data, output_model)
+        dqmask = get_subarray(ref_model.dq, output_model)
 
     # For pixels flagged in reference file as NO_SAT_CHECK, set the dq mask
     #   and saturation mask
@@ -61,28 +98,36 @@ def do_correction(input_model, ref_model):
 
     dq_flag = dqflags.group['SATURATED']
 
-    nints = ramparr.shape[0]
-    ngroups = ramparr.shape[1]
-
-    detector = input_model.meta.instrument.detector
-    flagarray = np.zeros(ramparr.shape[-2:], dtype=groupdq.dtype)
-    for ints in range(nints):
-        for plane in range(ngroups):
-            # Update the 4D groupdq array with the saturation flag. The
-            # flag is set in the current plane and all following planes.
-            if is_irs2_format:
-                sci_temp = x_irs2.from_irs2(ramparr[ints, plane, :, :],
-                                            irs2_mask, detector)
-                flag_temp = np.where(sci_temp >= satmask, dq_flag, 0)
-                # Copy flag_temp into flagarray.
-                x_irs2.to_irs2(flagarray, flag_temp, irs2_mask, detector)
-            else:
-                flagarray[:, :] = np.where(ramparr[ints, plane, :, :] >= satmask,
-                                          dq_flag, 0)
-            np.bitwise_or(groupdq[ints, plane:, :, :], flagarray,
-                          groupdq[ints, plane:, :, :])
-
-    output_model.groupdq = groupdq
+    detector = output_model.meta.instrument.detector
+
+    def flag_chunk(chunk):
+        ramp = chunk.science(ramparr)
+        chunk_dq = chunk.science(groupdq)
+
+        # Find the saturated groups of all of the planes at once
+        if is_irs2_format:
+            sci_temp = x_irs2.from_irs2(ramp, irs2_mask, detector)
+            saturated_temp = sci_temp >= satmask
+            # Copy saturated_temp into saturated, leaving the embedded
+            # reference pixels unflagged.
+            saturated = np.zeros(ramp.shape, dtype=np.bool_)
+            x_irs2.to_irs2(saturated, saturated_temp, irs2_mask, detector)
+        else:
+            saturated = ramp >= chunk.rows_of(satmask)
+
+        # The flag is set in a saturated plane and all following planes:
+        # take the cumulative OR along the group axis.  Running it plane
+        # by plane is much faster than np.logical_or.accumulate, whose
+        # loop along the first axis is strided.
+        for plane in range(1, saturated.shape[0]):
+            np.logical_or(saturated[plane], saturated[plane - 1],
+                          out=saturated[plane])
+
+        # Update the 4D groupdq array with the saturation flag.
+        np.bitwise_or(chunk_dq,
+                      np.multiply(saturated, dq_flag, dtype=groupdq.dtype),
+                      out=chunk_dq)
+
     if is_irs2_format:
         pixeldq_temp = x_irs2.from_irs2(output_model.pixeldq, irs2_mask,
                                         detector)
@@ -91,7 +136,9 @@ def do_correction(input_model, ref_model):
     else:
         output_model.pixeldq = np.bitwise_or(output_model.pixeldq, dqmask)
 
-    return output_model
+    # IRS2 frames are converted to the normal format whole, so they are
+    # not split into blocks of rows
+    return chunks.ChunkKernel(flag_chunk, split_rows=not is_irs2_format)
 
 
 def correct_for_NaN(satmask, dqmask):
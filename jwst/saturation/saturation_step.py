@@ -11,31 +11,34 @@ class SaturationStep(Step):
 
     reference_file_types = ['saturation']
 
+    chunkable = True
+
     def process(self, input):
 
-        # Open the input data model
-        with datamodels.open(input) as input_model:
+        return self.run_chunks(input)
+
+    def prepare_chunks(self, input_model):
 
-            # Get the name of the saturation reference file
-            self.ref_name = self.get_reference_file(input_model, 'saturation')
-            self.log.info('Using SATURATION reference file %s', self.ref_name)
+        # Get the name of the saturation reference file
+        self.ref_name = self.get_reference_file(input_model, 'saturation')
+        self.log.info('Using SATURATION reference file %s', self.ref_name)
 
-            # Check for a valid reference file
-            if self.ref_name == 'N/A':
-                self.log.warning('No SATURATION reference file found')
-                self.log.warning('Saturation step will be skipped')
-                result = input_model.copy()
-                result.meta.cal_step.saturation = 'SKIPPED'
-                return result
+        # Check for a valid reference file
+        if self.ref_name == 'N/A':
+            self.log.warning('No SATURATION reference file found')
+            self.log.warning('Saturation step will be skipped')
+            input_model.meta.cal_step.saturation = 'SKIPPED'
+            return None
 
-            # Open the reference file data model
-            ref_model = datamodels.SaturationModel(self.ref_name)
+        # Open the reference file data model
+        ref_model = self.open_reference_model(
+            self.ref_name, datamodels.SaturationModel)
 
-            # Do the saturation check
-            sat = saturation.do_correction(input_model, ref_model)
+        # Get the saturation check
+        kernel = saturation.prepare_correction(input_model, ref_model)
 
-            # Close the reference file and update the step status
-            ref_model.close()
-            sat.meta.cal_step.saturation = 'COMPLETE'
+        # Close the reference file and update the step status
+        ref_model.close()
+        input_model.meta.cal_step.saturation = 'COMPLETE'
 
-        return sat
+        return kernel
@@ -0,0 +1,71 @@
+"""
+Saving data models on a background thread
+"""
+from __future__ import absolute_import, division, print_function
+
+import threading
+
+from astropy.extern.six.moves import queue
+
+
+__all__ = ['BackgroundWriter']
+
+
+class BackgroundWriter(object):
+    """
+    Saves data models on a background thread, so that the caller can go
+    on processing while they are being written.
+
+    A model is snapshotted with ``copy(share_arrays=True)`` when it is
+    queued: later changes to its metadata are not saved, but its arrays
+    must not be modified in place until it has been written.
+
+    Parameters
+    ----------
+    max_pending : int, optional
+        The maximum number of models waiting to be written.  `save`
+        blocks when it is reached, which bounds the memory held by the
+        models waiting to be written.
+    """
+    def __init__(self, max_pending=2):
+        self._queue = queue.Queue(max_pending)
+        self._errors = []
+        self._thread = None
+
+    def save(self, model, path, *args, **kwargs):
+        """
+        Queue a model to be saved, with the same arguments as
+        `DataModel.save`.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+        self._queue.put((model.copy(share_arrays=True), path, args, kwargs))
+
+    def close(self):
+        """
+        Wait until all of the queued models have been saved.  If saving
+        any of them failed, the first error is raised.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if len(self._errors):
+            error = self._errors[0]
+            self._errors = []
+            raise error
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            model, path, args, kwargs = item
+            try:
+                model.save(path, *args, **kwargs)
+            except Exception as e:
+                self._errors.append(e)
+            finally:
+                model.close()
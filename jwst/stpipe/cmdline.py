@@ -17,7 +17,7 @@ from . import utilities
 
 
 built_in_configuration_parameters = [
-    'debug', 'logcfg', 'verbose'
+    'debug', 'logcfg', 'verbose', 'jobs'
     ]
 
 
@@ -186,6 +186,10 @@ def just_the_step_from_cmdline(args, cls=None):
     parser1.add_argument(
         "--debug", action="store_true",
         help="When an exception occurs, invoke the Python debugger, pdb")
+    parser1.add_argument(
+        "--jobs", type=int, default=None, metavar='N',
+        help="Run the step on each positional argument as an independent "
+        "input, in N worker processes")
     known, _ = parser1.parse_known_args(args)
 
     try:
@@ -243,6 +247,7 @@ def just_the_step_from_cmdline(args, cls=None):
     del args.logcfg
     del args.verbose
     del args.debug
+    del args.jobs
     positional = args.args
     del args.args
 
@@ -300,11 +305,23 @@ def step_from_cmdline(args, cls=None):
         instance.
     """
 
+    import argparse
+    jobs_parser = argparse.ArgumentParser(add_help=False)
+    jobs_parser.add_argument("--jobs", type=int, default=None)
+    jobs = jobs_parser.parse_known_args(args)[0].jobs
+
     step, step_class, positional = just_the_step_from_cmdline(args, cls)
 
     try:
         profile_path = os.environ.pop("JWST_PROFILE", None)
-        if profile_path:
+        if jobs is not None:
+            failures = step.run_many(positional, workers=jobs)
+            if len(failures):
+                raise RuntimeError(
+                    "{0} of {1} inputs failed: {2}".format(
+                        len(failures), len(positional),
+                        ", ".join(str(input) for input, _ in failures)))
+        elif profile_path:
             import cProfile
             cProfile.runctx("step.run(*positional)", globals(), locals(), profile_path)
         else:
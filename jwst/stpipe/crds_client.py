@@ -29,16 +29,35 @@
 """
 A client library for CRDS
 """
+import collections
 import contextlib
 from os.path import dirname, join
 import re
+import threading
 from astropy.extern import six
 
-import gc
-
 import crds
 from crds import log
 
+# The best references resolved so far, shared by all of the steps of the
+# process: {(context, matching parameters): {filetype: filepath}}, in order
+# of last use
+_bestrefs_memo = collections.OrderedDict()
+_bestrefs_lock = threading.Lock()
+
+# The maximum number of sets of matching parameters kept in the memo; the
+# least recently used are forgotten first
+BESTREFS_MEMO_SIZE = 256
+
+# The parameter names CRDS matches on, by (observatory, context), or None if
+# they could not be determined
+_parkeys_cache = {}
+
+# When the parameters CRDS matches on are unknown, parameters under these
+# names are ignored by the memo, as they change between steps
+_UNMATCHED_PREFIXES = ('meta.cal_step.', 'meta.ref_file.', 'meta.filename',
+                       'meta.date', 'history')
+
 def _flatten_dict(nested):
     def flatten(root, path, output):
         for key, val in root.items():
@@ -51,6 +70,65 @@ def _flatten_dict(nested):
     flatten(nested, [], output)
     return output
 
+def _get_context(observatory="jwst"):
+    """Return the context (.pmap) CRDS currently resolves best references
+    with, or None if it cannot be determined.
+    """
+    try:
+        _connected, context = crds.heavy_client.get_processing_mode(observatory)
+    except Exception as exc:
+        log.verbose("Processing context unavailable:", str(exc))
+        context = None
+    return context
+
+def _get_required_parkeys(context, observatory="jwst"):
+    """Return the set of upper case parameter names that CRDS matches on
+    under `context`, or None if they cannot be determined.
+    """
+    try:
+        return _parkeys_cache[(observatory, context)]
+    except KeyError:
+        pass
+
+    def collect(node, parkeys):
+        if isinstance(node, six.string_types):
+            parkeys.add(node.upper())
+        elif isinstance(node, dict):
+            for val in node.values():
+                collect(val, parkeys)
+        elif isinstance(node, (list, tuple)):
+            for val in node:
+                collect(val, parkeys)
+
+    try:
+        pmap = crds.get_cached_mapping(context)
+        parkeys = set()
+        collect(pmap.get_required_parkeys(), parkeys)
+        parkeys = frozenset(parkeys)
+    except Exception as exc:
+        log.verbose("Matching parameters unavailable:", str(exc))
+        parkeys = None
+    _parkeys_cache[(observatory, context)] = parkeys
+    return parkeys
+
+def _get_matching_parameters(data_dict, context):
+    """Return a hashable key of the items of `data_dict` that CRDS
+    matches on under `context`.
+    """
+    parkeys = _get_required_parkeys(context)
+    if parkeys is None:
+        items = [(key, val) for (key, val) in data_dict.items()
+                 if not key.startswith(_UNMATCHED_PREFIXES)]
+    else:
+        items = [(key, val) for (key, val) in data_dict.items()
+                 if key.upper() in parkeys]
+    return tuple(sorted((key, repr(val)) for (key, val) in items))
+
+def clear_bestrefs_memo():
+    """Forget the best references resolved so far."""
+    with _bestrefs_lock:
+        _bestrefs_memo.clear()
+
 def get_multiple_reference_paths(input_file, reference_file_types):
     """Aligns JWST pipeline requirements with CRDS library top
     level interfaces.
@@ -63,12 +141,17 @@ def get_multiple_reference_paths(input_file, reference_file_types):
 
     2. It verifies than any true filepath (not N/A) returned is openable.
 
+    3. It memoizes the best references by the CRDS context and the
+    parameters CRDS matches on, so that crds.getreferences() is only
+    called for the types not already resolved for an input with the same
+    parameters, under the same context, by this or an earlier step, or
+    for an earlier exposure.  The memo keeps the BESTREFS_MEMO_SIZE most
+    recently used sets of parameters.
+
     Returns { filetype : filepath or "N/A", ... }
     """
     from .. import datamodels
 
-    gc.collect()
-
     if not reference_file_types:   # [] interpreted as *all types*.
         return {}
 
@@ -76,23 +159,42 @@ def get_multiple_reference_paths(input_file, reference_file_types):
         model_types = (str, unicode, datamodels.DataModel)
     else:
         model_types = (str, datamodels.DataModel)
-    if isinstance(input_file, model_types):
-        with datamodels.open(input_file) as dm:
+    if isinstance(input_file, datamodels.DataModel):
+        data_dict = input_file.to_flat_dict(include_arrays=False)
+    elif isinstance(input_file, model_types):
+        # Only the metadata is needed, so don't read the arrays.
+        with datamodels.open(input_file, lazy=True) as dm:
             data_dict = dm.to_flat_dict(include_arrays=False)
     else:
         data_dict = _flatten_dict(input_file)
 
-    gc.collect()
+    context = _get_context()
+    key = (context, _get_matching_parameters(data_dict, context))
+    with _bestrefs_lock:
+        # Move it to the end, as the most recently used
+        known = _bestrefs_memo.pop(key, {})
+        _bestrefs_memo[key] = known
+        while len(_bestrefs_memo) > BESTREFS_MEMO_SIZE:
+            _bestrefs_memo.popitem(last=False)
+        refpaths = {filetype: known[filetype]
+                    for filetype in reference_file_types if filetype in known}
+    missing = [filetype for filetype in reference_file_types
+               if filetype not in refpaths]
+    if not missing:
+        return refpaths
 
     try:
-        bestrefs = crds.getreferences(data_dict, reftypes=reference_file_types, observatory="jwst")
+        bestrefs = crds.getreferences(data_dict, reftypes=missing, observatory="jwst")
     except crds.CrdsBadRulesError as exc:
         raise crds.CrdsBadRulesError(str(exc))
     except crds.CrdsBadReferenceError as exc:
         raise crds.CrdsBadReferenceError(str(exc))
 
-    refpaths = {filetype: filepath if "N/A" not in filepath.upper() else "N/A"
-                 for (filetype, filepath) in bestrefs.items()}
+    fetched = {filetype: filepath if "N/A" not in filepath.upper() else "N/A"
+               for (filetype, filepath) in bestrefs.items()}
+    with _bestrefs_lock:
+        known.update(fetched)
+    refpaths.update(fetched)
 
     return refpaths
 
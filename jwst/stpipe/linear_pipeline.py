@@ -36,6 +36,7 @@ from __future__ import absolute_import, division, print_function
 import gc
 
 from astropy.extern import six
+from .background_writer import BackgroundWriter
 from .pipeline import Pipeline
 
 
@@ -66,6 +67,10 @@ class LinearPipeline(Pipeline):
     start_step = string(default=None)  # Start the pipeline at this step
     end_step = string(default=None)    # End the pipeline right before this step
 
+    # In streaming mode, the products of the steps are saved on a
+    # background thread, and only the product of end_step is cached
+    stream = boolean(default=False)    # Save the step products in the background
+
     # [steps] section is implicitly added by the Pipeline class.
     """
 
@@ -144,13 +149,27 @@ class LinearPipeline(Pipeline):
 
             elif mode == 'RUN':
                 dm = step(input_file)
-                if do_caching:
-                    dm.save(filename)
+                if writer is None:
+                    if do_caching:
+                        dm.save(filename)
+                elif name == self.end_step:
+                    writer.save(dm, filename)
                 if name == self.end_step:
                     return None
                 return recurse(mode, dm, pipeline_steps[1:])
 
-        result = recurse(mode, input_file, self.pipeline_steps)
+        # In streaming mode the steps save their products with a shared
+        # background writer, which is drained before returning.
+        writer = BackgroundWriter() if self.stream else None
+        for name, cls in self.pipeline_steps:
+            getattr(self, name)._writer = writer
+        try:
+            result = recurse(mode, input_file, self.pipeline_steps)
+        finally:
+            for name, cls in self.pipeline_steps:
+                getattr(self, name)._writer = None
+            if writer is not None:
+                writer.close()
         gc.collect()
         return result
 
@@ -215,10 +215,45 @@ def load_configuration(config_file):
     for key, val in config.items():
         log_config[key] = LogConfig(key, **val)
 
-    for log in logging.Logger.manager.loggerDict.values():
-        if isinstance(log, logging.Logger):
-            for cfg in log_config.values():
-                cfg.match_and_apply(log)
+    _apply_configuration()
+
+
+def _existing_loggers():
+    return [log for log in logging.Logger.manager.loggerDict.values()
+            if isinstance(log, logging.Logger)]
+
+
+def _apply_configuration():
+    for log in _existing_loggers():
+        for cfg in log_config.values():
+            cfg.match_and_apply(log)
+
+
+def set_format_prefix(prefix):
+    """
+    Prefixes the messages of all of the configured loggers with
+    `prefix`, for example to tell apart the messages of parallel
+    worker processes.
+
+    Parameters
+    ----------
+    prefix : str
+
+    Notes
+    -----
+    Only the formatters of the configured handlers are replaced; the
+    handlers themselves are kept, so that a ``file:`` handler is not
+    reopened, and its file truncated, by each worker.
+    """
+    loggers = _existing_loggers()
+    for cfg in log_config.values():
+        cfg.format = prefix + cfg.format
+        formatter = logging.Formatter(cfg.format)
+        for log in loggers:
+            if cfg.match(log.name):
+                for handler in log.handlers:
+                    if hasattr(handler, '_from_config'):
+                        handler.setFormatter(formatter)
 
 
 def getLogger(name=None):
@@ -39,7 +39,9 @@ import gc
 from .configobj.configobj import Section
 
 from . import config_parser
+from . import crds_client
 from . import Step
+from ..lib import chunks
 
 
 class Pipeline(Step):
@@ -115,6 +117,75 @@ class Pipeline(Step):
 
         return spec
 
+    def run_steps(self, steps, input, fuse=False):
+        """
+        Run steps in turn, each on the result of the previous one.
+
+        Parameters
+        ----------
+        steps : list of Step instances
+            The steps to run, in order.
+
+        input : DataModel instance or str
+            The input of the first step.
+
+        fuse : bool, optional
+            If True, each sequence of consecutive steps that `can_fuse`
+            is run on a single copy of its input, and the block by block
+            work of all of its steps is then done in one pass over the
+            science data, rather than one pass per step.  The steps
+            update the metadata and reference file bookkeeping of the
+            result as when they run separately.
+
+        Returns
+        -------
+        result : DataModel instance
+            The result of the last step.
+        """
+        fused = []
+        for step in list(steps) + [None]:
+            if fuse and step is not None and step.can_fuse():
+                fused.append(step)
+                continue
+            if len(fused) == 1:
+                input = fused[0](input)
+            elif len(fused) > 1:
+                input = self._run_fused(fused, input)
+            fused = []
+            if step is not None:
+                input = step(input)
+        return input
+
+    def _run_fused(self, steps, input):
+        """
+        Run chunkable steps on a single copy of ``input``, collecting
+        their kernels, and then apply the kernels in one pass.  The pass
+        uses the smallest chunk_size, the largest chunk_threads and the
+        first chunk_dir set of the steps.
+        """
+        self.log.info('Running steps {0} in a single pass'.format(
+            ', '.join(step.name for step in steps)))
+
+        chunk_dirs = [step.chunk_dir for step in steps
+                      if step.chunk_dir is not None]
+        input_model, model = chunks.open_output(
+            input, chunk_dirs[0] if len(chunk_dirs) else None)
+        kernels = []
+        for step in steps:
+            step._fused_kernels = kernels
+            try:
+                model = step(model)
+            finally:
+                step._fused_kernels = None
+
+        chunks.apply_kernel(
+            chunks.fuse_kernels(kernels) if len(kernels) else None, model,
+            chunk_size=min(step.chunk_size for step in steps),
+            threads=max(step.chunk_threads for step in steps),
+            source=input_model)
+        chunks.finish_output(input, input_model, model)
+        return model
+
     def _precache_reference_files(self, input_file):
         """
         Precache all of the expected reference files in this Pipeline
@@ -125,17 +196,37 @@ class Pipeline(Step):
         if self._is_association_file(input_file):
             return
         try:
-            with datamodels.open(input_file) as model:
-                pass
+            if isinstance(input_file, datamodels.DataModel):
+                # Only the metadata is needed, so don't copy the model
+                model = input_file
+            else:
+                model = datamodels.open(input_file, lazy=True)
         except (ValueError, TypeError, IOError):
             self.log.info(
                 'First argument {0} does not appear to be a '
                 'model'.format(input_file))
         else:
-            super(Pipeline, self)._precache_reference_files(input_file)
-            for name in self.step_defs.keys():
-                step = getattr(self, name)
-                step._precache_reference_files(input_file)
+            steps = [self] + [getattr(self, name)
+                              for name in self.step_defs.keys()]
+            # Resolve the reference files of all of the steps with a
+            # single CRDS call; the steps then get them from the memo
+            # of crds_client.
+            fetch_types = set()
+            for step in steps:
+                if not step.skip:
+                    fetch_types.update(
+                        reftype for reftype in step.reference_file_types
+                        if step._get_ref_override(reftype) is None)
+            crds_client.get_multiple_reference_paths(
+                model, sorted(fetch_types))
+            self._precache_reference_files_impl(model)
+            for step in steps[1:]:
+                if isinstance(step, Pipeline):
+                    step._precache_reference_files(input_file)
+                else:
+                    step._precache_reference_files_impl(model)
+            if model is not input_file:
+                model.close()
         gc.collect()
 
     def set_input_filename(self, path):
@@ -0,0 +1,125 @@
+"""
+Measuring the resources used by steps
+"""
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+__all__ = ['snapshot', 'make_record', 'format_summary']
+
+
+def _peak_rss():
+    # The peak resident set size of the process, in bytes
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    if sys.platform != 'darwin':
+        peak *= 1024
+    return peak
+
+
+def _io_counters():
+    # The bytes read and written by the process, where the system
+    # reports them
+    try:
+        with open('/proc/self/io') as fd:
+            counters = dict(line.split(':') for line in fd if ':' in line)
+        return int(counters['rchar']), int(counters['wchar'])
+    except (IOError, OSError, KeyError, ValueError):
+        return None, None
+
+
+def snapshot():
+    """
+    Take a snapshot of the resource counters of the process.
+
+    Returns
+    -------
+    usage : dict
+        The wall clock and CPU times, in seconds, the peak resident set
+        size and the bytes read and written.  Counters the system does
+        not provide are None.
+    """
+    times = os.times()
+    bytes_read, bytes_written = _io_counters()
+    return {
+        'wall_time': time.time(),
+        'cpu_time': times[0] + times[1],
+        'peak_rss': _peak_rss(),
+        'bytes_read': bytes_read,
+        'bytes_written': bytes_written,
+        }
+
+
+def make_record(name, start, end, reference_time):
+    """
+    Make the record of the resources used by a step invocation.
+
+    Parameters
+    ----------
+    name : str
+        The qualified name of the step.
+
+    start, end : dict
+        The `snapshot` taken before and after the step ran.
+
+    reference_time : float
+        The time spent getting and opening reference files, in seconds.
+
+    Returns
+    -------
+    record : dict
+        The wall clock and CPU times, the increase of the peak resident
+        set size, the bytes read and written and the reference file time.
+    """
+    record = {'step': name}
+    for key in ('wall_time', 'cpu_time', 'peak_rss', 'bytes_read',
+                'bytes_written'):
+        if start[key] is None or end[key] is None:
+            record[key] = None
+        else:
+            record[key] = end[key] - start[key]
+    record['peak_rss_delta'] = record.pop('peak_rss')
+    record['reference_time'] = reference_time
+    return record
+
+
+def format_summary(records):
+    """
+    Format the records of several step invocations as a table.
+
+    Parameters
+    ----------
+    records : list of dict
+        Records made by `make_record`.
+
+    Returns
+    -------
+    summary : str
+    """
+    def megabytes(value):
+        if value is None:
+            return '-'
+        return '{0:.1f}'.format(value / 2.0 ** 20)
+
+    lines = ['{0:<40} {1:>9} {2:>9} {3:>9} {4:>9} {5:>9} {6:>9}'.format(
+        'Step', 'Wall (s)', 'CPU (s)', 'RSS+ (MB)', 'Read (MB)',
+        'Write (MB)', 'Refs (s)')]
+    for record in records:
+        lines.append(
+            '{0:<40} {1:>9.2f} {2:>9.2f} {3:>9} {4:>9} {5:>9} {6:>9.2f}'.format(
+                record['step'], record['wall_time'], record['cpu_time'],
+                megabytes(record['peak_rss_delta']),
+                megabytes(record['bytes_read']),
+                megabytes(record['bytes_written']),
+                record['reference_time']))
+    return '\n'.join(lines)
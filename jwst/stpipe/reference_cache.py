@@ -0,0 +1,200 @@
+"""
+An in-process cache of opened reference file models
+"""
+from __future__ import absolute_import, division, print_function
+
+from collections import OrderedDict
+import os
+import threading
+
+import numpy as np
+
+from . import log
+
+
+__all__ = ['ReferenceModelCache', 'cache', 'open_model', 'get_model']
+
+
+# The default memory budget of the cache, in megabytes
+DEFAULT_CACHE_SIZE = 1024
+
+
+class ReferenceModelCache(object):
+    """
+    A least-recently-used cache of opened reference file models.
+
+    The models are keyed by the absolute path and the modification time
+    of the file, and by the model class used to open it, so that a file
+    that changes on disk is opened again.  Models are evicted, least
+    recently used first, when the total size of their arrays exceeds
+    `max_bytes`.
+
+    The cached models themselves are never handed out: `open_model`
+    returns a copy that shares the arrays of the cached model until they
+    are used, so that the caller is free to modify and close it.
+
+    Parameters
+    ----------
+    max_bytes : int
+        The memory budget of the cache.  Models whose arrays are larger
+        than this are not cached.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._models = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.log = log.getLogger('stpipe.reference_cache')
+
+    @property
+    def nbytes(self):
+        """
+        The total size of the arrays of the cached models.
+        """
+        return self._nbytes
+
+    def open_model(self, path, model_class=None):
+        """
+        Open a reference file as a data model, or get it from the cache.
+
+        Parameters
+        ----------
+        path : str
+            The path of the reference file.
+
+        model_class : DataModel subclass, optional
+            The class of model to open the file with.  If not given, the
+            file is opened with `jwst.datamodels.open`.
+
+        Returns
+        -------
+        model : DataModel instance
+            A model of the reference file, owned by the caller.
+        """
+        from .. import datamodels
+
+        if model_class is None:
+            model_class = datamodels.open
+        return self.get_model(path, model_class, lambda: model_class(path))
+
+    def get_model(self, path, key, make_model):
+        """
+        Get a model made from a reference file from the cache, or make
+        it.  This caches models derived from a reference file, such as
+        an averaged version of its data, under the same memory budget as
+        the opened reference files.
+
+        Parameters
+        ----------
+        path : str
+            The path of the reference file the model is made from.
+
+        key : hashable
+            Identifies the model among those made from the file.
+
+        make_model : callable
+            Called with no arguments to make the model when it is not
+            in the cache.
+
+        Returns
+        -------
+        model : DataModel instance
+            A copy of the model, owned by the caller.
+        """
+        if self.max_bytes <= 0:
+            return make_model()
+        path = os.path.abspath(path)
+        key = (path, os.path.getmtime(path), key)
+
+        with self._lock:
+            entry = self._models.pop(key, None)
+            if entry is not None:
+                # Move it to the end, as the most recently used
+                self._models[key] = entry
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._log_lookup(entry is not None, path)
+
+        if entry is not None:
+            return entry[0].copy(share_arrays=True)
+
+        model = make_model()
+        nbytes = sum(val.nbytes for _, val in model.iteritems()
+                     if isinstance(val, np.ndarray))
+        if nbytes > self.max_bytes:
+            self.log.debug(
+                "Model of reference file '{0}' ({1} bytes) is too large to "
+                "cache".format(path, nbytes))
+            return model
+
+        with self._lock:
+            if key in self._models:
+                # Made by another thread in the meantime
+                model.close()
+                model = self._models[key][0]
+            else:
+                self._models[key] = (model, nbytes)
+                self._nbytes += nbytes
+                self._evict()
+
+        return model.copy(share_arrays=True)
+
+    def clear(self):
+        """
+        Remove and close all of the cached models.
+        """
+        with self._lock:
+            while self._models:
+                _, (model, _) = self._models.popitem()
+                model.close()
+            self._nbytes = 0
+
+    def _evict(self):
+        # Must be called with the lock held
+        while self._nbytes > self.max_bytes and self._models:
+            (path, _, _), (model, nbytes) = self._models.popitem(last=False)
+            self._nbytes -= nbytes
+            model.close()
+            self.log.debug(
+                "Evicted reference file '{0}' from the cache".format(path))
+
+    def _log_lookup(self, hit, path):
+        self.log.info(
+            "Reference model cache {0} for '{1}' "
+            "({2} hits, {3} misses, {4:.1f} MB cached)".format(
+                'hit' if hit else 'miss', path, self.hits, self.misses,
+                self._nbytes / 2.0 ** 20))
+
+
+def _get_max_bytes():
+    # The memory budget may be set, in megabytes, with the
+    # STPIPE_REFERENCE_CACHE_SIZE environment variable.  0 disables the
+    # cache.
+    size = os.environ.get('STPIPE_REFERENCE_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+    try:
+        size = float(size)
+    except ValueError:
+        size = DEFAULT_CACHE_SIZE
+    return int(size * 2 ** 20)
+
+
+cache = ReferenceModelCache(_get_max_bytes())
+
+
+def open_model(path, model_class=None):
+    """
+    Open a reference file as a data model, through the process-wide
+    reference model cache.  See `ReferenceModelCache.open_model`.
+    """
+    return cache.open_model(path, model_class)
+
+
+def get_model(path, key, make_model):
+    """
+    Get a model made from a reference file through the process-wide
+    reference model cache.  See `ReferenceModelCache.get_model`.
+    """
+    return cache.get_model(path, key, make_model)
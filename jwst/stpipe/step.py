@@ -4,10 +4,14 @@ Step
 from __future__ import absolute_import, division, print_function
 
 import contextlib
+import json
+import time
 from astropy.extern import six
 from os.path import dirname, join, basename, splitext, abspath, split
 import sys
 import gc
+import multiprocessing
+import traceback
 
 try:
     from astropy.io import fits
@@ -18,8 +22,12 @@ except ImportError:
 from . import config_parser
 from . import crds_client
 from . import log
+from . import profiling
+from . import reference_cache
 from . import utilities
 from .. import __version_commit__, __version__
+from ..lib import chunks
+from ..lib.processes import fork_context
 
 
 class Step(object):
@@ -33,10 +41,16 @@ class Step(object):
     output_dir = string(default=None) # Directory path for output files
     output_file = output_file(default=None) # File to save output to.
     skip = boolean(default=False) # Skip this step
+    profile = boolean(default=False) # Log the resources used by the step, and by the steps of a pipeline
     """
 
     reference_file_types = []
 
+    # Steps that process ramp data in blocks, with jwst.lib.chunks, set
+    # this to get the chunk_size and chunk_threads parameters, and
+    # implement prepare_chunks
+    chunkable = False
+
     @classmethod
     def merge_config(cls, config, config_file):
         return config
@@ -52,6 +66,18 @@ class Step(object):
             spec.inline_comments[override_name] = (
                 '# Override the {0} reference file'.format(
                     reference_file_type))
+        if cls.chunkable:
+            spec['chunk_size'] = 'float(default={0})'.format(
+                chunks.DEFAULT_CHUNK_SIZE)
+            spec.inline_comments['chunk_size'] = (
+                '# Size in MB of the blocks of rows the data are processed in')
+            spec['chunk_threads'] = 'integer(default=1)'
+            spec.inline_comments['chunk_threads'] = (
+                '# Number of threads processing the blocks')
+            spec['chunk_dir'] = 'string(default=None)'
+            spec.inline_comments['chunk_dir'] = (
+                '# Directory of temporary files memory mapping the output '
+                'arrays, for data larger than memory')
         return spec
 
     @classmethod
@@ -298,6 +324,20 @@ class Step(object):
 
         self._input_filename = None
 
+        # A BackgroundWriter to save the results with, set by a pipeline
+        # that runs in streaming mode
+        self._writer = None
+
+        # The time spent getting and opening reference files in a run, and
+        # the resource usage records of the runs of this step and its
+        # substeps, when profiling
+        self._reference_time = 0.0
+        self._profile_records = []
+
+        # The list the kernels of a chunkable step are added to, instead
+        # of being applied, when a pipeline fuses it with other steps
+        self._fused_kernels = None
+
     def _check_args(self, args, discouraged_types, msg):
         if discouraged_types is None:
             return
@@ -326,9 +366,17 @@ class Step(object):
 
         result = None
 
+        profiling_on = self._is_profiling()
+        if profiling_on:
+            self._reference_time = 0.0
+            self._profile_records = []
+            usage = profiling.snapshot()
+
         try:
             if len(args):
+                start = time.time()
                 self._precache_reference_files(args[0])
+                self._reference_time += time.time() - start
 
             self.log.info(
                 'Step {0} running with args {1}.'.format(
@@ -349,7 +397,8 @@ class Step(object):
                 result = args[0]
             else:
                 try:
-                    result = self.process(*args)
+                    with datamodels.deferred_validation():
+                        result = self.process(*args)
                 except TypeError as e:
                     if "process() takes exactly" in str(e):
                         raise TypeError("Incorrect number of arguments to step")
@@ -363,6 +412,12 @@ class Step(object):
             else:
                 results = result
 
+            # Validate the changes made by the step to the models it was
+            #   passed and returns, which were deferred while it ran.
+            for model in list(args) + list(results):
+                if isinstance(model, datamodels.DataModel):
+                    model.validate()
+
             if len(self._reference_files_used) and not self._is_association_file(args[0]):
                 for result in results:
                     if isinstance(result, datamodels.DataModel):
@@ -395,10 +450,17 @@ class Step(object):
                             output_file_name = join(self.output_dir, filename)
 
                         self.log.info('Saving file {0}'.format(output_file_name))
-                        result.save(output_file_name, overwrite=True)
+                        if self._writer is not None:
+                            self._writer.save(result, output_file_name,
+                                              overwrite=True)
+                        else:
+                            result.save(output_file_name, overwrite=True)
 
             self.log.info(
                 'Step {0} done'.format(self.name))
+
+            if profiling_on:
+                self._log_resource_usage(usage)
         finally:
             log.delegator.log = orig_log
 
@@ -406,6 +468,132 @@ class Step(object):
 
     __call__ = run
 
+    def _is_profiling(self):
+        """
+        Profiling is turned on by the `profile` parameter of the step, or
+        of any of the pipelines it is part of.
+        """
+        step = self
+        while step is not None:
+            if getattr(step, 'profile', False):
+                return True
+            step = step.parent
+        return False
+
+    def _log_resource_usage(self, usage):
+        """
+        Log the JSON record of the resources used by this run, since the
+        `usage` snapshot was taken.  The outermost step also logs a summary
+        of the records of all of the steps that ran.
+        """
+        record = profiling.make_record(
+            self.qualified_name, usage, profiling.snapshot(),
+            self._reference_time)
+        self.log.info('Resource usage: {0}'.format(
+            json.dumps(record, sort_keys=True)))
+
+        root = self
+        while root.parent is not None:
+            root = root.parent
+        root._profile_records.append(record)
+        if root is self and len(self._profile_records) > 1:
+            self.log.info('Resource usage summary:\n{0}'.format(
+                profiling.format_summary(self._profile_records)))
+
+    def run_many(self, inputs, workers=1):
+        """
+        Run the step on each of several independent inputs, such as the
+        exposures of a batch.
+
+        The inputs are run in a pool of `workers` processes, each of
+        which runs its own copy of this step, with its messages prefixed
+        by the name of the process.  A worker keeps its reference file
+        models and best references cached across all of the inputs it
+        runs.  An input that fails does not stop the others.
+
+        The results are not returned, so they should be saved: each
+        input that is a file name is saved to its own output file,
+        named after the input like on the command line.
+
+        The worker processes are forked from this one, which is how they
+        get their copy of the step, so ``workers > 1`` is only available
+        where `os.fork` is (not on Windows).  The caches are per worker:
+        they are not shared between the workers or with this process.
+
+        Parameters
+        ----------
+        inputs : list
+            The inputs to run the step on.  Each is passed as the only
+            argument of `run`.
+
+        workers : int, optional
+            The number of worker processes.  With 1, the inputs are run
+            one after the other in this process.
+
+        Returns
+        -------
+        failures : list of (input, str) tuples
+            The inputs that failed, with the traceback of their error.
+        """
+        inputs = list(inputs)
+        self.log.info(
+            'Running {0} on {1} inputs with {2} worker(s).'.format(
+                self.name, len(inputs), workers))
+
+        if workers > 1:
+            # The step is handed to the workers by forking; it is not
+            #   picklable, so the spawn start method can't be used.
+            context = fork_context()
+            if context is None:
+                raise RuntimeError(
+                    'run_many with more than one worker requires os.fork')
+            pool = context.Pool(workers, initializer=_init_batch_worker,
+                                initargs=(self,))
+            try:
+                errors = list(pool.imap(_run_batch_worker, inputs))
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            errors = [self._run_batch_input(input) for input in inputs]
+
+        failures = [(input, error) for (input, error) in zip(inputs, errors)
+                    if error is not None]
+        for input, error in failures:
+            self.log.error(
+                '{0} failed on {1}:\n{2}'.format(self.name, input, error))
+        self.log.info(
+            '{0} succeeded on {1} of {2} inputs.'.format(
+                self.name, len(inputs) - len(failures), len(inputs)))
+
+        return failures
+
+    def _run_batch_input(self, input):
+        """
+        Run the step on one of the inputs of `run_many`.  Returns None
+        if it succeeds, or the traceback of the error if it fails.
+        """
+        from .. import datamodels
+
+        output_file = self.output_file
+        if isinstance(input, six.string_types):
+            self.set_input_filename(input)
+            self.output_file = abspath(
+                splitext(input)[0] + "_{0}.fits".format(self.name))
+        try:
+            result = self.run(input)
+        except Exception:
+            return traceback.format_exc()
+        finally:
+            self.output_file = output_file
+
+        if not isinstance(result, (list, tuple)):
+            result = [result]
+        for model in result:
+            if isinstance(model, datamodels.DataModel):
+                model.close()
+        return None
+
     def process(self, *args):
         """
         This is where real work happens. Every Step subclass has to
@@ -414,6 +602,65 @@ class Step(object):
         """
         raise NotImplementedError('Steps have to override process().')
 
+    def prepare_chunks(self, model):
+        """
+        Prepare to apply the step to ``model`` in place, one block of its
+        science data at a time.  `chunkable` steps implement this with
+        all of the work of the step that is not done block by block:
+        getting the reference files, updating the 2-D arrays and setting
+        the ``meta.cal_step`` status.  It must not replace the science
+        arrays of the model, which the kernel changes in place.
+
+        Returns
+        -------
+        kernel : `jwst.lib.chunks.ChunkKernel` or None
+            The operation to apply to each block, or None if there is
+            nothing to do block by block.
+        """
+        raise NotImplementedError(
+            'Chunkable steps have to override prepare_chunks().')
+
+    def run_chunks(self, input):
+        """
+        Apply a `chunkable` step, block by block, to a copy of ``input``.
+        This is the `process` method of such steps.
+
+        A file name ``input`` is opened lazily, so that its science
+        arrays are read one block at a time, and the science arrays of
+        the result are memory mapped to temporary files in ``chunk_dir``
+        if it is set, so that the step's memory use is bounded by the
+        block size.
+
+        When a pipeline fuses the step with others, ``input`` is instead
+        prepared in place and the kernel is handed to the pipeline, which
+        applies the kernels of all of the fused steps in one pass.
+        """
+        if self._fused_kernels is not None:
+            kernel = self.prepare_chunks(input)
+            if kernel is not None:
+                self._fused_kernels.append(kernel)
+            return input
+
+        # The science arrays of the input are only read, and those of the
+        #   result only filled, one block at a time
+        input_model, result = chunks.open_output(input, self.chunk_dir)
+        kernel = self.prepare_chunks(result)
+        chunks.apply_kernel(kernel, result, self.chunk_size,
+                            self.chunk_threads, source=input_model)
+        chunks.finish_output(input, input_model, result)
+        return result
+
+    def can_fuse(self):
+        """
+        Whether the step may be fused with others by a pipeline.  Only
+        `chunkable` steps whose result is not saved and has no hooks run
+        on it may be, since their result is only complete after the
+        fused pass.
+        """
+        return (self.chunkable and not self.skip and
+                self.output_file is None and
+                not len(self._pre_hooks) and not len(self._post_hooks))
+
     def resolve_file_name(self, file_name):
         """
         Resolve a file name expressed relative to this Step's
@@ -471,7 +718,7 @@ class Step(object):
         if len(self.reference_file_types):
             from .. import datamodels
             try:
-                model = datamodels.open(input_file)
+                model = datamodels.open(input_file, lazy=True)
             except (ValueError, TypeError, IOError):
                 self.log.info(
                     'First argument {0} does not appear to be a '
@@ -549,6 +796,13 @@ class Step(object):
             A readable file-like object with the contents of the
             reference file.
         """
+        start = time.time()
+        try:
+            return self._get_reference_file(input_file, reference_file_type)
+        finally:
+            self._reference_time += time.time() - start
+
+    def _get_reference_file(self, input_file, reference_file_type):
         override = self._get_ref_override(reference_file_type)
         if override is not None:
             if override.strip() != "":
@@ -594,13 +848,43 @@ class Step(object):
         reference_file_model : jwst.datamodels.ModelBase instance
             A model to access the contents of the reference file.
         """
-        from .. import datamodels
-
-        filename = self.get_reference_file(input, reference_file_type)
-        with datamodels.open(filename) as model:
+        filename = self.get_reference_file(input_file, reference_file_type)
+        with self.open_reference_model(filename) as model:
             yield model
         gc.collect()
 
+    def open_reference_model(self, reference_name, model_class=None):
+        """
+        Open a reference file as a jwst.datamodels.ModelBase object.
+
+        The models of reference files are cached in memory by path and
+        modification time, so that a reference file used again, by
+        another step or for another exposure, is not read and parsed
+        again.  The size of the cache, in megabytes, is set by the
+        ``STPIPE_REFERENCE_CACHE_SIZE`` environment variable.
+
+        Parameters
+        ----------
+        reference_name : str
+            The path of the reference file, as returned by
+            `get_reference_file`.
+
+        model_class : jwst.datamodels.ModelBase subclass, optional
+            The class of model to open the reference file with.  If not
+            given, `jwst.datamodels.open` is used.
+
+        Returns
+        -------
+        reference_file_model : jwst.datamodels.ModelBase instance
+            A model of the reference file.  It is owned by the caller,
+            who may modify it, and should close it.
+        """
+        start = time.time()
+        try:
+            return reference_cache.open_model(reference_name, model_class)
+        finally:
+            self._reference_time += time.time() - start
+
     def set_input_filename(self, path):
         """
         Sets the name of the master input file.  Used to generate output
@@ -651,3 +935,18 @@ class Step(object):
 
         new_path = join(dirname, new_filename)
         model.save(new_path, *args, **kwargs)
+
+
+# The step run by a batch worker process; set by _init_batch_worker when
+#   the process pool of Step.run_many starts up.
+_batch_worker = {}
+
+
+def _init_batch_worker(step):
+    _batch_worker['step'] = step
+    log.set_format_prefix(
+        '[{0}] '.format(multiprocessing.current_process().name))
+
+
+def _run_batch_worker(input):
+    return _batch_worker['step']._run_batch_input(input)
@@ -1,5 +1,6 @@
 from __future__ import absolute_import, print_function
 
+import collections
 from os.path import join, dirname, basename
 import shutil
 import tempfile
@@ -149,3 +150,50 @@ def test_crds_flatten():
     flat = crds_client._flatten_dict(json)
     print(flat)
     assert flat['meta.instrument.name'] == 'MIRI'
+
+
+def test_crds_bestrefs_memo(monkeypatch):
+    from jwst.stpipe import crds_client
+
+    calls = []
+    def getreferences(parameters, reftypes=None, observatory=None):
+        calls.append(reftypes)
+        return {reftype: '/refs/' + reftype for reftype in reftypes}
+
+    context = ['jwst_0001.pmap']
+    parkeys = frozenset(['META.INSTRUMENT.NAME', 'META.INSTRUMENT.DETECTOR'])
+    monkeypatch.setattr(crds, 'getreferences', getreferences)
+    monkeypatch.setattr(crds_client, '_get_context',
+                        lambda observatory='jwst': context[0])
+    monkeypatch.setattr(crds_client, '_bestrefs_memo',
+                        collections.OrderedDict())
+    monkeypatch.setattr(crds_client, 'BESTREFS_MEMO_SIZE', 2)
+    monkeypatch.setattr(crds_client, '_parkeys_cache', {
+        ('jwst', 'jwst_0001.pmap'): parkeys,
+        ('jwst', 'jwst_0002.pmap'): parkeys})
+
+    header = {
+        'meta': {
+            'instrument': {'name': 'NIRCAM', 'detector': 'NRCA1'},
+            'cal_step': {'dq_init': 'COMPLETE'}
+            }
+        }
+    refs = crds_client.get_multiple_reference_paths(header, ['dark', 'flat'])
+    assert refs == {'dark': '/refs/dark', 'flat': '/refs/flat'}
+
+    header['meta']['cal_step']['dark'] = 'COMPLETE'
+    refs = crds_client.get_multiple_reference_paths(header, ['flat', 'gain'])
+    assert refs == {'flat': '/refs/flat', 'gain': '/refs/gain'}
+    assert calls == [['dark', 'flat'], ['gain']]
+
+    header['meta']['instrument']['detector'] = 'NRCA2'
+    crds_client.get_multiple_reference_paths(header, ['flat'])
+    assert calls[-1] == ['flat']
+
+    # A new context resolves the references again
+    context[0] = 'jwst_0002.pmap'
+    crds_client.get_multiple_reference_paths(header, ['flat'])
+    assert len(calls) == 4
+
+    # Only the most recently used parameters are kept
+    assert len(crds_client._bestrefs_memo) == 2
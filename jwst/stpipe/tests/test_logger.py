@@ -79,3 +79,33 @@ break_level = ERROR
 level = WARNING
 format = '%(message)s'
 """.format(logfilename)
+
+
+def test_format_prefix():
+    with get_tempfile() as logfilename:
+
+        configuration = """
+[.]
+handler = file:{0}
+level = INFO
+format = '%(message)s'
+""".format(logfilename)
+
+        fd = io.BytesIO()
+        fd.write(configuration.encode('latin-1'))
+        fd.seek(0)
+        stpipe_log.load_configuration(fd)
+
+        log = stpipe_log.getLogger(stpipe_log.STPIPE_ROOT_LOGGER)
+        handlers = list(log.handlers)
+
+        log.info("Before")
+        stpipe_log.set_format_prefix('[worker] ')
+        log.info("After")
+
+        assert log.handlers == handlers
+
+        with open(logfilename, 'r') as fd:
+            lines = [x.strip() for x in fd.readlines()]
+
+        assert lines == ['Before', '[worker] After']
@@ -71,6 +71,60 @@ class MultiplyBy2(Step):
                 return dm2
 
 
+class AddOne(Step):
+    """
+    A chunkable Step adding 1 to the ramp, one block at a time.
+    """
+
+    chunkable = True
+
+    def process(self, input):
+        return self.run_chunks(input)
+
+    def prepare_chunks(self, model):
+        from ...lib import chunks
+
+        model.meta.filename = 'add_one'
+        data = model.data
+
+        def add_one(chunk):
+            chunk.science(data)[...] += 1
+
+        return chunks.ChunkKernel(add_one)
+
+
+class Double(AddOne):
+    """
+    A chunkable Step doubling the ramp, one block at a time.
+    """
+
+    def prepare_chunks(self, model):
+        from ...lib import chunks
+
+        data = model.data
+
+        def double(chunk):
+            chunk.science(data)[...] *= 2
+
+        return chunks.ChunkKernel(double)
+
+
+class FusedPipeline(Pipeline):
+    """
+    A pipeline running chunkable steps.
+    """
+
+    step_defs = {'add_one': AddOne, 'double': Double}
+
+    spec = """
+    fuse = boolean(default=False)
+    """
+
+    def process(self, input):
+        return self.run_steps([self.add_one, self.double], input,
+                              fuse=self.fuse)
+
+
 class TestPipeline(Pipeline):
     """
     A test pipeline.
@@ -155,6 +209,26 @@ def test_partial_pipeline():
     assert_allclose(np.sum(result.data), 9969.82514685, rtol=1e-4)
 
 
+def test_partial_pipeline_stream():
+    import os
+    import tempfile
+
+    pipe = TestLinearPipeline()
+    pipe.stream = True
+    pipe.multiply.output_file = os.path.join(
+        tempfile.mkdtemp(), 'multiply.fits')
+
+    pipe.end_step = 'multiply2'
+    result = pipe.run(abspath(join(dirname(__file__), 'data', 'science.fits')))
+    assert os.path.exists(pipe.multiply.output_file)
+
+    pipe.start_step = 'multiply3'
+    pipe.end_step = None
+    result = pipe.run(abspath(join(dirname(__file__), 'data', 'science.fits')))
+
+    assert_allclose(np.sum(result.data), 9969.82514685, rtol=1e-4)
+
+
 def test_pipeline_commandline():
     args = [
         abspath(join(dirname(__file__), 'steps', 'python_pipeline.cfg')),
@@ -220,3 +294,36 @@ def test_pipeline_commandline_invalid_args():
 
     # Make sure the comments made it into the help message
     assert "Multiply by this number" in help
+
+
+def test_pipeline_profile():
+    pipe = TestLinearPipeline(profile=True)
+    pipe.run(abspath(join(dirname(__file__), 'data', 'science.fits')))
+
+    records = pipe._profile_records
+    assert [record['step'] for record in records] == [
+        'stpipe.TestLinearPipeline.multiply',
+        'stpipe.TestLinearPipeline.multiply2',
+        'stpipe.TestLinearPipeline.multiply3',
+        'stpipe.TestLinearPipeline']
+    for record in records:
+        assert record['wall_time'] >= 0
+        assert record['reference_time'] >= 0
+
+
+def test_pipeline_fuse_steps():
+    from ... import datamodels
+
+    data = np.arange(2 * 3 * 40 * 5, dtype=np.float32).reshape(2, 3, 40, 5)
+    results = []
+    for fuse in (False, True):
+        model = datamodels.RampModel(data=data.copy())
+        pipe = FusedPipeline(fuse=fuse)
+        pipe.add_one.chunk_size = 1e-3
+        results.append(pipe.run(model))
+        # The input is not changed
+        assert_allclose(model.data, data)
+
+    for result in results:
+        assert_allclose(result.data, (data + 1) * 2)
+        assert result.meta.filename == 'add_one'
@@ -196,3 +196,67 @@ def test_save_model():
     Step.from_cmdline(args)
     fname = join(tempdir, 'flat_FOO_SaveStep.fits')
     assert isfile(fname)
+
+
+def test_reference_model_cache():
+    from ... import datamodels
+    from ..reference_cache import ReferenceModelCache
+
+    tempdir = tempfile.mkdtemp()
+    filename = join(tempdir, 'gain.fits')
+    with datamodels.ImageModel(data=np.ones((4, 4), dtype=np.float32)) as im:
+        im.save(filename)
+
+    cache = ReferenceModelCache(2 ** 20)
+    with cache.open_model(filename, datamodels.ImageModel) as model:
+        model.data *= 2
+    with cache.open_model(filename, datamodels.ImageModel) as model:
+        assert np.all(model.data == 1)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.nbytes >= 4 * 4 * 4
+
+    cache.max_bytes = 0
+    cache.open_model(filename, datamodels.ImageModel).close()
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.clear()
+    assert cache.nbytes == 0
+
+
+def test_reference_model_cache_derived():
+    from ... import datamodels
+    from ..reference_cache import ReferenceModelCache
+
+    tempdir = tempfile.mkdtemp()
+    filename = join(tempdir, 'dark.fits')
+    with datamodels.ImageModel(data=np.ones((4, 4), dtype=np.float32)) as im:
+        im.save(filename)
+
+    made = []
+
+    def make_model():
+        made.append(1)
+        with datamodels.ImageModel(filename) as model:
+            return datamodels.ImageModel(data=model.data * 2)
+
+    cache = ReferenceModelCache(2 ** 20)
+    for i in range(2):
+        with cache.get_model(filename, ('doubled', 2), make_model) as model:
+            assert np.all(model.data == 2)
+    assert len(made) == 1
+    with cache.get_model(filename, ('doubled', 3), make_model) as model:
+        assert np.all(model.data == 2)
+    assert len(made) == 2
+    cache.clear()
+
+
+def test_run_many():
+    from .steps import AnotherDummyStep
+
+    step = AnotherDummyStep("SomeOtherStepOriginal", par1=42.0, par2="abc")
+
+    assert step.run_many([1, 2, 3]) == []
+
+    failures = step.run_many([1, None, 3], workers=2)
+    assert len(failures) == 1
+    assert failures[0][0] is None
+    assert 'TypeError' in failures[0][1]
@@ -7,12 +7,13 @@ from __future__ import division
 import numpy as np
 import logging
 from .. import datamodels
+from ..lib import chunks
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
 
 
-def do_correction(input_model, bias_model):
+def do_correction(input_model, bias_model, chunk_size=None, threads=1):
     """
     Short Summary
     -------------
@@ -26,6 +27,12 @@ def do_correction(input_model, bias_model):
     bias_model: super-bias model object
         bias data
 
+    chunk_size: float
+        Size in MB of the blocks of rows the data are processed in
+
+    threads: int
+        Number of threads processing the blocks
+
     Returns
     -------
     output_model: data model object
@@ -33,23 +40,55 @@ def do_correction(input_model, bias_model):
 
     """
 
+    # Create output as a copy of the input science data model
+    output_model = input_model.copy()
+
+    kernel = prepare_correction(output_model, bias_model)
+    chunks.apply_kernel(kernel, output_model, chunk_size, threads)
+
+    return output_model
+
+
+def prepare_correction(output_model, bias_model):
+    """
+    Short Summary
+    -------------
+    Prepare the Super-Bias Subtraction of a science data set in place:
+    propagate the DQ flags of the bias, and get the operation that
+    subtracts the bias one block of the data at a time.
+
+    Parameters
+    ----------
+    output_model: data model object
+        science data to be corrected in place
+
+    bias_model: super-bias model object
+        bias data
+
+    Returns
+    -------
+    kernel: ChunkKernel
+        the operation subtracting the bias from a block
+
+    """
+
     # Replace NaN's in the superbias with zeros
     bias_model.data[np.isnan(bias_model.data)] = 0.0
 
     # Check for subarray mode and extract subarray from the
     # bias reference data if necessary
-    if not ref_matches_sci(bias_model, input_model):
-        bias_model = get_subarray(bias_model, input_model)
+    if not ref_matches_sci(bias_model, output_model):
+        bias_model = get_subarray(bias_model, output_model)
 
     # Subtract the bias ref image from the science data
-    output_model = subtract_bias(input_model, bias_model)
+    kernel = prepare_subtraction(output_model, bias_model)
 
     output_model.meta.cal_step.superbias = 'COMPLETE'
 
-    return output_model
+    return kernel
 
 
-def subtract_bias(input, bias):
+def subtract_bias(input, bias, chunk_size=None, threads=1):
     """
     Subtracts a superbias image from a science data set, subtracting the
     superbias from each group of each integration in the science data.
@@ -64,6 +103,12 @@ def subtract_bias(input, bias):
     bias: superbias model object
         the superbias image data
 
+    chunk_size: float
+        Size in MB of the blocks of rows the data are processed in
+
+    threads: int
+        Number of threads processing the blocks
+
     Returns
     -------
     output: data model object
@@ -74,14 +119,45 @@ def subtract_bias(input, bias):
     # Create output as a copy of the input science data model
     output = input.copy()
 
+    kernel = prepare_subtraction(output, bias)
+    chunks.apply_kernel(kernel, output, chunk_size, threads)
+
+    return output
+
+
+def prepare_subtraction(output, bias):
+    """
+    Propagates the DQ flags of a superbias image into the pixeldq array of
+    a science data set in place, and gets the operation that subtracts the
+    superbias from each group of a block of the science data.
+
+    Parameters
+    ----------
+    output: data model object
+        the science data, corrected in place
+
+    bias: superbias model object
+        the superbias image data
+
+    Returns
+    -------
+    kernel: ChunkKernel
+        the operation subtracting the superbias from a block
+
+    """
+
     # combine the science and superbias DQ arrays
-    output.pixeldq = np.bitwise_or(input.pixeldq, bias.dq)
+    output.pixeldq = np.bitwise_or(output.pixeldq, bias.dq)
 
-    # Subtract the superbias image from all groups and integrations
-    # of the science data
-    output.data -= bias.data
+    # Subtract the superbias image from all groups of each block of rows
+    # of each integration of the science data
+    data = output.data
+    bias_data = bias.data
 
-    return output
+    def subtract_chunk(chunk):
+        chunk.science(data)[...] -= chunk.rows_of(bias_data)
+
+    return chunks.ChunkKernel(subtract_chunk)
 
 
 def ref_matches_sci(ref_model, sci_model):
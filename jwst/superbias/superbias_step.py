@@ -15,32 +15,35 @@ class SuperBiasStep(Step):
 
     reference_file_types = ['superbias']
 
+    chunkable = True
+
     def process(self, input):
 
-        # Open the input data model
-        with datamodels.open(input) as input_model:
+        return self.run_chunks(input)
+
+    def prepare_chunks(self, input_model):
 
-            # Get the name of the superbias reference file to use
-            self.bias_name = self.get_reference_file(input_model, 'superbias')
-            self.log.info('Using SUPERBIAS reference file %s', self.bias_name)
+        # Get the name of the superbias reference file to use
+        self.bias_name = self.get_reference_file(input_model, 'superbias')
+        self.log.info('Using SUPERBIAS reference file %s', self.bias_name)
 
-            # Check for a valid reference file
-            if self.bias_name == 'N/A':
-                self.log.warning('No SUPERBIAS reference file found')
-                self.log.warning('Superbias step will be skipped')
-                result = input_model.copy()
-                result.meta.cal_step.superbias = 'SKIPPED'
-                return result
+        # Check for a valid reference file
+        if self.bias_name == 'N/A':
+            self.log.warning('No SUPERBIAS reference file found')
+            self.log.warning('Superbias step will be skipped')
+            input_model.meta.cal_step.superbias = 'SKIPPED'
+            return None
 
-            # Open the superbias ref file data model
-            bias_model = datamodels.SuperBiasModel(self.bias_name)
+        # Open the superbias ref file data model
+        bias_model = self.open_reference_model(
+            self.bias_name, datamodels.SuperBiasModel)
 
-            # Do the bias subtraction
-            result = bias_sub.do_correction(input_model, bias_model)
+        # Get the bias subtraction
+        kernel = bias_sub.prepare_correction(input_model, bias_model)
 
-            # Close the superbias reference file model and
-            # set the step status to complete
-            bias_model.close()
-            result.meta.cal_step.superbias = 'COMPLETE'
+        # Close the superbias reference file model and
+        # set the step status to complete
+        bias_model.close()
+        input_model.meta.cal_step.superbias = 'COMPLETE'
 
-        return result
+        return kernel